@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+#
+# Copyright © 2024 Charles E. Vejnar
+#
+# This is free software, licensed under the GNU General Public License v3.
+# See /LICENSE for more information.
+#
+
+"""Compare the *ΔG open* computed by local folding (plfold) with the exact two-fold method on test transcripts."""
+
+import argparse
+import pathlib
+import statistics
+import sys
+import time
+
+import mirmap.thermo
+import mirmap.utils
+from mirmap.interval import Interval
+from mirmap.target import Target
+
+
+def main(argv=None):
+    """Main."""
+    # Parameters
+    if argv is None:
+        argv = sys.argv
+    parser = argparse.ArgumentParser(description="Compare ΔG open methods.")
+    parser.add_argument(
+        "-d",
+        "--data",
+        dest="path_data",
+        action="store",
+        default=pathlib.Path(__file__).parent.parent.joinpath("tests", "data"),
+        help="Path to test data",
+    )
+    parser.add_argument("-s", "--step", dest="step", action="store", type=int, default=97, help="Site spacing")
+    parser.add_argument(
+        "-w", "--window-sizes", dest="window_sizes", action="store", default="80,150,200,300", help="Window sizes"
+    )
+    args = parser.parse_args(argv[1:])
+
+    # Transcripts
+    transcripts = {}
+    for fname in ("NM_024573.fa", "ENST00000597389.fa", "ENST00000355526.fa"):
+        transcripts |= mirmap.utils.load_fasta(pathlib.Path(args.path_data).joinpath(fname))
+    # Sites of a 22-nt miRNA with a 7-nt seed spaced along transcripts
+    mirna_length = 22
+    targets = []
+    for transcript_seq in transcripts.values():
+        for start in range(0, len(transcript_seq) - mirna_length, args.step):
+            targets.append(
+                Target(
+                    transcript_seq,
+                    Interval(start, start + mirna_length),
+                    "A" * mirna_length,
+                    Interval(start + mirna_length - 8, start + mirna_length - 1),
+                    "A" * 7,
+                    1,
+                )
+            )
+
+    # Exact
+    md = mirmap.thermo._get_default_md()
+    t = time.perf_counter()
+    exacts = [mirmap.thermo.calc_dg_open(target, md=md)["dg_open"] for target in targets]
+    time_exact = time.perf_counter() - t
+
+    # Report
+    print(f"{len(targets)} sites on {len(transcripts)} transcripts ({sum(map(len, transcripts.values()))} nt)")
+    print(f"exact: {time_exact:.2f}s")
+    print("window\tspan\tpearson_r\tmean_diff\tmean_abs_diff\tmax_abs_diff\ttime_s")
+    for window_size in map(int, args.window_sizes.split(",")):
+        max_bp_span = window_size * 3 // 4
+        t = time.perf_counter()
+        cache = mirmap.utils.LRUCache(16)
+        plfolds = [
+            mirmap.thermo.calc_dg_open_plfold(
+                target, window_size=window_size, max_bp_span=max_bp_span, md=md, cache=cache
+            )["dg_open"]
+            for target in targets
+        ]
+        time_plfold = time.perf_counter() - t
+        diffs = [p - e for p, e in zip(plfolds, exacts, strict=True)]
+        print(
+            f"{window_size}\t{max_bp_span}\t{statistics.correlation(exacts, plfolds):.4f}\t"
+            f"{statistics.mean(diffs):.3f}\t{statistics.mean(map(abs, diffs)):.3f}\t{max(map(abs, diffs)):.3f}\t"
+            f"{time_plfold:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+#
+# Copyright © 2024 Charles E. Vejnar
+#
+# This is free software, licensed under the GNU General Public License v3.
+# See /LICENSE for more information.
+#
+
+"""Compare the pipe and temporary file transports of the inputs of PHAST programs on the test alignment."""
+
+import argparse
+import pathlib
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import mirmap.if_exe_phast
+
+
+def main(argv=None):
+    """Main."""
+    # Parameters
+    if argv is None:
+        argv = sys.argv
+    path_root = pathlib.Path(__file__).parent.parent
+    parser = argparse.ArgumentParser(description="Compare PHAST input transports.")
+    parser.add_argument(
+        "-d",
+        "--data",
+        dest="path_data",
+        action="store",
+        default=path_root.joinpath("tests", "data"),
+        help="Path to test data",
+    )
+    parser.add_argument(
+        "-b",
+        "--bin",
+        dest="path_bin",
+        action="store",
+        default=path_root.joinpath("bin", f"{platform.system().lower()}_{platform.machine()}"),
+        help="Path to PHAST executables",
+    )
+    parser.add_argument(
+        "-t", "--tmp", dest="path_tmp", action="store", help="Directory of temporary files (e.g. on network storage)"
+    )
+    parser.add_argument("-n", "--runs", dest="runs", action="store", type=int, default=200, help="Number of runs")
+    args = parser.parse_args(argv[1:])
+
+    if args.path_tmp is not None:
+        tempfile.tempdir = args.path_tmp
+    mod_fname = pathlib.Path(args.path_data).joinpath("NM_024573.mod")
+    aln = pathlib.Path(args.path_data).joinpath("NM_024573_ts1.fa").read_text()
+    features = [("hg19", 1, 7)] * 10
+    path_phylop = pathlib.Path(args.path_bin).joinpath("phyloP")
+
+    programs = {
+        "phylop": (mirmap.if_exe_phast.phylop, ("SPH", "CONACC", mod_fname)),
+        "phylop_features": (mirmap.if_exe_phast.phylop_features, ("SPH", "CON", mod_fname, features)),
+    }
+
+    # Report (transports alternated between runs)
+    times = {(transport, name): [] for transport in ("file", "pipe") for name in programs}
+    for _ in range(args.runs):
+        for transport, name in times:
+            fn, fn_args = programs[name]
+            t = time.perf_counter()
+            fn(*fn_args, aln=aln, path_exe=path_phylop, transport=transport)
+            times[(transport, name)].append(time.perf_counter() - t)
+    print("transport\tprogram\tmedian_ms\tmean_ms")
+    for (transport, name), ts in times.items():
+        print(f"{transport}\t{name}\t{statistics.median(ts) * 1000:.2f}\t{statistics.mean(ts) * 1000:.2f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+#
+# Copyright © 2024 Charles E. Vejnar
+#
+# This is free software, licensed under the GNU General Public License v3.
+# See /LICENSE for more information.
+#
+
+"""Compare the binomial survival function with 1 - CDF over a grid of (x, n, p) for speed and accuracy."""
+
+import argparse
+import itertools
+import math
+import sys
+import time
+
+import mirmap.prob_binomial
+
+
+def _reference_sf(x, n, p):
+    """Binomial survival function summing the smaller tail with all terms and exact rounding."""
+
+    def pmf(k):
+        return math.exp(
+            math.lgamma(n + 1)
+            - math.lgamma(k + 1)
+            - math.lgamma(n - k + 1)
+            + k * math.log(p)
+            + (n - k) * math.log1p(-p)
+        )
+
+    upper = math.fsum(pmf(k) for k in range(x + 1, n + 1))
+    if upper < 0.5:
+        return upper
+    return 1.0 - math.fsum(pmf(k) for k in range(x + 1))
+
+
+def main(argv=None):
+    """Main."""
+    # Parameters
+    if argv is None:
+        argv = sys.argv
+    parser = argparse.ArgumentParser(description="Compare binomial tail methods.")
+    parser.add_argument("-x", "--xs", dest="xs", action="store", default="0,1,2,3,5,10,20", help="Successes")
+    parser.add_argument("-n", "--ns", dest="ns", action="store", default="100,1000,5000", help="Trials")
+    parser.add_argument(
+        "-p", "--ps", dest="ps", action="store", default="1e-6,1e-5,1e-4,1e-3,1e-2", help="Probabilities"
+    )
+    parser.add_argument("-r", "--runs", dest="runs", action="store", type=int, default=20, help="Number of runs")
+    args = parser.parse_args(argv[1:])
+
+    grid = list(
+        itertools.product(map(int, args.xs.split(",")), map(int, args.ns.split(",")), map(float, args.ps.split(",")))
+    )
+    references = [_reference_sf(*params) for params in grid]
+    methods = {
+        "1-cdf": lambda: [1.0 - mirmap.prob_binomial.binomial_cdf(*params) for params in grid],
+        "sf": lambda: [mirmap.prob_binomial.binomial_sf(*params) for params in grid],
+        "sf_array": lambda: mirmap.prob_binomial.binomial_sf_array(*zip(*grid, strict=True)).tolist(),
+    }
+
+    # Report
+    print(f"{len(grid)} (x, n, p)")
+    print("method\ttime_us_per_value\tmax_rel_error\tmax_rel_error_p<1e-6")
+    for name, fn in methods.items():
+        t = time.perf_counter()
+        for _ in range(args.runs):
+            values = fn()
+        time_value = (time.perf_counter() - t) / args.runs / len(grid) * 1e6
+        errors = [abs(v - r) / r for v, r in zip(values, references, strict=True) if r > 0]
+        small_errors = [abs(v - r) / r for v, r in zip(values, references, strict=True) if 0 < r < 1e-6]
+        print(f"{name}\t{time_value:.2f}\t{max(errors):.2e}\t{max(small_errors, default=0.0):.2e}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
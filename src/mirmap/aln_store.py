@@ -0,0 +1,250 @@
+#
+# Copyright © 2024 Charles E. Vejnar
+#
+# This is free software, licensed under the GNU General Public License v3.
+# See /LICENSE for more information.
+#
+
+"""Packed store of the multi-species alignments of all transcripts in one file."""
+
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from . import utils
+
+
+STORE_MAGIC = b"MIRMAPAS"
+STORE_VERSION = 1
+
+_header = struct.Struct("<8sII")
+_section = struct.Struct("<QQ")
+_record = struct.Struct("<IIQ")
+
+
+def iter_fasta_dir(path_aln, suffix=".fa"):
+    """Iterate over the per-transcript FASTA alignments of a directory.
+
+    Args:
+        path_aln: Path to directory of `<transcript_id>.fa` alignments
+        suffix: Alignment filename suffix
+
+    Yields:
+        Transcript ID and dictionary of aligned sequences
+    """
+    for fname in sorted(os.listdir(path_aln)):
+        if fname.endswith(suffix):
+            yield fname[: -len(suffix)], utils.load_fasta(os.path.join(path_aln, fname), upper=True)
+
+
+def iter_maf(maf_fname):
+    """Iterate over the transcript alignments of a MAF file with transcripts as reference.
+
+    The first sequence of each block is the reference named `<species>.<transcript_id>` (forward strand). Blocks
+    of a transcript, expected consecutive in the file, are concatenated in reference order (overlapping blocks
+    raise ValueError). Reference positions outside blocks are filled with N and absent species with gaps.
+
+    Args:
+        maf_fname: MAF filename
+
+    Yields:
+        Transcript ID and dictionary of aligned sequences (reference first)
+    """
+
+    def build(blocks):
+        ref_species, transcript_id, src_size = blocks[0][0]
+        species = [ref_species]
+        for _, block_seqs in blocks:
+            for name in block_seqs:
+                if name not in species:
+                    species.append(name)
+        seqs = {name: [] for name in species}
+        end = 0
+        for (_, _, _, start, size), block_seqs in sorted(blocks[1:], key=lambda b: b[0][3]):
+            if start < end:
+                raise ValueError(f"Overlapping blocks of {transcript_id} at reference position {start}")
+            if start > end:
+                for name in species:
+                    seqs[name].append(("N" if name == ref_species else "-") * (start - end))
+            ncol = len(block_seqs[ref_species])
+            for name in species:
+                seqs[name].append(block_seqs.get(name, "-" * ncol))
+            end = start + size
+        if src_size > end:
+            for name in species:
+                seqs[name].append(("N" if name == ref_species else "-") * (src_size - end))
+        return transcript_id, {name: "".join(seq).upper() for name, seq in seqs.items()}
+
+    blocks = None
+    block = None
+    with utils.open_text(maf_fname) as f:
+        for line in f:
+            if line.startswith("a"):
+                block = None
+            elif line.startswith("s"):
+                _, src, start, size, strand, src_size, text = line.split()
+                species, _, seq_name = src.partition(".")
+                if block is None:
+                    # Reference of new block
+                    if strand != "+":
+                        raise ValueError(f"Reference {src} on reverse strand")
+                    if blocks is not None and blocks[0][0][1] != seq_name:
+                        yield build(blocks)
+                        blocks = None
+                    if blocks is None:
+                        blocks = [((species, seq_name, int(src_size)), {})]
+                    block = {}
+                    blocks.append(((species, seq_name, int(src_size), int(start), int(size)), block))
+                block[species] = text
+    if blocks is not None:
+        yield build(blocks)
+
+
+def _write_section(f, data):
+    """Write data aligned on 8 bytes and return its section coordinates."""
+    f.write(b"\0" * (-f.tell() % 8))
+    offset = f.tell()
+    f.write(data)
+    return offset, len(data)
+
+
+def build_aln_store(store_fname, alns):
+    """Build packed alignment store.
+
+    Each record stores the species names and the aligned sequences row-major (one row per species).
+
+    Args:
+        store_fname: Store filename
+        alns: Dictionary or iterable of (transcript ID, dictionary of aligned sequences with reference first)
+    """
+    if isinstance(alns, dict):
+        alns = alns.items()
+    names = []
+    record_offsets = []
+    with open(store_fname, "wb") as f:
+        # Header with placeholder sections
+        f.write(_header.pack(STORE_MAGIC, STORE_VERSION, 0))
+        sections_offset = f.tell()
+        f.write(b"\0" * _section.size * 2)
+        # Records
+        for transcript_id, seqs in alns:
+            ncol = len(next(iter(seqs.values())))
+            if any(len(seq) != ncol for seq in seqs.values()):
+                raise ValueError(f"Sequences of different lengths in alignment {transcript_id}")
+            species = "\n".join(seqs.keys()).encode("utf-8")
+            f.write(b"\0" * (-f.tell() % 8))
+            record_offsets.append(f.tell())
+            f.write(_record.pack(len(seqs), len(species), ncol))
+            f.write(species)
+            for seq in seqs.values():
+                f.write(seq.upper().encode("ascii"))
+            names.append(transcript_id)
+        # Index
+        sections = [
+            _write_section(f, "\n".join(names).encode("utf-8")),
+            _write_section(f, np.array(record_offsets, dtype="<u8").tobytes()),
+        ]
+        f.seek(0)
+        f.write(_header.pack(STORE_MAGIC, STORE_VERSION, len(names)))
+        f.seek(sections_offset)
+        for section in sections:
+            f.write(_section.pack(*section))
+
+
+def is_aln_store(fname):
+    """Return True if file is an alignment store."""
+    if not os.path.isfile(fname):
+        return False
+    with open(fname, "rb") as f:
+        return f.read(len(STORE_MAGIC)) == STORE_MAGIC
+
+
+class AlnStore:
+    """Memory-mapped packed alignment store."""
+
+    def __init__(self, store_fname):
+        """Open store."""
+        self._file = open(store_fname, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, nrecord = _header.unpack_from(self._mmap, 0)
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            raise ValueError(f"{store_fname} isn't an alignment store (version {STORE_VERSION})")
+        sections = [_section.unpack_from(self._mmap, _header.size + i * _section.size) for i in range(2)]
+        names = self._mmap[sections[0][0] : sections[0][0] + sections[0][1]].decode("utf-8")
+        self.transcript_ids = names.split("\n") if nrecord > 0 else []
+        offsets = np.frombuffer(self._mmap, dtype="<u8", count=nrecord, offset=sections[1][0])
+        self._record_offsets = dict(zip(self.transcript_ids, offsets.tolist(), strict=True))
+
+    def __len__(self):
+        """Number of alignments."""
+        return len(self.transcript_ids)
+
+    def __contains__(self, transcript_id):
+        """Test if store includes the alignment of transcript."""
+        return transcript_id in self._record_offsets
+
+    def __enter__(self):
+        """Enter context."""
+        return self
+
+    def __exit__(self, *args):
+        """Close store when exiting context."""
+        self.close()
+
+    def close(self):
+        """Close store (the mapping is kept until the matrices returned by `get_matrix` are released)."""
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+    def _get_record(self, transcript_id):
+        offset = self._record_offsets[transcript_id]
+        nspecies, species_length, ncol = _record.unpack_from(self._mmap, offset)
+        species_offset = offset + _record.size
+        species = self._mmap[species_offset : species_offset + species_length].decode("utf-8").split("\n")
+        return species, ncol, species_offset + species_length
+
+    def get_species(self, transcript_id):
+        """Return aligned species (reference first)."""
+        return self._get_record(transcript_id)[0]
+
+    def get_matrix(self, transcript_id):
+        """Return alignment as a read-only byte matrix (one row per species) without copy."""
+        species, ncol, data_offset = self._get_record(transcript_id)
+        return np.frombuffer(self._mmap, dtype=np.uint8, count=len(species) * ncol, offset=data_offset).reshape(
+            len(species), ncol
+        )
+
+    def get_seqs(self, transcript_id, start=None, end=None):
+        """Return aligned sequences or their columns from start to end.
+
+        Args:
+            transcript_id: Transcript ID
+            start: Start column (0-based)
+            end: End column (excluded)
+        """
+        species, ncol, data_offset = self._get_record(transcript_id)
+        start, end, _ = slice(start, end).indices(ncol)
+        seqs = {}
+        for i, name in enumerate(species):
+            row_offset = data_offset + i * ncol
+            seqs[name] = self._mmap[row_offset + start : row_offset + max(start, end)].decode("ascii")
+        return seqs
+
+    def get_seq(self, transcript_id, species_idx, start=None, end=None):
+        """Return aligned sequence of one species or its columns from start to end.
+
+        Args:
+            transcript_id: Transcript ID
+            species_idx: Index of species (0 for reference)
+            start: Start column (0-based)
+            end: End column (excluded)
+        """
+        species, ncol, data_offset = self._get_record(transcript_id)
+        start, end, _ = slice(start, end).indices(ncol)
+        row_offset = data_offset + species_idx * ncol
+        return self._mmap[row_offset + start : row_offset + max(start, end)].decode("ascii")
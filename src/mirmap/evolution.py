@@ -7,12 +7,22 @@
 
 """Evolutionary features."""
 
+import asyncio
 import copy
+import hashlib
+import os
+import tempfile
 from dataclasses import dataclass
 
 import dendropy
+import numpy as np
 
-from . import if_exe_phast, utils
+from . import if_exe_phast, phylo, utils
+
+
+# Gap and nucleotide codes in alignment byte matrix
+_gap = ord("-")
+_acgt = np.frombuffer(b"ACGT", dtype=np.uint8)
 
 
 @dataclass(frozen=True)
@@ -61,17 +71,46 @@ def remove_gap_column(aln):
     return clean_aln
 
 
-def get_target_alns(target, aln_fname=None, aln=None, aln_alphabet=("A", "C", "G", "T", "N")):
-    """Extract target alignments from alignment."""
-    assert aln_fname is not None or aln is not None, "Input alignment is required"
+def get_target_alns(
+    target,
+    aln_fname=None,
+    aln=None,
+    aln_alphabet=("A", "C", "G", "T", "N"),
+    aln_fasta=None,
+    aln_store=None,
+    aln_id=None,
+):
+    """Extract target alignments from alignment.
+
+    Args:
+        target: Target
+        aln_fname: Alignment filename
+        aln: Alignment
+        aln_alphabet: List of nucleotides to consider in the aligned sequences (others get filtered)
+        aln_fasta: Alignment as IndexedFasta object (only the target columns of non-reference sequences are read)
+        aln_store: AlnStore including the alignment (only the target columns of non-reference sequences are read)
+        aln_id: ID of the alignment in aln_store
+    """
+    assert aln_fname is not None or aln is not None or aln_fasta is not None or aln_store is not None, (
+        "Input alignment is required"
+    )
     # Load alignment and remove gaps
-    if aln_fname is not None:
+    if aln_store is not None:
+        seqs = aln_store.get_species(aln_id)
+    elif aln_fasta is not None:
+        seqs = aln_fasta.keys()
+    elif aln_fname is not None:
         seqs = utils.load_fasta(aln_fname, as_string=False, upper=True)
     else:
         seqs = utils.load_fasta(aln, as_string=True, upper=True)
     # First sequence is reference
-    ref_species = list(seqs.keys())[0]
-    ref_seq_coords = get_coord_vec(seqs[ref_species], aln_alphabet)
+    ref_species = next(iter(seqs))
+    if aln_store is not None:
+        ref_seq_coords = get_coord_vec(aln_store.get_seq(aln_id, 0), aln_alphabet)
+    elif aln_fasta is not None:
+        ref_seq_coords = get_coord_vec(aln_fasta.fetch(ref_species, upper=True), aln_alphabet)
+    else:
+        ref_seq_coords = get_coord_vec(seqs[ref_species], aln_alphabet)
     # Target seed binding sequence
     target_seed_seq = target.host_seq[target.seed.start : target.seed.end]
     # Extract alignment
@@ -79,8 +118,13 @@ def get_target_alns(target, aln_fname=None, aln=None, aln_alphabet=("A", "C", "G
     end_seed_in_aln = ref_seq_coords[target.seed.end]
     partial_seqs = {}
     with_motifs = set()
-    for seq_name, seq in seqs.items():
-        aln_seq = seq[start_seed_in_aln:end_seed_in_aln]
+    for iseq, seq_name in enumerate(seqs):
+        if aln_store is not None:
+            aln_seq = aln_store.get_seq(aln_id, iseq, start_seed_in_aln, end_seed_in_aln)
+        elif aln_fasta is not None:
+            aln_seq = aln_fasta.fetch(seq_name, start_seed_in_aln, end_seed_in_aln, upper=True)
+        else:
+            aln_seq = seqs[seq_name][start_seed_in_aln:end_seed_in_aln]
         if len(aln_seq) != aln_seq.count("-"):
             partial_seqs[seq_name] = aln_seq
             if target_seed_seq == utils.clean_seq(aln_seq, ["A", "C", "G", "T"], ""):
@@ -88,6 +132,407 @@ def get_target_alns(target, aln_fname=None, aln=None, aln_alphabet=("A", "C", "G
     return TargetAln(ref_species, remove_gap_column(partial_seqs), with_motifs)
 
 
+class AlignmentIndex:
+    """Multi-species alignment loaded once to extract the alignments of many targets.
+
+    Sequences are stored as rows of a NumPy byte matrix with the map of reference positions to alignment columns.
+
+    Args:
+        seqs: Dictionary of aligned sequences or list of species (first sequence is the reference)
+        aln_alphabet: List of nucleotides to consider in the aligned sequences (others get filtered)
+        aln: Alignment as a byte matrix with one row per species (uppercase, built from seqs if None)
+    """
+
+    def __init__(self, seqs, aln_alphabet=("A", "C", "G", "T", "N"), aln=None):
+        """Create new index."""
+        self.species = list(seqs)
+        self.ref_species = self.species[0]
+        if aln is None:
+            aln = np.array(
+                [np.frombuffer(seq.upper().encode("ascii"), dtype=np.uint8) for seq in seqs.values()], dtype=np.uint8
+            )
+        self.aln = aln
+        self._fasta = None
+        self._hash = None
+        self.ref_coords = np.flatnonzero(
+            np.isin(self.aln[0], np.frombuffer("".join(aln_alphabet).encode("ascii"), dtype=np.uint8))
+        )
+
+    @classmethod
+    def from_fasta(cls, aln_fname=None, aln=None, aln_alphabet=("A", "C", "G", "T", "N")):
+        """Load alignment from FASTA file or string."""
+        assert aln_fname is not None or aln is not None, "Input alignment is required"
+        if aln_fname is not None:
+            seqs = utils.load_fasta(aln_fname, as_string=False, upper=True)
+        else:
+            seqs = utils.load_fasta(aln, as_string=True, upper=True)
+        return cls(seqs, aln_alphabet=aln_alphabet)
+
+    @classmethod
+    def from_store(cls, aln_store, aln_id, aln_alphabet=("A", "C", "G", "T", "N")):
+        """Load alignment from AlnStore (sequences are mapped without copy)."""
+        return cls(aln_store.get_species(aln_id), aln_alphabet=aln_alphabet, aln=aln_store.get_matrix(aln_id))
+
+    def to_fasta(self):
+        """Return alignment in the FASTA format."""
+        if self._fasta is None:
+            self._fasta = "".join(
+                f">{name}\n{row.tobytes().decode('ascii')}\n" for name, row in zip(self.species, self.aln, strict=True)
+            )
+        return self._fasta
+
+    def get_hash(self):
+        """Return hash of alignment in the FASTA format (identical to `PhyloFitCache.get_aln_hash` of `to_fasta`)."""
+        if self._hash is None:
+            self._hash = hashlib.sha256(self.to_fasta().encode("utf-8")).hexdigest()
+        return self._hash
+
+    def get_target_alns(self, target):
+        """Extract target alignments (identical to `get_target_alns`)."""
+        # Target seed binding sequence
+        target_seed_seq = np.frombuffer(
+            target.host_seq[target.seed.start : target.seed.end].encode("ascii"), dtype=np.uint8
+        )
+        # Extract alignment of sequences with nucleotide(s)
+        block = self.aln[:, self.ref_coords[target.seed.start] : self.ref_coords[target.seed.end]]
+        gaps = block == _gap
+        present = np.flatnonzero(~gaps.all(axis=1))
+        block = block[present]
+        # Motif presence: sequences made of the seed once non-ACGT characters are removed
+        acgt = np.isin(block, _acgt)
+        candidates = np.flatnonzero(acgt.sum(axis=1) == len(target_seed_seq))
+        with_motifs = candidates[
+            (block[candidates][acgt[candidates]].reshape(len(candidates), len(target_seed_seq)) == target_seed_seq).all(
+                axis=1
+            )
+        ]
+        # Remove only-gap columns
+        block = block[:, ~gaps[present].all(axis=0)]
+        return TargetAln(
+            self.ref_species,
+            {self.species[i]: row.tobytes().decode("ascii") for i, row in zip(present, block, strict=True)},
+            {self.species[present[i]] for i in with_motifs},
+        )
+
+
+def fit_tree(tree, aln_fname=None, aln=None, subst_model="REV", use_em=True, path_phyfit="phyloFit", backend="phast"):
+    """Fit tree model on alignment.
+
+    Args:
+        tree: Tree in the Newick format
+        aln_fname: Alignment filename
+        aln: Alignment
+        subst_model: PhyloFit substitution model (e.g. REV)
+        use_em: Fitting or not the tree with Expectation-Maximization algorithm (phyloFit only)
+        path_phyfit: Path to phyloFit executable
+        backend: Fitting with phyloFit (phast) or in-process (numpy)
+
+    Returns:
+        Model as parsed by `if_exe_phast.parse_mod`
+    """
+    if backend == "phast":
+        return if_exe_phast.phylofit(
+            subst_model=subst_model, aln_fname=aln_fname, aln=aln, tree=tree, use_em=use_em, path_exe=path_phyfit
+        )
+    elif backend == "numpy":
+        if aln_fname is not None:
+            seqs = utils.load_fasta(aln_fname, as_string=False, upper=True)
+        else:
+            seqs = utils.load_fasta(aln, as_string=True, upper=True)
+        return if_exe_phast.parse_mod(phylo.fit_tree_model(tree, seqs, subst_model=subst_model).to_mod())
+    else:
+        raise ValueError(f"Unknown phylogenetic backend {backend}")
+
+
+async def fit_tree_async(
+    tree,
+    aln_fname=None,
+    aln=None,
+    subst_model="REV",
+    use_em=True,
+    path_phyfit="phyloFit",
+    backend="phast",
+    semaphore=None,
+):
+    """Fit tree model on alignment without blocking the event loop (in-process fitting is run in a thread).
+
+    Args:
+        tree: Tree in the Newick format
+        aln_fname: Alignment filename
+        aln: Alignment
+        subst_model: PhyloFit substitution model (e.g. REV)
+        use_em: Fitting or not the tree with Expectation-Maximization algorithm (phyloFit only)
+        path_phyfit: Path to phyloFit executable
+        backend: Fitting with phyloFit (phast) or in-process (numpy)
+        semaphore: asyncio.Semaphore limiting the number of concurrent PHAST programs (unlimited if None)
+    """
+    if backend == "phast":
+        return await if_exe_phast.phylofit_async(
+            subst_model=subst_model,
+            aln_fname=aln_fname,
+            aln=aln,
+            tree=tree,
+            use_em=use_em,
+            path_exe=path_phyfit,
+            semaphore=semaphore,
+        )
+    else:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, fit_tree, tree, aln_fname, aln, subst_model, use_em, path_phyfit, backend
+        )
+
+
+class PhyloFitCache:
+    """Cache of phyloFit models with an in-memory LRU tier and an optional on-disk tier of `.mod` files.
+
+    Models are keyed by a hash of the alignment content, input tree, substitution model and EM flag. Model files
+    are written atomically so that the directory can be shared by concurrent processes.
+
+    Args:
+        maxsize: Maximum number of models in memory
+        path_mod: Path to directory of model files (no on-disk tier if None)
+    """
+
+    def __init__(self, maxsize=1024, path_mod=None):
+        """Create new cache."""
+        self.memory = utils.LRUCache(maxsize)
+        self.path_mod = path_mod
+        self._aln_hashes = {}
+        self._pending = {}
+
+    def get_aln_hash(self, aln_fname=None, aln=None):
+        """Return hash of alignment content (memoized by filename, size and modification time)."""
+        if aln_fname is not None:
+            stat = os.stat(aln_fname)
+            file_key = (os.fspath(aln_fname), stat.st_size, stat.st_mtime_ns)
+            aln_hash = self._aln_hashes.get(file_key)
+            if aln_hash is None:
+                with open(aln_fname, "rb") as f:
+                    aln_hash = hashlib.file_digest(f, "sha256").hexdigest()
+                self._aln_hashes[file_key] = aln_hash
+            return aln_hash
+        else:
+            return hashlib.sha256(aln.encode("utf-8")).hexdigest()
+
+    def get_key(self, tree, subst_model, use_em, aln_fname=None, aln=None, backend="phast", aln_hash=None):
+        """Return hash of phyloFit inputs (alignment hashed if aln_hash is None)."""
+        if aln_hash is None:
+            aln_hash = self.get_aln_hash(aln_fname, aln)
+        key = [aln_hash, tree, str(subst_model), str(use_em)]
+        if backend != "phast":
+            key.append(backend)
+        return hashlib.sha256("\n".join(key).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return cached model or None."""
+        result = self.memory.get(key)
+        if result is None:
+            result = self._read(key)
+            if result is not None:
+                self.memory.put(key, result)
+        return result
+
+    def put(self, key, result):
+        """Add model to cache."""
+        self.memory.put(key, result)
+        self._write(key, result)
+
+    def _read(self, key):
+        """Return model of the on-disk tier or None."""
+        if self.path_mod is not None:
+            mod_fname = os.path.join(self.path_mod, f"{key}.mod")
+            if os.path.exists(mod_fname):
+                with open(mod_fname, "rt") as f:
+                    return if_exe_phast.parse_mod(f.read())
+
+    def _write(self, key, result):
+        """Add model to the on-disk tier."""
+        if self.path_mod is not None:
+            os.makedirs(self.path_mod, exist_ok=True)
+            with tempfile.NamedTemporaryFile("wt", dir=self.path_mod, suffix=".tmp", delete=False) as f:
+                f.write(result["mod_raw"])
+            os.replace(f.name, os.path.join(self.path_mod, f"{key}.mod"))
+
+    def fit(
+        self,
+        tree,
+        aln_fname=None,
+        aln=None,
+        subst_model="REV",
+        use_em=True,
+        path_phyfit="phyloFit",
+        backend="phast",
+        aln_hash=None,
+    ):
+        """Return phyloFit model fitted on alignment (fitting only if not cached).
+
+        Args:
+            tree: Tree in the Newick format
+            aln_fname: Alignment filename
+            aln: Alignment
+            subst_model: PhyloFit substitution model (e.g. REV)
+            use_em: Fitting or not the tree with Expectation-Maximization algorithm
+            path_phyfit: Path to phyloFit executable
+            backend: Fitting with phyloFit (phast) or in-process (numpy)
+            aln_hash: Hash of alignment (e.g. from `AlignmentIndex.get_hash`, computed if None)
+        """
+        key = self.get_key(tree, subst_model, use_em, aln_fname, aln, backend, aln_hash)
+        result = self.get(key)
+        if result is None:
+            result = fit_tree(tree, aln_fname, aln, subst_model, use_em, path_phyfit, backend)
+            self.put(key, result)
+        return result
+
+    async def fit_async(
+        self,
+        tree,
+        aln_fname=None,
+        aln=None,
+        subst_model="REV",
+        use_em=True,
+        path_phyfit="phyloFit",
+        backend="phast",
+        semaphore=None,
+        aln_hash=None,
+    ):
+        """Return phyloFit model like `fit` without blocking the event loop.
+
+        Concurrent calls with the same inputs wait for the same fitting. Alignment hashing and model files are read
+        and written in threads.
+
+        Args:
+            tree: Tree in the Newick format
+            aln_fname: Alignment filename
+            aln: Alignment
+            subst_model: PhyloFit substitution model (e.g. REV)
+            use_em: Fitting or not the tree with Expectation-Maximization algorithm
+            path_phyfit: Path to phyloFit executable
+            backend: Fitting with phyloFit (phast) or in-process (numpy)
+            semaphore: asyncio.Semaphore limiting the number of concurrent PHAST programs (unlimited if None)
+            aln_hash: Hash of alignment (e.g. from `AlignmentIndex.get_hash`, computed if None)
+        """
+        if aln_hash is None:
+            aln_hash = await asyncio.get_running_loop().run_in_executor(None, self.get_aln_hash, aln_fname, aln)
+        key = self.get_key(tree, subst_model, use_em, aln_fname, aln, backend, aln_hash)
+        result = self.memory.get(key)
+        if result is None:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = asyncio.ensure_future(
+                    self._read_or_fit(key, tree, aln_fname, aln, subst_model, use_em, path_phyfit, backend, semaphore)
+                )
+                self._pending[key] = pending
+            # Cancelling one caller doesn't cancel the fitting shared with other callers
+            result = await asyncio.shield(pending)
+        return result
+
+    async def _read_or_fit(self, key, *args):
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(None, self._read, key)
+            if result is None:
+                result = await fit_tree_async(*args)
+                await loop.run_in_executor(None, self._write, key, result)
+            self.memory.put(key, result)
+            return result
+        finally:
+            del self._pending[key]
+
+
+# Default phyloFit model cache
+phylofit_cache = PhyloFitCache()
+
+
+class CompiledTree:
+    """Tree compiled to the leaf set of each edge stored as a bitmask (for fast BLS of any set of species).
+
+    Args:
+        tree: Tree in the Newick format
+        maxsize: Maximum number of BLS memoized by set of species
+    """
+
+    def __init__(self, tree, maxsize=4096):
+        """Compile tree."""
+        dtree = dendropy.Tree.get_from_string(tree, schema="newick", preserve_underscores=True)
+        self.species = [leaf.taxon.label for leaf in dtree.leaf_node_iter()]
+        self._species_idxs = {name: i for i, name in enumerate(self.species)}
+        nword = (len(self.species) + 63) // 64
+        masks = []
+        lengths = []
+        node_masks = {}
+        for node in dtree.postorder_node_iter():
+            mask = np.zeros(nword, dtype=np.uint64)
+            if node.is_leaf():
+                idx = self._species_idxs[node.taxon.label]
+                mask[idx // 64] = np.uint64(1) << np.uint64(idx % 64)
+            else:
+                for child in node.child_nodes():
+                    mask |= node_masks.pop(child)
+            node_masks[node] = mask
+            # Edges except the root edge
+            if node is not dtree.seed_node:
+                masks.append(mask)
+                lengths.append(node.edge.length if node.edge.length is not None else 0.0)
+        self.edge_masks = np.array(masks, dtype=np.uint64).reshape(-1, nword)
+        self.edge_lengths = np.array(lengths, dtype=np.float64)
+        self.cache = utils.LRUCache(maxsize)
+
+    def get_mask(self, species):
+        """Return bitmask of species (species absent from the tree are ignored)."""
+        mask = np.zeros(self.edge_masks.shape[1], dtype=np.uint64)
+        for name in species:
+            idx = self._species_idxs.get(name)
+            if idx is not None:
+                mask[idx // 64] |= np.uint64(1) << np.uint64(idx % 64)
+        return mask
+
+    def calc_bls(self, species):
+        """Return the sum of branch lengths of the tree restricted to species.
+
+        An edge belongs to the restricted tree if its leaf set includes some but not all of the species.
+
+        Args:
+            species: Set of species
+        """
+        species = frozenset(species)
+        bls = self.cache.get(species)
+        if bls is None:
+            mask = self.get_mask(species)
+            inside = np.any((self.edge_masks & mask) != 0, axis=1)
+            outside = np.any((mask & ~self.edge_masks) != 0, axis=1)
+            bls = float(self.edge_lengths[inside & outside].sum())
+            self.cache.put(species, bls)
+        return bls
+
+
+# Compiled trees by Newick string
+_compiled_trees = utils.LRUCache(256)
+
+
+def get_compiled_tree(tree):
+    """Return compiled tree (compiled once per Newick string)."""
+    compiled_tree = _compiled_trees.get(tree)
+    if compiled_tree is None:
+        compiled_tree = CompiledTree(tree)
+        _compiled_trees.put(tree, compiled_tree)
+    return compiled_tree
+
+
+def _has_homologs(target_alns):
+    """Return True if the target motif is found in the reference and at least one other species."""
+    return target_alns.ref_species in target_alns.species and len(target_alns.species) > 1
+
+
+def _check_fitting_aln(aln_fname, aln):
+    if aln_fname is None and aln is None:
+        raise ValueError("Missing alignment")
+
+
+def _get_phylop_aln(target_alns):
+    """Return target alignments in the FASTA format."""
+    return "\n".join([f">{seq_name}\n{seq}" for seq_name, seq in target_alns.seqs.items()])
+
+
 def calc_cons_bls(
     tree,
     fitting_tree=True,
@@ -99,6 +544,9 @@ def calc_cons_bls(
     subst_model="REV",
     use_em=True,
     path_phyfit="phyloFit",
+    fit_cache=None,
+    backend="phast",
+    aln_hash=None,
 ):
     """Compute the Branch Length Score (*BLS*).
 
@@ -113,32 +561,91 @@ def calc_cons_bls(
         subst_model: PhyloFit substitution model (e.g. REV)
         use_em: Fitting or not the tree with Expectation-Maximization algorithm
         path_phyfit: Path to phyloFit executable
+        fit_cache: PhyloFitCache of fitted models (phyloFit run for each call if None)
+        backend: Fitting the tree with phyloFit (phast) or in-process (numpy)
+        aln_hash: Hash of alignment keying fit_cache (e.g. from `AlignmentIndex.get_hash`, computed if None)
     """
     # Get alignments
     if target_alns is None:
         target_alns = get_target_alns(target, aln_fname, aln, aln_alphabet)
-    # BLS
-    if target_alns.ref_species in target_alns.species and len(target_alns.species) > 1:
-        # Fitting tree if necessary
-        if fitting_tree:
-            if aln_fname is not None:
-                fitted_tree = if_exe_phast.phylofit(
-                    subst_model=subst_model, aln_fname=aln_fname, tree=tree, use_em=use_em, path_exe=path_phyfit
-                )["tree"]
-            elif aln is not None:
-                fitted_tree = if_exe_phast.phylofit(
-                    subst_model=subst_model, aln=aln, tree=tree, use_em=use_em, path_exe=path_phyfit
-                )["tree"]
-            else:
-                raise ValueError("Missing alignment")
+    if not _has_homologs(target_alns):
+        return 0.0
+    # Fitting tree if necessary
+    if fitting_tree:
+        _check_fitting_aln(aln_fname, aln)
+        if fit_cache is not None:
+            fitted = fit_cache.fit(
+                tree,
+                aln_fname=aln_fname,
+                aln=aln,
+                subst_model=subst_model,
+                use_em=use_em,
+                path_phyfit=path_phyfit,
+                backend=backend,
+                aln_hash=aln_hash,
+            )
         else:
-            fitted_tree = tree
-        # Compute BLS
-        dtree = dendropy.Tree.get_from_string(fitted_tree, schema="newick", preserve_underscores=True)
-        dtree.retain_taxa_with_labels(target_alns.species)
-        return sum([edge.length for edge in dtree.postorder_edge_iter()][:-1])
-    else:
+            fitted = fit_tree(tree, aln_fname, aln, subst_model, use_em, path_phyfit, backend)
+        tree = fitted["tree"]
+    # Compute BLS
+    return get_compiled_tree(tree).calc_bls(target_alns.species)
+
+
+async def calc_cons_bls_async(
+    tree,
+    fitting_tree=True,
+    target_alns=None,
+    target=None,
+    aln_fname=None,
+    aln=None,
+    aln_alphabet=("A", "C", "G", "T", "N"),
+    subst_model="REV",
+    use_em=True,
+    path_phyfit="phyloFit",
+    fit_cache=None,
+    backend="phast",
+    semaphore=None,
+    aln_hash=None,
+):
+    """Compute the Branch Length Score (*BLS*) like `calc_cons_bls` without blocking the event loop.
+
+    Target alignments are extracted from the alignment in a thread.
+
+    Args:
+        tree: Tree in the Newick format
+        fitting_tree: Fitting or not the tree on the alignment
+        target_alns: Target alignments
+        target: Target
+        aln_fname: Alignment filename
+        aln: Alignment
+        aln_alphabet: List of nucleotides to consider in the aligned sequences (others get filtered)
+        subst_model: PhyloFit substitution model (e.g. REV)
+        use_em: Fitting or not the tree with Expectation-Maximization algorithm
+        path_phyfit: Path to phyloFit executable
+        fit_cache: PhyloFitCache of fitted models (phyloFit run for each call if None)
+        backend: Fitting the tree with phyloFit (phast) or in-process (numpy)
+        semaphore: asyncio.Semaphore limiting the number of concurrent PHAST programs (unlimited if None)
+        aln_hash: Hash of alignment keying fit_cache (e.g. from `AlignmentIndex.get_hash`, computed if None)
+    """
+    # Get alignments
+    if target_alns is None:
+        target_alns = await asyncio.get_running_loop().run_in_executor(
+            None, get_target_alns, target, aln_fname, aln, aln_alphabet
+        )
+    if not _has_homologs(target_alns):
         return 0.0
+    # Fitting tree if necessary
+    if fitting_tree:
+        _check_fitting_aln(aln_fname, aln)
+        if fit_cache is not None:
+            fitted = await fit_cache.fit_async(
+                tree, aln_fname, aln, subst_model, use_em, path_phyfit, backend, semaphore=semaphore, aln_hash=aln_hash
+            )
+        else:
+            fitted = await fit_tree_async(tree, aln_fname, aln, subst_model, use_em, path_phyfit, backend, semaphore)
+        tree = fitted["tree"]
+    # Compute BLS
+    return get_compiled_tree(tree).calc_bls(target_alns.species)
 
 
 def calc_selec_phylop(
@@ -151,6 +658,7 @@ def calc_selec_phylop(
     method="SPH",
     mode="CONACC",
     path_phylop="phyloP",
+    backend="phast",
 ):
     """Compute the *PhyloP* score.
 
@@ -164,17 +672,118 @@ def calc_selec_phylop(
         method: Test name performed by PhyloP (e.g. SPH)
         mode: Testing for conservation (CON), acceleration (ACC) or both (CONACC)
         path_phylop: Path to phyloP executable
+        backend: Computing with phyloP (phast) or in-process (numpy, SPH method only)
     """
     # Get alignments
     if target_alns is None:
         target_alns = get_target_alns(target, aln_fname, aln, aln_alphabet)
-    # Run phyloP
-    if target_alns.ref_species in target_alns.species and len(target_alns.species) > 1:
-        # Extract alignment
-        aln = "\n".join([f">{seq_name}\n{seq}" for seq_name, seq in target_alns.seqs.items()])
-        # Compute p-value
-        return if_exe_phast.phylop(
-            method=method, mode=mode, mod_fname=mod_fname, aln=aln, aln_format="FASTA", path_exe=path_phylop
+    if not _has_homologs(target_alns):
+        return 1.0
+    # Compute p-value
+    if backend == "numpy":
+        if method != "SPH":
+            raise ValueError(f"Unsupported phyloP method {method}")
+        return phylo.load_mod(mod_fname).calc_sph(target_alns.seqs).pval_con
+    elif backend != "phast":
+        raise ValueError(f"Unknown phylogenetic backend {backend}")
+    return if_exe_phast.phylop(
+        method=method,
+        mode=mode,
+        mod_fname=mod_fname,
+        aln=_get_phylop_aln(target_alns),
+        aln_format="FASTA",
+        path_exe=path_phylop,
+    )
+
+
+async def calc_selec_phylop_async(
+    mod_fname,
+    target_alns=None,
+    target=None,
+    aln_fname=None,
+    aln=None,
+    aln_alphabet=("A", "C", "G", "T", "N"),
+    method="SPH",
+    mode="CONACC",
+    path_phylop="phyloP",
+    backend="phast",
+    semaphore=None,
+):
+    """Compute the *PhyloP* score like `calc_selec_phylop` without blocking the event loop.
+
+    Target alignments are extracted and the in-process backend is run in a thread.
+
+    Args:
+        mod_fname: Model filename
+        target_alns: Target alignments
+        target: Target
+        aln_fname: Alignment filename
+        aln: Alignment
+        aln_alphabet: List of nucleotides to consider in the aligned sequences (others get filtered)
+        method: Test name performed by PhyloP (e.g. SPH)
+        mode: Testing for conservation (CON), acceleration (ACC) or both (CONACC)
+        path_phylop: Path to phyloP executable
+        backend: Computing with phyloP (phast) or in-process (numpy, SPH method only)
+        semaphore: asyncio.Semaphore limiting the number of concurrent PHAST programs (unlimited if None)
+    """
+    loop = asyncio.get_running_loop()
+    if backend != "phast":
+        return await loop.run_in_executor(
+            None,
+            calc_selec_phylop,
+            mod_fname,
+            target_alns,
+            target,
+            aln_fname,
+            aln,
+            aln_alphabet,
+            method,
+            mode,
+            path_phylop,
+            backend,
         )
-    else:
+    # Get alignments
+    if target_alns is None:
+        target_alns = await loop.run_in_executor(None, get_target_alns, target, aln_fname, aln, aln_alphabet)
+    if not _has_homologs(target_alns):
         return 1.0
+    # Compute p-value
+    return await if_exe_phast.phylop_async(
+        method=method,
+        mode=mode,
+        mod_fname=mod_fname,
+        aln=_get_phylop_aln(target_alns),
+        aln_format="FASTA",
+        path_exe=path_phylop,
+        semaphore=semaphore,
+    )
+
+
+def calc_selec_phylop_batch(mod_fname, targets_alns, method="SPH", path_phylop="phyloP", backend="phast"):
+    """Compute the *PhyloP* scores of many targets at full precision.
+
+    SPH p-values are computed in-process for all targets with the model loaded once and its tree pruned once per set
+    of aligned species (identical to `calc_selec_phylop` with the numpy backend, which matches phyloP). Other methods
+    are run with one phyloP call per target.
+
+    Args:
+        mod_fname: Model filename
+        targets_alns: List of target alignments
+        method: Test name performed by PhyloP (e.g. SPH)
+        path_phylop: Path to phyloP executable
+        backend: Computing methods other than SPH with phyloP (phast) or in-process (numpy, SPH method only)
+
+    Returns:
+        List of p-values in the order of the target alignments
+    """
+    if method != "SPH":
+        return [
+            calc_selec_phylop(
+                mod_fname, target_alns=target_alns, method=method, path_phylop=path_phylop, backend=backend
+            )
+            for target_alns in targets_alns
+        ]
+    model = phylo.load_mod(mod_fname)
+    return [
+        model.calc_sph(target_alns.seqs).pval_con if _has_homologs(target_alns) else 1.0 for target_alns in targets_alns
+    ]
@@ -7,23 +7,157 @@
 
 """Interface classes with the [PHAST](http://compgen.bscb.cornell.edu/phast) executable programs."""
 
+import asyncio
 import contextlib
+import os
 import re
 import subprocess
+import threading
+from dataclasses import dataclass
 
 from .utils import closeable_temp_file
 
 
-def phylofit(
-    subst_model=None,
-    aln_fname=None,
-    aln=None,
-    aln_format="FASTA",
-    tree=None,
-    use_em=None,
-    path_exe="phyloFit",
-):
-    """Run phyloFit."""
+# Inputs passed through pipes (/dev/fd) if available, or written to temporary files
+default_transport = "pipe" if os.path.isdir("/dev/fd") else "file"
+# Executables failing with pipes but not with temporary files
+_pipe_unsupported = set()
+
+
+@dataclass(frozen=True)
+class PhastInput:
+    """Input data passed to a PHAST program as a file."""
+
+    data: str
+    suffix: str
+
+
+def _write_pipe(fd, data):
+    """Write data to pipe and close it (the reader may exit without reading all data)."""
+    try:
+        with open(fd, "wb") as f:
+            f.write(data)
+    except BrokenPipeError:
+        pass
+
+
+@contextlib.contextmanager
+def _pipe_args(cmd):
+    """Yield command arguments with inputs replaced by pipes and the read ends of the pipes."""
+    fds = []
+    threads = []
+    try:
+        args = []
+        for arg in cmd:
+            if isinstance(arg, PhastInput):
+                fd_read, fd_write = os.pipe()
+                fds.append(fd_read)
+                thread = threading.Thread(target=_write_pipe, args=(fd_write, arg.data.encode()), daemon=True)
+                thread.start()
+                threads.append(thread)
+                args.append(f"/dev/fd/{fd_read}")
+            else:
+                args.append(str(arg))
+        yield args, fds
+    finally:
+        # Closing read ends unblocks writers of unread inputs
+        for fd in fds:
+            os.close(fd)
+        for thread in threads:
+            thread.join()
+
+
+@contextlib.contextmanager
+def _file_args(cmd):
+    """Yield command arguments with inputs replaced by temporary files."""
+    with contextlib.ExitStack() as stack:
+        args = []
+        for arg in cmd:
+            if isinstance(arg, PhastInput):
+                ftmp = stack.enter_context(closeable_temp_file(suffix=arg.suffix))
+                ftmp.write(arg.data)
+                ftmp.close()
+                args.append(ftmp.name)
+            else:
+                args.append(str(arg))
+        yield args, ()
+
+
+def _run(cmd, transport):
+    with _pipe_args(cmd) if transport == "pipe" else _file_args(cmd) as (args, fds):
+        return subprocess.run(args, capture_output=True, text=True, check=True, pass_fds=fds)
+
+
+async def _run_async(cmd, transport):
+    with _pipe_args(cmd) if transport == "pipe" else _file_args(cmd) as (args, fds):
+        p = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, pass_fds=fds
+        )
+        stdout, stderr = await p.communicate()
+    stdout, stderr = stdout.decode(), stderr.decode()
+    if p.returncode != 0:
+        raise subprocess.CalledProcessError(p.returncode, args, stdout, stderr)
+    return subprocess.CompletedProcess(args, p.returncode, stdout, stderr)
+
+
+def _get_transport(cmd, transport):
+    if transport is None:
+        transport = default_transport
+    if transport not in ("pipe", "file"):
+        raise ValueError(f"Unknown transport {transport}")
+    if transport == "pipe" and str(cmd[0]) in _pipe_unsupported:
+        transport = "file"
+    return transport
+
+
+def run(cmd, transport=None):
+    """Run PHAST program passing its inputs through pipes or temporary files.
+
+    With pipes, a failed run is repeated with temporary files. If this second run succeeds, temporary files are
+    used for all following runs of the executable.
+
+    Args:
+        cmd: Command as a list of arguments and `PhastInput`
+        transport: Inputs passed through pipes (pipe) or temporary files (file) (`default_transport` if None)
+
+    Returns:
+        Completed process
+    """
+    transport = _get_transport(cmd, transport)
+    if transport == "pipe":
+        try:
+            return _run(cmd, "pipe")
+        except subprocess.CalledProcessError:
+            p = _run(cmd, "file")
+            _pipe_unsupported.add(str(cmd[0]))
+            return p
+    return _run(cmd, transport)
+
+
+async def run_async(cmd, transport=None, semaphore=None):
+    """Run PHAST program like `run` without blocking the event loop.
+
+    Args:
+        cmd: Command as a list of arguments and `PhastInput`
+        transport: Inputs passed through pipes (pipe) or temporary files (file) (`default_transport` if None)
+        semaphore: asyncio.Semaphore limiting the number of concurrent programs (unlimited if None)
+
+    Returns:
+        Completed process
+    """
+    async with semaphore if semaphore is not None else contextlib.nullcontext():
+        transport = _get_transport(cmd, transport)
+        if transport == "pipe":
+            try:
+                return await _run_async(cmd, "pipe")
+            except subprocess.CalledProcessError:
+                p = await _run_async(cmd, "file")
+                _pipe_unsupported.add(str(cmd[0]))
+                return p
+        return await _run_async(cmd, transport)
+
+
+def _phylofit_cmd(subst_model, aln_fname, aln, aln_format, tree, use_em, path_exe):
     assert aln_fname is not None or aln is not None, "Input alignment is required"
     # Cmd
     cmd = [path_exe, "--precision", "HIGH", "--out-root", "-", "--msa-format", aln_format]
@@ -34,35 +168,58 @@ def phylofit(
     if use_em is True:
         cmd.append("--EM")
     # Tree
-    with (
-        closeable_temp_file(suffix=".nh") if tree is not None else contextlib.nullcontext() as ftree,
-        closeable_temp_file(suffix=".fa") if aln is not None else contextlib.nullcontext() as faln,
-    ):
-        if tree is not None:
-            ftree.write(tree)
-            ftree.close()
-            cmd.append("--tree")
-            cmd.append(ftree.name)
-        if aln is not None:
-            faln.write(aln)
-            faln.close()
-            cmd.append(faln.name)
-        else:
-            cmd.append(aln_fname)
-        # Run
-        p = subprocess.run(cmd, capture_output=True, text=True, check=True)
-    # Parsing results
+    if tree is not None:
+        cmd.append("--tree")
+        cmd.append(PhastInput(tree, ".nh"))
+    # MSA
+    cmd.append(PhastInput(aln, ".fa") if aln is not None else aln_fname)
+    return cmd
+
+
+def phylofit(
+    subst_model=None,
+    aln_fname=None,
+    aln=None,
+    aln_format="FASTA",
+    tree=None,
+    use_em=None,
+    path_exe="phyloFit",
+    transport=None,
+):
+    """Run phyloFit."""
+    cmd = _phylofit_cmd(subst_model, aln_fname, aln, aln_format, tree, use_em, path_exe)
+    return parse_mod(run(cmd, transport).stdout)
+
+
+async def phylofit_async(
+    subst_model=None,
+    aln_fname=None,
+    aln=None,
+    aln_format="FASTA",
+    tree=None,
+    use_em=None,
+    path_exe="phyloFit",
+    transport=None,
+    semaphore=None,
+):
+    """Run phyloFit without blocking the event loop (see `phylofit` and `run_async`)."""
+    cmd = _phylofit_cmd(subst_model, aln_fname, aln, aln_format, tree, use_em, path_exe)
+    return parse_mod((await run_async(cmd, transport, semaphore)).stdout)
+
+
+def parse_mod(mod_raw):
+    """Parse phyloFit model."""
     decoded = re.match(
         (
             r"ALPHABET: (?P<alphabet>[^\n]+)\nORDER: (?P<order>\S+)\nSUBST_MOD: (?P<subst_mod>\S+)\n"
             r"TRAINING_LNL: (?P<training_lnl>\S+)\nBACKGROUND: (?P<background>[^\n]+)\nRATE_MAT:\n"
             "(?P<rate_mat>.+)\nTREE: (?P<tree>.+;)"
         ),
-        p.stdout,
+        mod_raw,
         re.DOTALL,
     )
     result = decoded.groupdict()
-    result["mod_raw"] = p.stdout
+    result["mod_raw"] = mod_raw
     result["training_lnl"] = float(result["training_lnl"])
     return result
 
@@ -78,8 +235,33 @@ def phylop(
     branch=None,
     prune=None,
     path_exe="phyloP",
+    transport=None,
 ):
     """Run phyloP."""
+    cmd = _phylop_cmd(method, mode, mod_fname, aln_fname, aln, aln_format, gff_fname, branch, prune, path_exe)
+    return _parse_phylop(run(cmd, transport).stdout)
+
+
+async def phylop_async(
+    method,
+    mode,
+    mod_fname,
+    aln_fname=None,
+    aln=None,
+    aln_format="FASTA",
+    gff_fname=None,
+    branch=None,
+    prune=None,
+    path_exe="phyloP",
+    transport=None,
+    semaphore=None,
+):
+    """Run phyloP without blocking the event loop (see `phylop` and `run_async`)."""
+    cmd = _phylop_cmd(method, mode, mod_fname, aln_fname, aln, aln_format, gff_fname, branch, prune, path_exe)
+    return _parse_phylop((await run_async(cmd, transport, semaphore)).stdout)
+
+
+def _phylop_cmd(method, mode, mod_fname, aln_fname, aln, aln_format, gff_fname, branch, prune, path_exe):
     assert aln_fname is not None or aln is not None, "Input alignment is required"
     # Cmd
     cmd = [str(path_exe), "--method", method, "--mode", mode, "--msa-format", aln_format]
@@ -95,15 +277,80 @@ def phylop(
     # Model
     cmd.append(mod_fname)
     # MSA
-    with closeable_temp_file(suffix=".fa") if aln is not None else contextlib.nullcontext() as faln:
-        if aln is not None:
-            faln.write(aln)
-            faln.close()
-            cmd.append(faln.name)
-        else:
-            cmd.append(aln_fname)
-        # Run
-        p = subprocess.run(cmd, capture_output=True, text=True, check=True)
-    # Parse results
-    decoded = re.search(r"p-value of conservation: (?P<prob>\S+)", p.stdout)
+    cmd.append(PhastInput(aln, ".fa") if aln is not None else aln_fname)
+    return cmd
+
+
+def _parse_phylop(stdout):
+    decoded = re.search(r"p-value of conservation: (?P<prob>\S+)", stdout)
     return float(decoded.groupdict()["prob"])
+
+
+def phylop_features(
+    method,
+    mode,
+    mod_fname,
+    features,
+    aln_fname=None,
+    aln=None,
+    aln_format="FASTA",
+    branch=None,
+    prune=None,
+    path_exe="phyloP",
+    transport=None,
+):
+    """Run phyloP once on features and return the p-value of each feature (reported by phyloP with 5 decimals).
+
+    Args:
+        method: Test name performed by PhyloP (e.g. SPH)
+        mode: Testing for conservation (CON), acceleration (ACC) or both (CONACC)
+        mod_fname: Model filename
+        features: List of (sequence name, start, end) of features (1-based, end included, in the reference frame)
+        aln_fname: Alignment filename
+        aln: Alignment
+        aln_format: Alignment format
+        branch: Branch(es) of interest
+        prune: Pruning or not the tree of the species absent from the alignment
+        path_exe: Path to phyloP executable
+        transport: Inputs passed through pipes (pipe) or temporary files (file) (`default_transport` if None)
+
+    Returns:
+        List of p-values in the order of the features
+    """
+    assert aln_fname is not None or aln is not None, "Input alignment is required"
+    # Cmd
+    cmd = [str(path_exe), "--method", method, "--mode", mode, "--msa-format", aln_format]
+    # Options
+    if branch is not None:
+        cmd.append("--branch")
+        cmd.append(branch)
+    if prune is False:
+        cmd.append("--no-prune")
+    # Features
+    gff = "".join(
+        f"{seq_name}\tmirmap\tfeature\t{start}\t{end}\t.\t+\t.\tid {ifeature}\n"
+        for ifeature, (seq_name, start, end) in enumerate(features)
+    )
+    cmd.append("--features")
+    cmd.append(PhastInput(gff, ".gff"))
+    # Model
+    cmd.append(mod_fname)
+    # MSA
+    cmd.append(PhastInput(aln, ".fa") if aln is not None else aln_fname)
+    # Run
+    p = run(cmd, transport)
+    # Parse results (one line per feature in input order after the header)
+    header = None
+    pvals = []
+    for line in p.stdout.splitlines():
+        if line.startswith("#"):
+            header = line[1:].split()
+        elif len(line.strip()) > 0:
+            fields = line.split()
+            if header is not None and "pval" in header:
+                pvals.append(float(fields[header.index("pval")]))
+            else:
+                pvals.append(float(fields[-1]))
+    if len(pvals) != len(features):
+        raise ValueError(f"phyloP reported {len(pvals)} p-values for {len(features)} features")
+    return pvals
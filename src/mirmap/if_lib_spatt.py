@@ -7,49 +7,142 @@
 
 """Ctypes interface classe with the [Spatt](http://www.mi.parisdescartes.fr/~nuel/spatt) C library."""
 
-from ctypes import POINTER, c_bool, c_char, c_char_p, c_double, c_long, c_short, c_ulong, cast, cdll
+import hashlib
+import threading
+from ctypes import POINTER, c_bool, c_char, c_char_p, c_double, c_long, c_short, c_ulong, cdll
+
+import numpy as np
 
 from . import utils
 
 
 class Spatt:
-    """Interface class for the Spatt library."""
+    """Interface class for the Spatt library.
+
+    The library is loaded once per path and shared by all interfaces. Exact probabilities computed by
+    `get_exact_probs` are cached.
+
+    Args:
+        path_library: Path to the Spatt library
+        cache_size: Maximum number of cached probabilities (unbounded if None, no caching if 0)
+    """
 
-    def __init__(self, path_library="libspatt2.so"):
+    # Libraries by path
+    _libraries = {}
+    _libraries_lock = threading.Lock()
+
+    def __init__(self, path_library="libspatt2.so", cache_size=65536):
         """Create new interface to the Spatt library."""
-        self._library = cdll.LoadLibrary(path_library)
-        # Functions arguments and result types
-        self._library.spatt_exact.argtypes = [
-            c_char_p,
-            c_char_p,
-            POINTER(c_double),
-            c_short,
-            c_bool,
-            c_long,
-            c_ulong,
-            c_char,
-        ]
-        self._library.spatt_exact.restype = c_double
+        with self._libraries_lock:
+            self._library = self._libraries.get(str(path_library))
+            if self._library is None:
+                self._library = cdll.LoadLibrary(str(path_library))
+                # Functions arguments and result types
+                self._library.spatt_exact.argtypes = [
+                    c_char_p,
+                    c_char_p,
+                    POINTER(c_double),
+                    c_short,
+                    c_bool,
+                    c_long,
+                    c_ulong,
+                    c_char,
+                ]
+                self._library.spatt_exact.restype = c_double
+                self._libraries[str(path_library)] = self._library
+        self.cache = utils.LRUCache(cache_size) if cache_size != 0 else None
 
     def transitions_l2c(self, transitions):
         """Take the transition matrix a list with element in C-order."""
-        ctransitions = (c_double * len(transitions))()
-        i = 0
-        for v in transitions:
-            ctransitions[i] = v
-            i += 1
-        return ctransitions
+        return (c_double * len(transitions)).from_buffer_copy(np.asarray(transitions, dtype=np.float64))
 
-    def get_exact_prob(self, motif, nobs, length_seq, alphabet, transitions, markov_order, direction):
-        """Compute exact probability."""
-        ctransitions = self.transitions_l2c(utils.flatten(transitions))
+    @staticmethod
+    def get_transitions_array(transitions):
+        """Return transitions (list of rows or NumPy array) as a flat C-ordered array of float64."""
+        if not isinstance(transitions, np.ndarray):
+            transitions = utils.flatten(transitions)
+        return np.ascontiguousarray(transitions, dtype=np.float64).reshape(-1)
+
+    def _spatt_exact(self, alphabet, motif, transitions, markov_order, nobs, length_seq, direction):
+        # Transitions as flat C-ordered array of float64 (ctypes releases the GIL during the call)
         return self._library.spatt_exact(
-            "".join(alphabet).encode("ascii"),
+            alphabet,
             motif.encode("ascii"),
-            cast(ctransitions, POINTER(c_double)),
+            transitions.ctypes.data_as(POINTER(c_double)),
             markov_order,
             False,
             nobs,
             length_seq,
+            direction,
+        )
+
+    def get_exact_prob(self, motif, nobs, length_seq, alphabet, transitions, markov_order, direction):
+        """Compute exact probability.
+
+        Transitions are a list of rows or a NumPy array passed without copy if flat, C-ordered and of float64.
+        """
+        return self._spatt_exact(
+            "".join(alphabet).encode("ascii"),
+            motif,
+            self.get_transitions_array(transitions),
+            markov_order,
+            int(nobs),
+            length_seq,
             direction.encode("ascii"),
         )
+
+    def get_exact_probs(
+        self, motifs, nobs_list, length_seq, alphabet, transitions, markov_order, direction="o", executor=None
+    ):
+        """Compute exact probabilities of motifs in one sequence.
+
+        Transitions are converted once for all motifs. Probabilities are cached by motif, number of occurrences,
+        sequence length and transitions.
+
+        Args:
+            motifs: List of motifs
+            nobs_list: Number of observed occurrences of each motif
+            length_seq: Sequence length
+            alphabet: List of letters
+            transitions: Transition matrix as a list of rows or a NumPy array
+            markov_order: Markov chain order
+            direction: Probability to observe more (o) or less (u) occurrences
+            executor: concurrent.futures.Executor computing probabilities concurrently (sequentially if None)
+
+        Returns:
+            List of probabilities in the order of motifs
+        """
+        transitions = self.get_transitions_array(transitions)
+        alphabet = "".join(alphabet)
+        params = (length_seq, alphabet, markov_order, direction, hashlib.blake2b(transitions.tobytes()).digest())
+        # Cached probabilities
+        probs = [None] * len(motifs)
+        missings = {}
+        for i, (motif, nobs) in enumerate(zip(motifs, nobs_list, strict=True)):
+            key = (motif, int(nobs)) + params
+            prob = self.cache.get(key) if self.cache is not None else None
+            if prob is None:
+                missings.setdefault(key, []).append(i)
+            else:
+                probs[i] = prob
+
+        # Compute
+        def compute(key):
+            return self._spatt_exact(
+                alphabet.encode("ascii"),
+                key[0],
+                transitions,
+                markov_order,
+                key[1],
+                length_seq,
+                direction.encode("ascii"),
+            )
+
+        keys = list(missings.keys())
+        results = map(compute, keys) if executor is None else executor.map(compute, keys)
+        for key, prob in zip(keys, results, strict=True):
+            if self.cache is not None:
+                self.cache.put(key, prob)
+            for i in missings[key]:
+                probs[i] = prob
+        return probs
@@ -5,10 +5,18 @@
 # See /LICENSE for more information.
 #
 
+import dataclasses
+import hashlib
+import json
+import os
+import sqlite3
 from dataclasses import dataclass
 
+import numpy as np
 from ViennaRNA import RNA
 
+from . import utils
+
 
 @dataclass(frozen=True)
 class RnacofoldResult:
@@ -29,6 +37,43 @@ class RnacofoldPartfuncResult:
     efe_binding: float
 
 
+# Model details attributes changing folding results
+_model_details_key_attrs = (
+    "temperature",
+    "betaScale",
+    "pf_smooth",
+    "dangles",
+    "special_hp",
+    "noLP",
+    "noGU",
+    "noGUclosure",
+    "logML",
+    "circ",
+    "circ_penalty",
+    "gquad",
+    "uniq_ML",
+    "energy_set",
+    "backtrack",
+    "backtrack_type",
+    "nonstandards",
+    "max_bp_span",
+    "min_loop_size",
+    "window_size",
+    "oldAliEn",
+    "ribo",
+    "cv_fact",
+    "nc_fact",
+    "sfact",
+    "salt",
+    "saltMLLower",
+    "saltMLUpper",
+    "saltDPXInit",
+    "saltDPXInitFact",
+    "helical_rise",
+    "backbone_length",
+)
+
+
 def get_model_details(min_loop_size=None, temperature=None):
     """New folding model with user parameters."""
     md = RNA.md()
@@ -39,8 +84,109 @@ def get_model_details(min_loop_size=None, temperature=None):
     return md
 
 
-def RNAfold(seqs, constraint=None, partfunc=False, md=None):
-    """Function RNAfold."""
+def get_model_details_key(md=None):
+    """Hashable key of folding model parameters (energy parameters are assumed to be the library defaults)."""
+    if md is None:
+        md = RNA.md()
+    return tuple(getattr(md, attr) for attr in _model_details_key_attrs)
+
+
+def get_model_details_from_key(md_key):
+    """New folding model from model parameters key."""
+    md = RNA.md()
+    for attr, value in zip(_model_details_key_attrs, md_key, strict=True):
+        setattr(md, attr, value)
+    return md
+
+
+class FoldCache:
+    """Cache of RNAfold results with an in-memory LRU tier and an optional on-disk SQLite tier.
+
+    Entries are keyed by a hash of the sequences, constraint and folding model. The SQLite database can be shared
+    by concurrent processes.
+
+    Args:
+        maxsize: Maximum number of entries in memory
+        path_db: Path to SQLite database (no on-disk tier if None)
+    """
+
+    def __init__(self, maxsize=100000, path_db=None):
+        """Create new cache."""
+        self.memory = utils.LRUCache(maxsize)
+        self.path_db = path_db
+        self._db = None
+        self._db_pid = None
+
+    def __getstate__(self):
+        """Pickle cache without its database connection."""
+        state = self.__dict__.copy()
+        state["_db"] = state["_db_pid"] = None
+        return state
+
+    @staticmethod
+    def get_key(seqs, constraint, partfunc, md):
+        """Return hash of folding inputs."""
+        return hashlib.sha256(
+            json.dumps([seqs, constraint, partfunc, get_model_details_key(md)]).encode("utf-8")
+        ).digest()
+
+    def _connect(self):
+        # New connection in each process
+        if self._db is None or self._db_pid != os.getpid():
+            self._db = sqlite3.connect(self.path_db, timeout=60.0, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS folds (key BLOB PRIMARY KEY, result TEXT NOT NULL)")
+            self._db_pid = os.getpid()
+        return self._db
+
+    def get(self, key):
+        """Return cached result or None."""
+        result = self.memory.get(key)
+        if result is None and self.path_db is not None:
+            row = self._connect().execute("SELECT result FROM folds WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                values = json.loads(row[0])
+                if len(values) == len(dataclasses.fields(RnacofoldResult)):
+                    result = RnacofoldResult(*values)
+                else:
+                    result = RnacofoldPartfuncResult(*values)
+                self.memory.put(key, result)
+        return result
+
+    def put(self, key, result):
+        """Add result to cache."""
+        self.memory.put(key, result)
+        if self.path_db is not None:
+            self._connect().execute(
+                "INSERT OR IGNORE INTO folds (key, result) VALUES (?, ?)",
+                (key, json.dumps(dataclasses.astuple(result))),
+            )
+
+    def close(self):
+        """Close database connection."""
+        if self._db is not None:
+            self._db.close()
+            self._db = self._db_pid = None
+
+
+def RNAfold(seqs, constraint=None, partfunc=False, md=None, cache=None):
+    """Function RNAfold.
+
+    Args:
+        seqs: Sequence(s)
+        constraint: Constraint in dot-bracket notation
+        partfunc: Compute partition function
+        md: Folding model
+        cache: FoldCache object (no caching if None)
+    """
+    # Cache
+    if cache is not None:
+        key = cache.get_key(seqs, constraint, partfunc, md)
+        result = cache.get(key)
+        if result is None:
+            result = RNAfold(seqs, constraint=constraint, partfunc=partfunc, md=md)
+            cache.put(key, result)
+        return result
     # Init
     fc = RNA.fold_compound("&".join(seqs), md)
     # Add constraint
@@ -55,3 +201,34 @@ def RNAfold(seqs, constraint=None, partfunc=False, md=None):
         return RnacofoldPartfuncResult(mfe_structure, mfe, efe_structure, efe, efe_binding)
     else:
         return RnacofoldResult(mfe_structure, mfe)
+
+
+def RNAplfold_unpaired(seq, max_unpaired_length, window_size, max_bp_span, md=None):
+    """Function RNAplfold computing the probabilities of unpaired segments with local folding.
+
+    Args:
+        seq: Sequence
+        max_unpaired_length: Maximum length of unpaired segments
+        window_size: Size of the sliding folding window
+        max_bp_span: Maximum distance between two paired nucleotides
+        md: Folding model (window size and maximum base pair span are overridden)
+
+    Returns:
+        Array with the probability of the segment of length u ending at the (1-based) position i to be unpaired at [i, u]
+    """
+    # Model
+    md_window = get_model_details_from_key(get_model_details_key(md))
+    md_window.window_size = min(window_size, len(seq))
+    md_window.max_bp_span = min(max_bp_span, md_window.window_size)
+    # Init
+    fc = RNA.fold_compound(seq, md_window, RNA.OPTION_WINDOW)
+    unpaired = np.zeros((len(seq) + 1, max_unpaired_length + 1))
+
+    def store_unpaired(v, v_size, i, maxsize, what, data=None):
+        if what & RNA.PROBS_WINDOW_UP:
+            probs = [p or 0.0 for p in v[1 : max_unpaired_length + 1]]
+            unpaired[i, 1 : len(probs) + 1] = probs
+
+    # Partition function
+    fc.probs_window(max_unpaired_length, RNA.PROBS_WINDOW_UP, store_unpaired)
+    return unpaired
@@ -0,0 +1,208 @@
+#
+# Copyright © 2024 Charles E. Vejnar
+#
+# This is free software, licensed under the GNU General Public License v3.
+# See /LICENSE for more information.
+#
+
+"""In-process exact distribution of motif occurrences replacing the [Spatt](http://www.mi.parisdescartes.fr/~nuel/spatt) library.
+
+The number of (overlapping) occurrences of a motif in a random sequence generated by a Markov chain is computed
+exactly by embedding the sequence in the Markov chain of the states of the motif automaton: the last letters read
+(Markov chain context) and the length of the longest motif prefix ending the sequence. The distribution of the
+counts after all the letters is obtained by raising the one-letter transitions to the sequence length by squaring.
+"""
+
+import numpy as np
+
+
+def _get_stationary(transitions, nletter, markov_order):
+    """Return stationary distribution of the Markov chain contexts."""
+    ncontext = nletter**markov_order
+    chain = np.zeros((ncontext, ncontext))
+    for context in range(ncontext):
+        chain[context, (context * nletter) % ncontext + np.arange(nletter)] += transitions[context]
+    # Solve π·(chain - I) = 0 with Σπ = 1
+    system = np.vstack([chain.T - np.eye(ncontext), np.ones(ncontext)])
+    rhs = np.zeros(ncontext + 1)
+    rhs[-1] = 1.0
+    stationary = np.linalg.lstsq(system, rhs, rcond=None)[0]
+    return np.clip(stationary, 0.0, None) / np.clip(stationary, 0.0, None).sum()
+
+
+def _get_prefix_automaton(codes, nletter):
+    """Return the transitions between the lengths of the longest motif prefixes ending the sequence (KMP)."""
+    length = len(codes)
+    delta = np.zeros((length + 1, nletter), dtype=np.intp)
+    delta[0, codes[0]] = 1
+    fail = 0
+    for j in range(1, length + 1):
+        delta[j] = delta[fail]
+        if j < length:
+            delta[j, codes[j]] = j + 1
+            fail = delta[fail, codes[j]]
+    return delta
+
+
+def _get_embedding(codes, nletter, markov_order, transitions, contexts):
+    """Return the initial distribution and the one-letter transitions (without and with a motif occurrence).
+
+    Initial states are the given distribution of contexts with the motif prefixes read in the contexts.
+    """
+    ncontext = nletter**markov_order
+    delta = _get_prefix_automaton(codes, nletter)
+    # Initial states after reading the context letters
+    states = {}
+    init = {}
+    for context in range(ncontext):
+        if contexts[context] > 0:
+            j = 0
+            for i in range(markov_order - 1, -1, -1):
+                j = delta[j, (context // nletter**i) % nletter]
+            state = states.setdefault((context, j), len(states))
+            init[state] = init.get(state, 0.0) + contexts[context]
+    # Reachable states
+    edges = []
+    queue = list(states.keys())
+    while len(queue) > 0:
+        context, j = queue.pop()
+        for letter in range(nletter):
+            prob = transitions[context, letter]
+            if prob > 0:
+                new = ((context * nletter) % ncontext + letter, delta[j, letter])
+                if new not in states:
+                    states[new] = len(states)
+                    queue.append(new)
+                edges.append((states[(context, j)], states[new], prob, new[1] == len(codes)))
+    init_vector = np.zeros(len(states))
+    init_vector[list(init.keys())] = list(init.values())
+    step = np.zeros((2, len(states), len(states)))
+    for src, dst, prob, hit in edges:
+        step[int(hit), src, dst] += prob
+    return init_vector, step
+
+
+def _compose(x, y, ncount):
+    """Compose count distributions of two sequence segments.
+
+    Segments are represented by the probabilities of exactly k occurrences (k < ncount) and of at least j
+    occurrences (j ≤ ncount, j = 0 for all sequences) between states. All terms are positive sums avoiding
+    the cancellation of computing tails as 1 - CDF.
+    """
+    x_exact, x_tail = x
+    y_exact, y_tail = y
+    exact = np.zeros(x_exact.shape[:-1] + y_exact.shape[-1:])
+    tail = x_tail @ y_tail[..., :1, :, :]
+    for i in range(ncount):
+        exact[..., i:, :, :] += x_exact[..., i : i + 1, :, :] @ y_exact[..., : ncount - i, :, :]
+        tail[..., i + 1 :, :, :] += x_exact[..., i : i + 1, :, :] @ y_tail[..., 1 : ncount + 1 - i, :, :]
+    return exact, tail
+
+
+def get_exact_probs(motifs, nobs_list, length_seq, alphabet, transitions, markov_order, direction="o", start="first"):
+    """Compute exact probabilities of the number of occurrences of motifs in one sequence.
+
+    Like Spatt, sequences start by default with the first context of the Markov chain (i.e. the first letter of the
+    alphabet repeated markov_order times).
+
+    Args:
+        motifs: List of motifs
+        nobs_list: Number of observed occurrences of each motif
+        length_seq: Sequence length
+        alphabet: List of letters
+        transitions: Transition matrix as a list of rows or a NumPy array
+        markov_order: Markov chain order
+        direction: Probability to observe at least (o) or at most (u) nobs occurrences
+        start: Sequences starting with the first context (first) or with the stationary distribution of the
+            contexts (stationary)
+
+    Returns:
+        Array of probabilities in the order of motifs
+    """
+    if direction not in ("o", "u"):
+        raise ValueError(f"Unknown direction {direction}")
+    alphabet = list(alphabet)
+    nletter = len(alphabet)
+    letter_indexes = {letter: code for code, letter in enumerate(alphabet)}
+    transitions = np.asarray(transitions, dtype=np.float64).reshape(-1, nletter)
+    if start == "first":
+        contexts = np.zeros(nletter**markov_order)
+        contexts[0] = 1.0
+    elif start == "stationary":
+        contexts = _get_stationary(transitions, nletter, markov_order)
+    else:
+        raise ValueError(f"Unknown start {start}")
+    nobs_list = np.asarray(nobs_list, dtype=np.int64)
+    probs = np.zeros(len(motifs))
+    if len(motifs) == 0:
+        return probs
+    # Motifs embeddings
+    motif_indexes = {}
+    imotifs = [motif_indexes.setdefault(motif, len(motif_indexes)) for motif in motifs]
+    embeddings = []
+    for motif in motif_indexes:
+        if len(motif) <= markov_order:
+            raise ValueError(f"Motif {motif} not longer than Markov chain order")
+        codes = [letter_indexes[letter] for letter in motif]
+        embeddings.append(_get_embedding(codes, nletter, markov_order, transitions, contexts))
+    # Motifs grouped by number of counts and states (cost is quadratic in counts and cubic in states)
+    ncounts = np.zeros(len(embeddings), dtype=np.int64)
+    np.maximum.at(ncounts, imotifs, nobs_list + 1)
+    groups = {}
+    for imotif, (init, _) in enumerate(embeddings):
+        groups.setdefault((int(ncounts[imotif]), len(init)), []).append(imotif)
+    exacts = [None] * len(embeddings)
+    tails = [None] * len(embeddings)
+    for (ncount, _), group in groups.items():
+        exact, tail = _get_count_dists([embeddings[imotif] for imotif in group], ncount, length_seq - markov_order)
+        for imotif, motif_exact, motif_tail in zip(group, exact, tail, strict=True):
+            exacts[imotif] = motif_exact
+            tails[imotif] = motif_tail
+    # Probabilities
+    for i, (imotif, nobs) in enumerate(zip(imotifs, nobs_list, strict=True)):
+        if direction == "o":
+            probs[i] = tails[imotif][nobs] if nobs > 0 else 1.0
+        else:
+            probs[i] = exacts[imotif][: nobs + 1].sum()
+    return probs
+
+
+def _get_count_dists(embeddings, ncount, nstep):
+    """Return the probabilities of exactly k (k < ncount) and at least j (j ≤ ncount) occurrences after nstep letters.
+
+    Args:
+        embeddings: List of initial distributions and one-letter transitions of motifs with the same number of states
+        ncount: Number of counts
+        nstep: Number of letters
+    """
+    inits = np.stack([init for init, _ in embeddings])[:, None, None, :]
+    steps = np.stack([step for _, step in embeddings])
+    # One letter: exact counts (0 or 1) and tails (≥0 or ≥1)
+    power = (
+        np.zeros((len(embeddings), ncount) + steps.shape[-2:]),
+        np.zeros((len(embeddings), ncount + 1) + steps.shape[-2:]),
+    )
+    power[0][:, : min(2, ncount)] = steps[:, : min(2, ncount)]
+    power[1][:, 0] = steps.sum(axis=1)
+    power[1][:, 1] = steps[:, 1]
+    # Distribution from initial states
+    dist = (
+        np.zeros((len(embeddings), ncount) + inits.shape[-2:]),
+        np.zeros((len(embeddings), ncount + 1) + inits.shape[-2:]),
+    )
+    dist[0][:, :1] = inits
+    dist[1][:, :1] = inits
+    # Remaining letters
+    nstep = max(0, nstep)
+    while nstep > 0:
+        if nstep & 1:
+            dist = _compose(dist, power, ncount)
+        nstep >>= 1
+        if nstep > 0:
+            power = _compose(power, power, ncount)
+    return dist[0].sum(axis=(2, 3)), dist[1].sum(axis=(2, 3))
+
+
+def get_exact_prob(motif, nobs, length_seq, alphabet, transitions, markov_order, direction="o", start="first"):
+    """Compute exact probability of the number of occurrences of a motif (see `get_exact_probs`)."""
+    return float(get_exact_probs([motif], [nobs], length_seq, alphabet, transitions, markov_order, direction, start)[0])
@@ -0,0 +1,499 @@
+#
+# Copyright © 2024 Charles E. Vejnar
+#
+# This is free software, licensed under the GNU General Public License v3.
+# See /LICENSE for more information.
+#
+
+"""In-process phylogenetic models replacing the [PHAST](http://compgen.bscb.cornell.edu/phast) programs.
+
+Implements the parts of phyloFit and phyloP used by miRmap: likelihood of a REV model computed with Felsenstein
+pruning, fit of branch lengths and rates, and the SPH p-values of conservation and acceleration.
+"""
+
+import math
+import os
+from dataclasses import dataclass
+
+import dendropy
+import numpy as np
+
+from . import if_exe_phast, utils
+
+
+@dataclass(frozen=True)
+class SphResult:
+    """Number of substitutions in an alignment under the null model (prior) and given the alignment (posterior)."""
+
+    prior_mean: float
+    prior_var: float
+    post_mean: float
+    pval_con: float
+    pval_acc: float
+
+
+class TreeModel:
+    """Substitution model along a rooted tree.
+
+    Args:
+        tree: Tree in the Newick format
+        rate_matrix: Rate matrix (expected rate of 1 substitution per unit of branch length)
+        background: Equilibrium frequencies of the nucleotides
+        alphabet: Nucleotides
+        subst_model: Substitution model name
+        training_lnl: Log-likelihood of the alignment used to fit the model
+    """
+
+    def __init__(
+        self, tree, rate_matrix, background, alphabet=("A", "C", "G", "T"), subst_model="REV", training_lnl=None
+    ):
+        """Create new model."""
+        self.tree = tree
+        self.rate_matrix = np.asarray(rate_matrix, dtype=np.float64)
+        self.background = np.asarray(background, dtype=np.float64)
+        self.alphabet = tuple(alphabet)
+        self.subst_model = subst_model
+        self.training_lnl = training_lnl
+        self._nodes = None
+        self._eigen = None
+        self._transitions = None
+        self._expected_substs = None
+        self._pruned = {}
+        self._prior_distribs = {}
+
+    @classmethod
+    def from_mod(cls, mod=None, mod_fname=None):
+        """Load model from phyloFit model or model file."""
+        if mod_fname is not None:
+            with open(mod_fname, "rt") as f:
+                mod = f.read()
+        result = if_exe_phast.parse_mod(mod)
+        alphabet = result["alphabet"].split()
+        return cls(
+            result["tree"],
+            np.array(result["rate_mat"].split(), dtype=np.float64).reshape(len(alphabet), len(alphabet)),
+            np.array(result["background"].split(), dtype=np.float64),
+            alphabet=alphabet,
+            subst_model=result["subst_mod"],
+            training_lnl=result["training_lnl"],
+        )
+
+    def to_mod(self):
+        """Return model in the phyloFit format."""
+        lines = [
+            "ALPHABET: " + " ".join(self.alphabet) + " ",
+            "ORDER: 0",
+            f"SUBST_MOD: {self.subst_model}",
+            f"TRAINING_LNL: {self.training_lnl if self.training_lnl is not None else 0.0:f}",
+            "BACKGROUND: " + " ".join(f"{v:f}" for v in self.background) + " ",
+            "RATE_MAT:",
+        ]
+        lines.extend("  " + " ".join(f"{v:10f}" for v in row) + " " for row in self.rate_matrix)
+        lines.append(f"TREE: {self.tree}")
+        return "\n".join(lines) + "\n"
+
+    def prune(self, species):
+        """Return model with the tree restricted to species (root branch dropped as phyloP does)."""
+        species = frozenset(species)
+        if species not in self._pruned:
+            self._pruned[species] = self._prune(species)
+        return self._pruned[species]
+
+    def _prune(self, species):
+        dtree = dendropy.Tree.get_from_string(self.tree, schema="newick", preserve_underscores=True)
+        dtree.retain_taxa_with_labels(species)
+        dtree.seed_node.edge.length = None
+        return TreeModel(
+            dtree.as_string(schema="newick", suppress_rooting=True).strip(),
+            self.rate_matrix,
+            self.background,
+            alphabet=self.alphabet,
+            subst_model=self.subst_model,
+            training_lnl=self.training_lnl,
+        )
+
+    @property
+    def nodes(self):
+        """Nodes in postorder (root last) as tuples of children indexes, branch length and leaf label."""
+        if self._nodes is None:
+            self._nodes = _compile_tree(self.tree)
+        return self._nodes
+
+    def get_tree_length(self):
+        """Return sum of branch lengths."""
+        return sum(length for _, length, _ in self.nodes[:-1])
+
+    def _get_eigen(self):
+        if self._eigen is None:
+            w, u = np.linalg.eig(self.rate_matrix)
+            self._eigen = (w.real, u.real, np.linalg.inv(u.real))
+        return self._eigen
+
+    def get_transition_matrix(self, length):
+        """Return matrix of substitution probabilities along a branch."""
+        w, u, u_inv = self._get_eigen()
+        return (u * np.exp(w * length)) @ u_inv
+
+    def get_transition_matrices(self):
+        """Return matrices of substitution probabilities along the branches of all nodes."""
+        if self._transitions is None:
+            w, u, u_inv = self._get_eigen()
+            lengths = np.array([length for _, length, _ in self.nodes])
+            self._transitions = (u[None, :, :] * np.exp(lengths[:, None, None] * w[None, None, :])) @ u_inv
+        return self._transitions
+
+    def get_expected_subst_matrix(self, length):
+        """Return matrix of the expected number of substitutions along a branch jointly with its end state."""
+        w, u, u_inv = self._get_eigen()
+        # Integral of exp(Qs) Q_offdiag exp(Q(t-s)) over s in [0, t]
+        ew = np.exp(w * length)
+        dw = w[:, None] - w[None, :]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            phi = np.where(np.abs(dw) > 1e-10, (ew[:, None] - ew[None, :]) / dw, length * ew[:, None])
+        offdiag = self.rate_matrix - np.diag(np.diag(self.rate_matrix))
+        return u @ ((u_inv @ offdiag @ u) * phi) @ u_inv
+
+    def get_expected_subst_matrices(self):
+        """Return matrices of the expected number of substitutions along the branches of all nodes."""
+        if self._expected_substs is None:
+            self._expected_substs = np.array([self.get_expected_subst_matrix(length) for _, length, _ in self.nodes])
+        return self._expected_substs
+
+    def get_leaf_partials(self, seqs):
+        """Return the partial likelihoods of leaves (missing data for gaps or sequences absent from alignment)."""
+        codes = np.full(256, len(self.alphabet), dtype=np.intp)
+        for i, nt in enumerate(self.alphabet):
+            codes[ord(nt)] = codes[ord(nt.lower())] = i
+        identity = np.hstack((np.eye(len(self.alphabet)), np.ones((len(self.alphabet), 1))))
+        ncol = len(next(iter(seqs.values())))
+        partials = {}
+        for _, _, label in self.nodes:
+            if label is not None:
+                if label in seqs:
+                    partials[label] = identity[:, codes[np.frombuffer(seqs[label].encode("ascii"), dtype=np.uint8)]]
+                else:
+                    partials[label] = np.ones((len(self.alphabet), ncol))
+        return partials
+
+    def _prune_inside(self, leaf_partials):
+        """Return the inside partial likelihoods of nodes (scaled) and the log-scale of the columns."""
+        transitions = self.get_transition_matrices()
+        inside = []
+        log_scale = 0.0
+        for children, _, label in self.nodes:
+            if label is not None:
+                inside.append(leaf_partials[label])
+            else:
+                partial = 1.0
+                for child in children:
+                    partial = partial * (transitions[child] @ inside[child])
+                # Rescale to avoid underflow
+                scale = partial.max(axis=0)
+                partial = partial / scale
+                log_scale = log_scale + np.log(scale)
+                inside.append(partial)
+        return inside, log_scale
+
+    def get_log_likelihood(self, seqs=None, weights=None, leaf_partials=None, gradient=False):
+        """Return log-likelihood of alignment computed with Felsenstein pruning.
+
+        Args:
+            seqs: Dictionary of aligned sequences
+            weights: Number of occurrences of each column (1 if None)
+            leaf_partials: Partial likelihoods of leaves (computed from seqs if None)
+            gradient: Returning or not the derivatives of the log-likelihood by the branch lengths
+        """
+        if leaf_partials is None:
+            leaf_partials = self.get_leaf_partials(seqs)
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            inside, log_scale = self._prune_inside(leaf_partials)
+            site_lnl = np.log(self.background @ inside[-1]) + log_scale
+            if weights is None:
+                weights = np.ones(len(site_lnl))
+            lnl = float(site_lnl @ weights)
+            if not gradient:
+                return lnl
+            # Outside pass: partial likelihoods of the data outside each branch given the state of its parent
+            transitions = self.get_transition_matrices()
+            grads = np.zeros(len(self.nodes))
+            outside = [None] * len(self.nodes)
+            outside[-1] = np.broadcast_to(self.background[:, None], inside[-1].shape)
+            for inode in range(len(self.nodes) - 1, -1, -1):
+                children, _, _ = self.nodes[inode]
+                if len(children) == 0:
+                    continue
+                conds = [transitions[child] @ inside[child] for child in children]
+                for ichild, child in enumerate(children):
+                    upper = outside[inode]
+                    for isibling in range(len(children)):
+                        if isibling != ichild:
+                            upper = upper * conds[isibling]
+                    upper = upper / upper.max(axis=0)
+                    p = transitions[child]
+                    grads[child] = (
+                        np.sum(upper * (self.rate_matrix @ p @ inside[child]), axis=0)
+                        / np.sum(upper * conds[ichild], axis=0)
+                    ) @ weights
+                    outside[child] = p.T @ upper
+        return lnl, grads
+
+    def get_posterior_subst(self, seqs):
+        """Return the posterior expected number of substitutions of each alignment column."""
+        leaf_partials = self.get_leaf_partials(seqs)
+        transitions = self.get_transition_matrices()
+        expected_substs = self.get_expected_subst_matrices()
+        partials = []
+        for children, _, label in self.nodes:
+            if label is not None:
+                partials.append((leaf_partials[label], np.zeros_like(leaf_partials[label])))
+            else:
+                # Partial likelihoods and their first moments in the number of substitutions
+                m0, m1 = 1.0, 0.0
+                for child in children:
+                    l0, l1 = partials[child]
+                    c0 = transitions[child] @ l0
+                    c1 = transitions[child] @ l1 + expected_substs[child] @ l0
+                    m0, m1 = m0 * c0, m1 * c0 + m0 * c1
+                scale = m0.max(axis=0)
+                partials.append((m0 / scale, m1 / scale))
+        m0, m1 = partials[-1]
+        return (self.background @ m1) / (self.background @ m0)
+
+    def get_prior_subst_distrib(self, ncol):
+        """Return the null distribution of the number of substitutions in an alignment of ncol columns.
+
+        Substitutions at each column follow a process of the length of the whole tree started at equilibrium.
+        """
+        if ncol not in self._prior_distribs:
+            if 1 not in self._prior_distribs:
+                self._prior_distribs[1] = self._get_col_prior_subst_distrib()
+            distrib = np.ones(1)
+            for _ in range(ncol):
+                distrib = np.convolve(distrib, self._prior_distribs[1])
+            self._prior_distribs[ncol] = distrib
+        return self._prior_distribs[ncol]
+
+    def _get_col_prior_subst_distrib(self):
+        length = self.get_tree_length()
+        # Uniformization: jumps of a Poisson process with real (off-diagonal) and virtual (diagonal) substitutions
+        lam = float(-np.diag(self.rate_matrix).min())
+        jumps = self.rate_matrix / lam + np.eye(len(self.alphabet))
+        virtual = np.diag(np.diag(jumps))
+        real = jumps - virtual
+        njump = int(lam * length + 12.0 * math.sqrt(lam * length) + 30)
+        state = np.zeros((njump + 1, len(self.alphabet)))
+        state[0] = self.background
+        distrib = np.zeros(njump + 1)
+        for n in range(njump + 1):
+            if lam * length > 0:
+                weight = math.exp(-lam * length + n * math.log(lam * length) - math.lgamma(n + 1))
+            else:
+                weight = 1.0 if n == 0 else 0.0
+            distrib += weight * state.sum(axis=1)
+            state[1:] = state[1:] @ virtual + state[:-1] @ real
+            state[0] = state[0] @ virtual
+        return distrib
+
+    def calc_sph(self, seqs, prune=True):
+        """Compute the SPH p-values of the number of substitutions in alignment as phyloP.
+
+        Args:
+            seqs: Dictionary of aligned sequences
+            prune: Pruning or not the tree of the species absent from the alignment
+        """
+        model = self.prune(seqs.keys()) if prune else self
+        ncol = len(next(iter(seqs.values())))
+        prior = model.get_prior_subst_distrib(ncol)
+        nsubst = np.arange(len(prior))
+        prior_mean = float(prior @ nsubst)
+        prior_var = float(prior @ nsubst**2 - prior_mean**2)
+        post_mean = float(model.get_posterior_subst(seqs).sum())
+        cdf = np.cumsum(prior)
+        # Upper tail summed from its smallest terms (1 - CDF loses the small p-values of acceleration)
+        sf = np.cumsum(prior[::-1])[::-1]
+        pval_con = float(min(cdf[min(math.ceil(post_mean), len(cdf) - 1)], 1.0))
+        if math.floor(post_mean) > 0:
+            pval_acc = float(min(sf[math.floor(post_mean)], 1.0)) if math.floor(post_mean) < len(sf) else 0.0
+        else:
+            pval_acc = 1.0
+        return SphResult(prior_mean, prior_var, post_mean, pval_con, pval_acc)
+
+
+def _compile_tree(tree):
+    """Return nodes of Newick tree in postorder (root last)."""
+    dtree = dendropy.Tree.get_from_string(tree, schema="newick", preserve_underscores=True)
+    nodes = []
+    idxs = {}
+    for node in dtree.postorder_node_iter():
+        idxs[node] = len(nodes)
+        nodes.append(
+            (
+                [idxs[child] for child in node.child_nodes()],
+                node.edge.length if node.edge.length is not None else 0.0,
+                node.taxon.label if node.is_leaf() else None,
+            )
+        )
+    return nodes
+
+
+def _format_tree(nodes, lengths, idx=None):
+    """Return Newick tree from nodes and branch lengths."""
+    if idx is None:
+        return _format_tree(nodes, lengths, len(nodes) - 1) + ";"
+    children, _, label = nodes[idx]
+    if label is not None:
+        s = label
+    else:
+        s = "(" + ",".join(_format_tree(nodes, lengths, child) for child in children) + ")"
+    if idx != len(nodes) - 1:
+        s += f":{lengths[idx]:g}"
+    return s
+
+
+def _get_rev_rate_matrix(exchangeabilities, background):
+    """Return REV rate matrix normalized to an expected rate of 1."""
+    n = len(background)
+    rate_matrix = np.zeros((n, n))
+    rate_matrix[np.triu_indices(n, 1)] = exchangeabilities
+    rate_matrix = (rate_matrix + rate_matrix.T) * background[None, :]
+    rate_matrix -= np.diag(rate_matrix.sum(axis=1))
+    return rate_matrix / -(background @ np.diag(rate_matrix))
+
+
+def _minimize(func, x0, gtol=1e-4, maxiter=1000):
+    """Minimize function with BFGS (function called with gradient=True returns its value and gradient)."""
+    x = np.asarray(x0, dtype=np.float64)
+    fx, g = func(x, gradient=True)
+    h = np.eye(len(x))
+    for _ in range(maxiter):
+        direction = -h @ g
+        if g @ direction >= 0:
+            h = np.eye(len(x))
+            direction = -g
+        # Backtracking line search
+        alpha = 1.0
+        while True:
+            x_new = x + alpha * direction
+            f_new = func(x_new)
+            if f_new <= fx + 1e-4 * alpha * (g @ direction) or alpha < 1e-10:
+                break
+            alpha *= 0.5
+        f_new, g_new = func(x_new, gradient=True)
+        s = x_new - x
+        y = g_new - g
+        converged = alpha < 1e-10 or np.abs(g_new).max() < gtol
+        x, fx, g = x_new, f_new, g_new
+        if converged:
+            break
+        sy = s @ y
+        if sy > 1e-12:
+            rho = 1.0 / sy
+            v = np.eye(len(x)) - rho * np.outer(s, y)
+            h = v @ h @ v.T + rho * np.outer(s, s)
+    return x
+
+
+def _restrict(func, x, gradient, nfree, nfixed):
+    """Call function with the last parameters fixed to 0."""
+    result = func(np.append(x, [0.0] * nfixed), gradient=gradient)
+    if gradient:
+        return result[0], result[1][:nfree]
+    return result
+
+
+def fit_tree_model(tree, seqs, subst_model="REV", alphabet=("A", "C", "G", "T")):
+    """Fit branch lengths and rates of a REV model to alignment by maximum likelihood (as phyloFit).
+
+    The equilibrium frequencies are the nucleotide frequencies of the alignment. As the model is reversible, both
+    branches from the root share the same length.
+
+    Args:
+        tree: Tree in the Newick format (branch lengths used as starting values, pruned to the aligned species)
+        seqs: Dictionary of aligned sequences
+        subst_model: Substitution model (only REV)
+        alphabet: Nucleotides
+    """
+    if subst_model != "REV":
+        raise ValueError(f"Unsupported substitution model {subst_model}")
+    # Background
+    counts = np.zeros(len(alphabet))
+    for seq in seqs.values():
+        seq = seq.upper()
+        counts += [seq.count(nt) for nt in alphabet]
+    background = counts / counts.sum()
+    # Unique columns
+    columns = np.array([list(seq.upper().encode("ascii")) for seq in seqs.values()], dtype=np.uint8).T
+    patterns, weights = np.unique(columns, axis=0, return_counts=True)
+    model = TreeModel(tree, np.zeros((len(alphabet), len(alphabet))), background, alphabet=alphabet).prune(seqs.keys())
+    leaf_partials = model.get_leaf_partials(
+        {name: patterns[:, i].tobytes().decode("ascii") for i, name in enumerate(seqs.keys())}
+    )
+    # Parameters: log branch lengths (root branches tied) and log exchangeabilities (last one fixed to 1)
+    nodes = model.nodes
+    root_children = nodes[-1][0] if len(nodes[-1][0]) == 2 else []
+    branches = [i for i in range(len(nodes) - 1) if i not in root_children[1:]]
+    nexch = len(alphabet) * (len(alphabet) - 1) // 2
+
+    def get_model(x):
+        x = np.clip(x, -20.0, 5.0)
+        lengths = np.zeros(len(nodes))
+        lengths[branches] = np.exp(x[: len(branches)])
+        if len(root_children) > 0:
+            lengths[root_children] = lengths[root_children[0]] / 2
+        model = TreeModel(
+            None,
+            _get_rev_rate_matrix(np.exp(np.append(x[len(branches) :], 0.0)), background),
+            background,
+            alphabet=alphabet,
+        )
+        model._nodes = [(children, length, label) for (children, _, label), length in zip(nodes, lengths, strict=True)]
+        return model, lengths
+
+    def func(x, gradient=False):
+        model, lengths = get_model(x)
+        if not gradient:
+            lnl = model.get_log_likelihood(weights=weights, leaf_partials=leaf_partials)
+            return -lnl if np.isfinite(lnl) else np.inf
+        lnl, grads = model.get_log_likelihood(weights=weights, leaf_partials=leaf_partials, gradient=True)
+        # Derivatives by log branch lengths (analytic) and by log exchangeabilities (finite differences)
+        grad = np.empty(len(x))
+        grads = grads * lengths
+        if len(root_children) > 0:
+            grads[root_children[0]] = grads[root_children].sum()
+        grad[: len(branches)] = -grads[branches]
+        for i in range(len(branches), len(x)):
+            dx = np.zeros(len(x))
+            dx[i] = 1e-6
+            grad[i] = (func(x + dx) - func(x - dx)) / 2e-6
+        return -lnl, grad
+
+    x0 = []
+    for i in branches:
+        length = nodes[i][1] * (2 if i in root_children else 1)
+        x0.append(math.log(length) if length > 0 else math.log(0.1))
+    # Branch lengths with equal exchangeabilities then all parameters
+    nbranch = len(branches)
+    x = _minimize(
+        lambda x, gradient=False: _restrict(func, x, gradient, nbranch, nexch - 1),
+        x0,
+    )
+    x = _minimize(func, np.append(x, [0.0] * (nexch - 1)))
+    model, lengths = get_model(x)
+    model.tree = _format_tree(nodes, lengths)
+    model.training_lnl = -func(x)
+    return model
+
+
+# Models loaded from model files
+_mod_cache = utils.LRUCache(64)
+
+
+def load_mod(mod_fname):
+    """Load model from model file (cached while the file is unchanged)."""
+    stat = os.stat(mod_fname)
+    key = (os.fspath(mod_fname), stat.st_size, stat.st_mtime_ns)
+    model = _mod_cache.get(key)
+    if model is None:
+        model = TreeModel.from_mod(mod_fname=mod_fname)
+        _mod_cache.put(key, model)
+    return model
@@ -5,6 +5,10 @@
 # See /LICENSE for more information.
 #
 
+"""Markov chain background models of sequences."""
+
+import numpy as np
+
 from . import utils
 
 
@@ -18,33 +22,175 @@ def permutations(items, n):
                 yield str(items[i]) + str(base)
 
 
+# Maximum number of k-mers of occurrence tables stored densely
+_max_dense_kmers = 1 << 22
+
+
+class MarkovBackground:
+    """Markov chain model of a sequence with the transitions estimated from its k-mer counts.
+
+    Transitions are stored as a C-ordered matrix with one row per context of markov_order letters and one column
+    per next letter (rows and columns in the order of `permutations(alphabet, ...)`). Motifs are encoded with
+    the same integer codes to count their (overlapping) occurrences in the sequence and compute their probability.
+
+    Args:
+        seq: Sequence
+        alphabet: List of letters (k-mers including other letters aren't counted)
+        markov_order: Markov chain order
+    """
+
+    def __init__(self, seq, alphabet, markov_order=1):
+        """Count k-mers and compute transitions."""
+        self.alphabet = list(alphabet)
+        self.markov_order = markov_order
+        self.letter_indexes = {letter: code for code, letter in enumerate(self.alphabet)}
+        nletter = len(self.alphabet)
+        # Letter codes (nletter for letters outside alphabet)
+        self._letter_codes = np.full(256, nletter, dtype=np.intp)
+        for code, letter in enumerate(self.alphabet):
+            self._letter_codes[ord(letter)] = code
+        self._codes = self._letter_codes[np.frombuffer(seq.encode("ascii"), dtype=np.uint8)]
+        kmers, valid = self._get_kmers(self._codes, markov_order + 1)
+        self.counts = np.bincount(kmers[valid], minlength=nletter ** (markov_order + 1))
+        self._kmer_counts = {markov_order + 1: self.counts}
+        self.transitions = self._normalize(self.counts.reshape(-1, nletter))
+
+    @classmethod
+    def from_transitions(cls, alphabet, markov_order, transitions, seq=""):
+        """Create model from a transition matrix (list of rows or flat) and the sequence to count motifs in."""
+        background = cls(seq, alphabet, markov_order)
+        background.transitions = np.ascontiguousarray(transitions, dtype=np.float64).reshape(-1, len(alphabet))
+        return background
+
+    @staticmethod
+    def _normalize(counts):
+        sums = counts.sum(axis=1, keepdims=True)
+        return np.divide(counts, sums, out=np.zeros(counts.shape, dtype=np.float64), where=sums != 0)
+
+    @property
+    def transitions_flat(self):
+        """Transitions as a flat C-ordered array (e.g. for Spatt)."""
+        return self.transitions.reshape(-1)
+
+    def _get_kmers(self, codes, k):
+        """Return index of the k-mers starting at each position of coded sequence(s) and their validity."""
+        nletter = len(self.alphabet)
+        nkmer = max(0, codes.shape[-1] - k + 1)
+        kmers = np.zeros(codes.shape[:-1] + (nkmer,), dtype=np.intp)
+        valid = np.ones(kmers.shape, dtype=bool)
+        for i in range(k):
+            window = codes[..., i : i + nkmer]
+            kmers = kmers * nletter + window
+            valid &= window < nletter
+        return kmers, valid
+
+    def get_kmer_counts(self, k):
+        """Return the number of occurrences of all k-mers (dense array indexed by k-mer code, computed once)."""
+        counts = self._kmer_counts.get(k)
+        if counts is None:
+            kmers, valid = self._get_kmers(self._codes, k)
+            if len(self.alphabet) ** k <= _max_dense_kmers:
+                counts = np.bincount(kmers[valid], minlength=len(self.alphabet) ** k)
+            else:
+                counts = np.unique(kmers[valid], return_counts=True)
+            self._kmer_counts[k] = counts
+        return counts
+
+    def encode(self, motifs):
+        """Encode motifs of identical length as a matrix of letter codes (other letters coded as alphabet length)."""
+        motifs = list(motifs)
+        length = len(motifs[0]) if len(motifs) > 0 else 0
+        return self._letter_codes[
+            np.frombuffer("".join(motifs).encode("ascii"), dtype=np.uint8).reshape(len(motifs), length)
+        ]
+
+    def count_motifs(self, motifs):
+        """Return the number of overlapping occurrences in the sequence of motifs of identical length.
+
+        Args:
+            motifs: List of motifs or matrix of letter codes (see `encode`)
+        """
+        codes = motifs if isinstance(motifs, np.ndarray) else self.encode(motifs)
+        kmers, valid = self._get_kmers(codes, codes.shape[1])
+        kmers, valid = kmers[:, 0], valid[:, 0]
+        counts = self.get_kmer_counts(codes.shape[1])
+        nobs = np.zeros(len(kmers), dtype=np.int64)
+        if isinstance(counts, tuple):
+            uniques, unique_counts = counts
+            idxs = np.searchsorted(uniques, kmers)
+            found = valid & (idxs < len(uniques))
+            found[found] &= uniques[idxs[found]] == kmers[found]
+            nobs[found] = unique_counts[idxs[found]]
+        else:
+            nobs[valid] = counts[kmers[valid]]
+        return nobs
+
+    def count_motif(self, motif):
+        """Return the number of overlapping occurrences of a motif in the sequence."""
+        counts = self.get_kmer_counts(len(motif))
+        if isinstance(counts, tuple):
+            return int(self.count_motifs([motif])[0])
+        kmer = 0
+        for letter in motif:
+            code = self.letter_indexes.get(letter)
+            if code is None:
+                return 0
+            kmer = kmer * len(self.alphabet) + code
+        return int(counts[kmer])
+
+    def prob_motifs(self, motifs):
+        """Compute the probability of the transitions along motifs of identical length.
+
+        Args:
+            motifs: List of motifs or matrix of letter codes (see `encode`)
+        """
+        codes = motifs if isinstance(motifs, np.ndarray) else self.encode(motifs)
+        if np.any(codes >= len(self.alphabet)):
+            raise KeyError("Motif letter outside alphabet")
+        kmers, _ = self._get_kmers(codes, self.markov_order + 1)
+        return self.transitions_flat[kmers].prod(axis=1)
+
+    def prob_motif(self, motif):
+        """Compute the probability of the transitions along a motif."""
+        nletter = len(self.alphabet)
+        transitions = self.transitions_flat
+        codes = [self.letter_indexes[letter] for letter in motif]
+        prob = 1.0
+        for i in range(len(motif) - self.markov_order):
+            kmer = 0
+            for code in codes[i : i + self.markov_order + 1]:
+                kmer = kmer * nletter + code
+            prob *= transitions[kmer]
+        return float(prob)
+
+
+# Default cache of backgrounds shared by the targets of a host sequence
+background_cache = utils.LRUCache(16)
+
+
+def get_background(seq, alphabet=None, markov_order=1, cache=background_cache):
+    """Return Markov chain background of a sequence (computed once and cached).
+
+    Args:
+        seq: Sequence
+        alphabet: List of letters (letters of the sequence if None)
+        markov_order: Markov chain order
+        cache: LRUCache object of MarkovBackground objects (no caching if None)
+    """
+    key = (seq, tuple(alphabet) if alphabet is not None else None, markov_order)
+    background = cache.get(key) if cache is not None else None
+    if background is None:
+        background = MarkovBackground(seq, sorted(set(seq)) if alphabet is None else alphabet, markov_order)
+        if cache is not None:
+            cache.put(key, background)
+    return background
+
+
 def get_transitions(seq, alphabet, markov_order):
     """Compute transitions matrix."""
-    transitions = []
-    motifs = list(permutations(alphabet, markov_order + 1))
-    counts = {m: 0 for m in motifs}
-    for i in range(len(seq) - markov_order):
-        s = seq[i : i + markov_order + 1]
-        if all([i in alphabet for i in s]):
-            counts[s] += 1
-    for motif in motifs:
-        transitions.append(counts[motif])
-    transitions = list(utils.grouper(len(alphabet), transitions))
-    sums = list(map(sum, transitions))
-    for i in range(len(transitions)):
-        if sums[i] != 0:
-            transitions[i] = [transitions[i][j] / float(sums[i]) for j in range(len(transitions[i]))]
-        else:
-            transitions[i] = [0.0] * len(transitions[i])
-    return transitions
+    return MarkovBackground(seq, alphabet, markov_order).transitions.tolist()
 
 
 def prob_motif(motif, alphabet, markov_order, transitions):
     """Compute the probability of a motif based on a transitions matrix."""
-    transitions = utils.flatten(transitions)
-    motifs = list(permutations(alphabet, markov_order + 1))
-    motifs_index = dict([(motifs[i], i) for i in range(len(motifs))])
-    prob = 1.0
-    for i in range(len(motif) - markov_order):
-        prob *= transitions[motifs_index[motif[i : i + markov_order + 1]]]
-    return prob
+    return MarkovBackground.from_transitions(alphabet, markov_order, transitions).prob_motif(motif)
@@ -9,9 +9,20 @@
 
 import math
 
+import numpy as np
+
 from . import prob
 
 
+# Relative size of the last summed term of binomial tails
+_tail_eps = 1e-17
+_lgamma_ufunc = np.frompyfunc(math.lgamma, 1, 1)
+
+
+def _lgamma(a):
+    return _lgamma_ufunc(a).astype(np.float64)
+
+
 def binomial_cdf(x, n, p):
     """Compute binomial CDF exxact solution using log to avoid float overflow errors.
     (https://stackoverflow.com/a/45869209)
@@ -26,7 +37,91 @@ def binomial_cdf(x, n, p):
     return cdf
 
 
-def calc_prob_binomial(target, markov_order=1, alphabet=None, transitions=None):
+def _log_binomial_pmf(k, n, p):
+    return math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1) + k * math.log(p) + (n - k) * math.log1p(-p)
+
+
+def binomial_sf(x, n, p):
+    """Compute the binomial survival function P(X > x) without subtracting from 1 when it is small.
+
+    The smaller tail is summed from its first term in log-space, stopping when terms become negligible: the upper
+    tail is returned directly if x is above the mean, and subtracted from 1 otherwise.
+
+    Args:
+        x: Number of successes
+        n: Number of trials
+        p: Probability of success
+    """
+    if x < 0 or p >= 1.0:
+        return 1.0 if x < n else 0.0
+    if x >= n or p <= 0.0:
+        return 0.0
+    upper = x + 1 > n * p
+    k = x + 1 if upper else x
+    log_pmf = _log_binomial_pmf(k, n, p)
+    odds = p / (1.0 - p)
+    term = total = 1.0
+    if upper:
+        while k < n and term >= total * _tail_eps:
+            term *= (n - k) / (k + 1) * odds
+            total += term
+            k += 1
+        return math.exp(log_pmf) * total
+    else:
+        while k > 0 and term >= total * _tail_eps:
+            term *= k / ((n - k + 1) * odds)
+            total += term
+            k -= 1
+        return 1.0 - math.exp(log_pmf) * total
+
+
+def _sum_tail_array(k, n, odds, upper):
+    """Sum the ratios of the binomial terms to the k-th term along the upper or lower tail (until negligible)."""
+    term = np.ones(len(k))
+    total = np.ones(len(k))
+    k = k.copy()
+    active = np.flatnonzero(k < n if upper else k > 0)
+    while len(active) > 0:
+        ka = k[active]
+        na = n[active]
+        if upper:
+            term[active] *= (na - ka) / (ka + 1) * odds[active]
+            k[active] = ka = ka + 1
+        else:
+            term[active] *= ka / ((na - ka + 1) * odds[active])
+            k[active] = ka = ka - 1
+        total[active] += term[active]
+        active = active[((ka < na) if upper else (ka > 0)) & (term[active] >= total[active] * _tail_eps)]
+    return total
+
+
+def binomial_sf_array(x, n, p):
+    """Compute the binomial survival function P(X > x) element-wise on arrays (see `binomial_sf`).
+
+    Args:
+        x: Numbers of successes
+        n: Numbers of trials
+        p: Probabilities of success
+    """
+    x, n, p = np.broadcast_arrays(np.asarray(x, dtype=np.float64), np.asarray(n, dtype=np.float64), np.asarray(p))
+    shape = x.shape
+    x, n, p = x.ravel(), n.ravel(), p.ravel().astype(np.float64)
+    sf = np.where((x < 0) | (p >= 1.0), (x < n).astype(np.float64), 0.0)
+    inner = np.flatnonzero((x >= 0) & (x < n) & (p > 0.0) & (p < 1.0))
+    x, n, p = x[inner], n[inner], p[inner]
+    upper = x + 1 > n * p
+    k = np.where(upper, x + 1, x)
+    log_pmf = _lgamma(n + 1) - _lgamma(k + 1) - _lgamma(n - k + 1) + k * np.log(p) + (n - k) * np.log1p(-p)
+    odds = p / (1.0 - p)
+    tail = np.empty(len(inner))
+    tail[upper] = _sum_tail_array(k[upper], n[upper], odds[upper], True)
+    tail[~upper] = _sum_tail_array(k[~upper], n[~upper], odds[~upper], False)
+    tail *= np.exp(log_pmf)
+    sf[inner] = np.where(upper, tail, 1.0 - tail)
+    return sf.reshape(shape)
+
+
+def calc_prob_binomial(target, markov_order=1, alphabet=None, transitions=None, background=None):
     """Compute the *P.over binomial* score.
 
     Args:
@@ -34,16 +129,54 @@ def calc_prob_binomial(target, markov_order=1, alphabet=None, transitions=None):
         markov_order: Markov Chain order
         alphabet: List of nucleotides to consider in the sequences
         transitions: Transition matrix of the Markov Chain model
+        background: MarkovBackground of the host sequence (shared by its targets if None and transitions is None)
     """
     # Parameters
-    if alphabet is None:
-        alphabet = list(set(target.host_seq))
-    if transitions is None:
-        transitions = prob.get_transitions(target.host_seq, alphabet, markov_order)
+    if background is None:
+        if transitions is None:
+            background = prob.get_background(target.host_seq, alphabet, markov_order)
+        else:
+            background = prob.MarkovBackground.from_transitions(
+                alphabet, markov_order, transitions, seq=target.host_seq
+            )
     # Target seed binding sequence
     target_seed_seq = target.host_seq[target.seed.start : target.seed.end]
-    return 1.0 - binomial_cdf(
-        target.host_seq.count(target_seed_seq),
+    return binomial_sf(
+        background.count_motif(target_seed_seq),
         len(target.host_seq) - len(target_seed_seq) + 1,
-        prob.prob_motif(target_seed_seq, alphabet, markov_order, transitions),
+        background.prob_motif(target_seed_seq),
+    )
+
+
+def calc_prob_binomial_batch(targets, markov_order=1, alphabet=None, background=None):
+    """Compute the *P.over binomial* scores of all targets on a host sequence.
+
+    Occurrences and probabilities of seeds of the same length are computed together.
+
+    Args:
+        targets: List of targets on the same host sequence
+        markov_order: Markov Chain order
+        alphabet: List of nucleotides to consider in the sequences
+        background: MarkovBackground of the host sequence (shared by its targets if None)
+
+    Returns:
+        Array of scores in the order of targets
+    """
+    pvals = np.zeros(len(targets))
+    if len(targets) == 0:
+        return pvals
+    host_seq = targets[0].host_seq
+    assert all(target.host_seq is host_seq or target.host_seq == host_seq for target in targets), (
+        "Targets must be on the same host sequence"
     )
+    if background is None:
+        background = prob.get_background(host_seq, alphabet, markov_order)
+    # Targets by seed length
+    seed_lengths = np.array([len(target.seed) for target in targets])
+    for seed_length in np.unique(seed_lengths):
+        itargets = np.flatnonzero(seed_lengths == seed_length)
+        codes = background.encode([host_seq[targets[i].seed.start : targets[i].seed.end] for i in itargets])
+        pvals[itargets] = binomial_sf_array(
+            background.count_motifs(codes), len(host_seq) - seed_length + 1, background.prob_motifs(codes)
+        )
+    return pvals
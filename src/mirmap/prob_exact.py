@@ -7,34 +7,93 @@
 
 """Probability based on exact distribution feature."""
 
-from . import if_lib_spatt, prob
+from . import if_lib_spatt, pattern, prob
 
 
-def calc_prob_exact(target, libspatt=None, markov_order=1, alphabet=None, transitions=None):
-    """Compute the *P.over binomial* score.
+def _get_background(host_seq, markov_order, alphabet, transitions, background):
+    if background is None:
+        if transitions is None:
+            background = prob.get_background(host_seq, alphabet, markov_order)
+        else:
+            background = prob.MarkovBackground.from_transitions(alphabet, markov_order, transitions, seq=host_seq)
+    return background
+
+
+def _get_exact_probs(motifs, host_seq, background, libspatt, backend, executor=None):
+    if backend is None:
+        backend = "spatt" if libspatt is not None else "numpy"
+    args = (
+        motifs,
+        [background.count_motif(motif) for motif in motifs],
+        len(host_seq),
+        background.alphabet,
+        background.transitions_flat,
+        background.markov_order,
+        "o",
+    )
+    if backend == "spatt":
+        if libspatt is None:
+            libspatt = if_lib_spatt.Spatt()
+        return libspatt.get_exact_probs(*args, executor=executor)
+    elif backend == "numpy":
+        return pattern.get_exact_probs(*args).tolist()
+    else:
+        raise ValueError(f"Unknown exact probability backend {backend}")
+
+
+def calc_prob_exact(
+    target, libspatt=None, markov_order=1, alphabet=None, transitions=None, background=None, backend=None
+):
+    """Compute the *P.over exact* score.
 
     Args:
         target: Target
-        libspatt: Link to the Spatt library
+        libspatt: Spatt interface object (library loaded from the default path if None with the spatt backend)
         markov_order: Markov Chain order
         alphabet: List of nucleotides to consider in the sequences
         transitions: Transition matrix of the Markov Chain model
+        background: MarkovBackground of the host sequence (shared by its targets if None and transitions is None)
+        backend: Computing with Spatt (spatt) or in-process (numpy) (spatt if libspatt is not None, numpy otherwise)
     """
     # Parameters
-    if libspatt is not None:
-        if_spatt = if_lib_spatt.Spatt()
-    if alphabet is None:
-        alphabet = list(set(target.host_seq))
-    if transitions is None:
-        transitions = prob.get_transitions(target.host_seq, alphabet, markov_order)
+    background = _get_background(target.host_seq, markov_order, alphabet, transitions, background)
     # Target seed binding sequence
     target_seed_seq = target.host_seq[target.seed.start : target.seed.end]
-    return if_spatt.get_exact_prob(
-        target_seed_seq,
-        target.host_seq.count(target_seed_seq),
-        len(target.host_seq),
-        alphabet,
-        transitions,
-        markov_order,
-        "o",
+    return _get_exact_probs([target_seed_seq], target.host_seq, background, libspatt, backend)[0]
+
+
+def calc_prob_exact_batch(
+    targets,
+    libspatt=None,
+    markov_order=1,
+    alphabet=None,
+    transitions=None,
+    background=None,
+    executor=None,
+    backend=None,
+):
+    """Compute the *P.over exact* scores of all targets on a host sequence.
+
+    Args:
+        targets: List of targets on the same host sequence
+        libspatt: Spatt interface object (library loaded from the default path if None with the spatt backend)
+        markov_order: Markov Chain order
+        alphabet: List of nucleotides to consider in the sequences
+        transitions: Transition matrix of the Markov Chain model
+        background: MarkovBackground of the host sequence (shared by its targets if None and transitions is None)
+        executor: concurrent.futures.Executor computing probabilities concurrently with Spatt (sequentially if None)
+        backend: Computing with Spatt (spatt) or in-process (numpy) (spatt if libspatt is not None, numpy otherwise)
+
+    Returns:
+        List of scores in the order of targets
+    """
+    if len(targets) == 0:
+        return []
+    host_seq = targets[0].host_seq
+    assert all(target.host_seq is host_seq or target.host_seq == host_seq for target in targets), (
+        "Targets must be on the same host sequence"
     )
+    background = _get_background(host_seq, markov_order, alphabet, transitions, background)
+    # Target seed binding sequences
+    seeds = [host_seq[target.seed.start : target.seed.end] for target in targets]
+    return _get_exact_probs(seeds, host_seq, background, libspatt, backend, executor)
@@ -5,6 +5,11 @@
 # See /LICENSE for more information.
 #
 
+import asyncio
+import concurrent.futures
+import functools
+from dataclasses import fields
+
 from . import evolution, model, prob_binomial, prob_exact, targetscan, thermo
 
 
@@ -44,6 +49,148 @@ score_agg_funcs = {
 }
 
 
+feature_dependencies = {
+    "tgs_au": (),
+    "tgs_position": (),
+    "tgs_pairing3p": (),
+    "tgs_score": ("tgs_au", "tgs_position", "tgs_pairing3p"),
+    "dg_duplex": (),
+    "dg_binding": (),
+    "dg_duplex_seed": (),
+    "dg_binding_seed": (),
+    "dg_open": (),
+    "dg_total": ("dg_duplex", "dg_open"),
+    "prob_exact": (),
+    "prob_binomial": (),
+    "cons_bls": (),
+    "selec_phylop": (),
+    # Completed with the features of the miRmap model
+    "mirmap_score": (),
+}
+
+
+# Features computed with the PHAST programs
+evolution_features = frozenset(("cons_bls", "selec_phylop"))
+
+# Default worker thread of the in-process features computed by `calc_scores_async` (one target at a time as the
+# libraries and default caches aren't thread-safe)
+_inprocess_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="mirmap-scores")
+
+
+def get_features_closure(features, models=None):
+    """Return requested features with all the features they depend on.
+
+    Args:
+        features: Requested features
+        models: miRmap models used to compute the *miRmap* score
+    """
+    if models is None:
+        models = model.full_mirmap_models
+    closure = set()
+    features = list(features)
+    while len(features) > 0:
+        feature = features.pop()
+        if feature not in feature_dependencies:
+            raise ValueError(f"Unknown feature {feature}")
+        if feature not in closure:
+            closure.add(feature)
+            features.extend(feature_dependencies[feature])
+            if feature == "mirmap_score":
+                for mirmap_model in models.values():
+                    features.extend(field.name for field in fields(mirmap_model) if field.name != "intercept")
+    return closure
+
+
+# Sync and async functions computing the evolutionary features
+_evolution_funcs = {
+    "cons_bls": (evolution.calc_cons_bls, evolution.calc_cons_bls_async),
+    "selec_phylop": (evolution.calc_selec_phylop, evolution.calc_selec_phylop_async),
+}
+
+
+def _get_evolution_calls(
+    target,
+    features,
+    path_aln,
+    path_mod,
+    tree,
+    path_phylofit,
+    path_phylop,
+    aln_index,
+    phylofit_cache,
+    selec_phylop,
+    phylo_backend,
+):
+    """Return the evolutionary scores known without computation and the arguments of the functions computing the others.
+
+    Returns:
+        Dictionary of scores and dictionary of keyword arguments of `_evolution_funcs` by feature
+    """
+    scores = {}
+    calls = {}
+    if "cons_bls" in features:
+        scores["cons_bls"] = 0.0
+    if "selec_phylop" in features:
+        scores["selec_phylop"] = 1.0
+    if (path_aln is not None or aln_index is not None) and ("cons_bls" in features or "selec_phylop" in features):
+        if aln_index is not None:
+            target_alns = aln_index.get_target_alns(target)
+        else:
+            target_alns = evolution.get_target_alns(target, aln_fname=path_aln)
+
+        # BLS
+        if "cons_bls" in features and tree is not None:
+            # Fitting the species tree
+            calls["cons_bls"] = {
+                "tree": tree,
+                "fitting_tree": True,
+                "aln_fname": path_aln,
+                "aln": aln_index.to_fasta() if path_aln is None else None,
+                "aln_hash": aln_index.get_hash() if path_aln is None else None,
+                "target_alns": target_alns,
+                "path_phyfit": path_phylofit,
+                "fit_cache": phylofit_cache,
+                "backend": phylo_backend,
+            }
+        elif "cons_bls" in features and path_mod is not None:
+            # Using fitted tree
+            calls["cons_bls"] = {
+                "tree": evolution.extract_tree_from_mod(mod_fname=path_mod),
+                "fitting_tree": False,
+                "target_alns": target_alns,
+            }
+
+        # PhyloP
+        if "selec_phylop" in features and selec_phylop is not None:
+            scores["selec_phylop"] = selec_phylop
+        elif "selec_phylop" in features and path_mod is not None:
+            calls["selec_phylop"] = {
+                "mod_fname": path_mod,
+                "target_alns": target_alns,
+                "path_phylop": path_phylop,
+                "backend": phylo_backend,
+            }
+    return scores, calls
+
+
+async def _calc_evolution_scores_async(semaphore, *args):
+    """Compute the evolutionary scores with the async functions (evolutionary calls prepared in a thread).
+
+    Args:
+        semaphore: asyncio.Semaphore limiting the number of concurrent PHAST programs (unlimited if None)
+        *args: Arguments of `_get_evolution_calls`
+    """
+    scores, calls = await asyncio.get_running_loop().run_in_executor(None, _get_evolution_calls, *args)
+    scores |= zip(
+        calls.keys(),
+        await asyncio.gather(
+            *[_evolution_funcs[name][1](**kwargs, semaphore=semaphore) for name, kwargs in calls.items()]
+        ),
+        strict=True,
+    )
+    return scores
+
+
 def calc_scores(
     target,
     rna_md=None,
@@ -53,8 +200,20 @@ def calc_scores(
     if_spatt=None,
     path_phylofit=None,
     path_phylop=None,
+    dg_open_cache=None,
+    dg_open_method="exact",
+    fold_cache=None,
+    seed_duplex_table=None,
+    features=None,
+    models=None,
+    aln_index=None,
+    phylofit_cache=evolution.phylofit_cache,
+    selec_phylop=None,
+    phylo_backend="phast",
 ):
-    """Compute all scores including *miRmap* score.
+    """Compute scores including *miRmap* score.
+
+    Only the requested features and the features they depend on are computed.
 
     Args:
         target: Target
@@ -62,72 +221,191 @@ def calc_scores(
         path_aln: Path to multiple sequence alignment
         path_mod: Path to evolutionary model
         tree: Newick species tree
-        if_spatt: Interface object to the Spatt library
+        if_spatt: Interface object to the Spatt library (*P.over exact* computed in-process if None)
         path_phylofit: Path to the phyloFit executable
         path_phylop: Path to the phyloP executable
+        dg_open_cache: Cache of *ΔG open* scores shared between targets (no caching if None)
+        dg_open_method: *ΔG open* computation with two window foldings per target (exact) or from the local
+            folding of the whole host sequence (plfold)
+        fold_cache: Cache of duplex foldings (no caching if None)
+        seed_duplex_table: SeedDuplexTable of *ΔG seed duplex* scores of the folding model (no table if None)
+        features: Requested features (all features if None)
+        models: miRmap models used to compute the *miRmap* score (full models if None)
+        aln_index: AlignmentIndex of the alignment at path_aln shared between targets (loaded if None). Alignment
+            used alone if path_aln is None (e.g. loaded from an `aln_store.AlnStore`)
+        phylofit_cache: PhyloFitCache of the species trees fitted on the alignments (no caching if None)
+        selec_phylop: Precomputed *PhyloP* score (e.g. from `evolution.calc_selec_phylop_batch`)
+        phylo_backend: Evolutionary features computed with the PHAST programs (phast) or in-process (numpy)
     """
+    if models is None:
+        models = model.full_mirmap_models
+    if features is None:
+        features = feature_dependencies.keys()
+    features = get_features_closure(features, models)
     scores = {}
 
     # TargetScan features
-    scores["tgs_au"] = targetscan.calc_tgs_au(target)
-    scores["tgs_position"] = targetscan.calc_tgs_position(target)
-    scores["tgs_pairing3p"] = targetscan.calc_tgs_pairing3p(target)
-    scores["tgs_score"] = targetscan.calc_tgs_score(
-        target,
-        score_tgs_au=scores["tgs_au"],
-        score_tgs_position=scores["tgs_position"],
-        score_tgs_pairing3p=scores["tgs_pairing3p"],
-    )
+    if "tgs_au" in features:
+        scores["tgs_au"] = targetscan.calc_tgs_au(target)
+    if "tgs_position" in features:
+        scores["tgs_position"] = targetscan.calc_tgs_position(target)
+    if "tgs_pairing3p" in features:
+        scores["tgs_pairing3p"] = targetscan.calc_tgs_pairing3p(target)
+    if "tgs_score" in features:
+        scores["tgs_score"] = targetscan.calc_tgs_score(
+            target,
+            score_tgs_au=scores["tgs_au"],
+            score_tgs_position=scores["tgs_position"],
+            score_tgs_pairing3p=scores["tgs_pairing3p"],
+        )
 
     # Thermodynamics features
-    scores |= thermo.calc_dg_duplex(target, md=rna_md)
-    scores |= thermo.calc_dg_duplex_seed(target, md=rna_md)
-    scores |= thermo.calc_dg_open(target, md=rna_md)
-    scores |= thermo.calc_dg_total(
-        target,
-        dg_duplex=scores["dg_duplex"],
-        dg_open=scores["dg_open"],
-        md=rna_md,
-    )
+    if "dg_duplex" in features or "dg_binding" in features:
+        scores |= thermo.calc_dg_duplex(target, md=rna_md, cache=fold_cache)
+    if "dg_duplex_seed" in features or "dg_binding_seed" in features:
+        scores |= thermo.calc_dg_duplex_seed(target, md=rna_md, table=seed_duplex_table)
+    if "dg_open" in features:
+        if dg_open_method == "exact":
+            scores |= thermo.calc_dg_open(target, md=rna_md, cache=dg_open_cache)
+        elif dg_open_method == "plfold":
+            scores |= thermo.calc_dg_open_plfold(target, md=rna_md)
+        else:
+            raise ValueError(f"Unknown ΔG open method {dg_open_method}")
+    if "dg_total" in features:
+        scores |= thermo.calc_dg_total(
+            target,
+            dg_duplex=scores["dg_duplex"],
+            dg_open=scores["dg_open"],
+            md=rna_md,
+        )
 
     # Probabilistic features
-    scores["prob_exact"] = prob_exact.calc_prob_exact(target, if_spatt)
-    scores["prob_binomial"] = prob_binomial.calc_prob_binomial(target)
+    if "prob_exact" in features:
+        scores["prob_exact"] = prob_exact.calc_prob_exact(target, if_spatt)
+    if "prob_binomial" in features:
+        scores["prob_binomial"] = prob_binomial.calc_prob_binomial(target)
 
     # Evolutionary features
-    scores["cons_bls"] = 0.0
-    scores["selec_phylop"] = 1.0
-    if path_aln is not None:
-        target_alns = evolution.get_target_alns(target, aln_fname=path_aln)
+    evolution_scores, evolution_calls = _get_evolution_calls(
+        target,
+        features,
+        path_aln,
+        path_mod,
+        tree,
+        path_phylofit,
+        path_phylop,
+        aln_index,
+        phylofit_cache,
+        selec_phylop,
+        phylo_backend,
+    )
+    scores |= evolution_scores
+    for name, kwargs in evolution_calls.items():
+        scores[name] = _evolution_funcs[name][0](**kwargs)
 
-        # BLS
-        if tree is not None:
-            # Fitting the species tree
-            scores["cons_bls"] = evolution.calc_cons_bls(
-                tree=tree,
-                fitting_tree=True,
-                aln_fname=path_aln,
-                target_alns=target_alns,
-                path_phylofit=path_phylofit,
-            )
-        elif path_mod is not None:
-            # Using fitted tree
-            scores["cons_bls"] = evolution.calc_cons_bls(
-                tree=evolution.extract_tree_from_mod(mod_fname=path_mod),
-                fitting_tree=False,
-                target_alns=target_alns,
-            )
+    # miRmap score
+    if "mirmap_score" in features:
+        scores["mirmap_score"] = model.calc_mirmap(target, models, scores)
 
-        # PhyloP
-        if path_mod is not None:
-            scores["selec_phylop"] = evolution.calc_selec_phylop(
-                mod_fname=path_mod,
-                target_alns=target_alns,
-                path_phylop=path_phylop,
-            )
+    return scores
+
+
+async def calc_scores_async(
+    target,
+    rna_md=None,
+    path_aln=None,
+    path_mod=None,
+    tree=None,
+    if_spatt=None,
+    path_phylofit=None,
+    path_phylop=None,
+    dg_open_cache=None,
+    dg_open_method="exact",
+    fold_cache=None,
+    seed_duplex_table=None,
+    features=None,
+    models=None,
+    aln_index=None,
+    phylofit_cache=evolution.phylofit_cache,
+    selec_phylop=None,
+    phylo_backend="phast",
+    semaphore=None,
+    executor=None,
+):
+    """Compute scores like `calc_scores` running the PHAST programs concurrently with the in-process features.
+
+    The PHAST programs are run as subprocesses from the event loop while the other features are computed in a
+    worker thread, so that many targets can be scored concurrently from one event loop.
+
+    Args:
+        target: Target
+        rna_md: Folding model
+        path_aln: Path to multiple sequence alignment
+        path_mod: Path to evolutionary model
+        tree: Newick species tree
+        if_spatt: Interface object to the Spatt library (*P.over exact* computed in-process if None)
+        path_phylofit: Path to the phyloFit executable
+        path_phylop: Path to the phyloP executable
+        dg_open_cache: Cache of *ΔG open* scores shared between targets (no caching if None)
+        dg_open_method: *ΔG open* computation (exact or plfold, see `calc_scores`)
+        fold_cache: Cache of duplex foldings (no caching if None)
+        seed_duplex_table: SeedDuplexTable of *ΔG seed duplex* scores of the folding model (no table if None)
+        features: Requested features (all features if None)
+        models: miRmap models used to compute the *miRmap* score (full models if None)
+        aln_index: AlignmentIndex of the alignment shared between targets (see `calc_scores`)
+        phylofit_cache: PhyloFitCache of the species trees fitted on the alignments (no caching if None)
+        selec_phylop: Precomputed *PhyloP* score (e.g. from `evolution.calc_selec_phylop_batch`)
+        phylo_backend: Evolutionary features computed with the PHAST programs (phast) or in-process (numpy)
+        semaphore: asyncio.Semaphore limiting the number of concurrent PHAST programs (unlimited if None)
+        executor: concurrent.futures.Executor computing the in-process features (one worker thread shared by all
+            calls if None)
+    """
+    if models is None:
+        models = model.full_mirmap_models
+    if features is None:
+        features = feature_dependencies.keys()
+    features = get_features_closure(features, models)
+
+    # In-process features
+    inprocess_scores = asyncio.get_running_loop().run_in_executor(
+        _inprocess_executor if executor is None else executor,
+        functools.partial(
+            calc_scores,
+            target,
+            rna_md,
+            if_spatt=if_spatt,
+            dg_open_cache=dg_open_cache,
+            dg_open_method=dg_open_method,
+            fold_cache=fold_cache,
+            seed_duplex_table=seed_duplex_table,
+            features=features - evolution_features - {"mirmap_score"},
+            models=models,
+        ),
+    )
+
+    # Evolutionary features
+    evolution_scores = _calc_evolution_scores_async(
+        semaphore,
+        target,
+        features,
+        path_aln,
+        path_mod,
+        tree,
+        path_phylofit,
+        path_phylop,
+        aln_index,
+        phylofit_cache,
+        selec_phylop,
+        phylo_backend,
+    )
+
+    # Both awaited together (exceptions of either retrieved)
+    scores, evolution_scores = await asyncio.gather(inprocess_scores, evolution_scores)
+    scores |= evolution_scores
 
     # miRmap score
-    scores["mirmap_score"] = model.calc_mirmap(target, model.full_mirmap_models, scores)
+    if "mirmap_score" in features:
+        scores["mirmap_score"] = model.calc_mirmap(target, models, scores)
 
     return scores
 
@@ -140,7 +418,8 @@ def agg_scores(targets_scores):
     """
     agg_scores = {}
     for name, fn in score_agg_funcs.items():
-        agg_scores[name] = fn([target[name] for target in targets_scores])
+        if name in targets_scores[0]:
+            agg_scores[name] = fn([target[name] for target in targets_scores])
     return agg_scores
 
 
@@ -152,5 +431,6 @@ def report_scores(scores):
     """
     lines = []
     for name, label in score_labels.items():
-        lines.append(f" {label:<25}{scores[name]:.4}")
+        if name in scores:
+            lines.append(f" {label:<25}{scores[name]:.4}")
     return "\n".join(lines)
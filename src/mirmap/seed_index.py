@@ -0,0 +1,254 @@
+#
+# Copyright © 2024 Charles E. Vejnar
+#
+# This is free software, licensed under the GNU General Public License v3.
+# See /LICENSE for more information.
+#
+
+"""Inverted index of seed positions in transcripts stored on disk."""
+
+import mmap
+import struct
+
+import numpy as np
+
+from . import utils
+from .interval import Interval
+from .target import _new_target
+
+
+INDEX_MAGIC = b"MIRMAPSI"
+INDEX_VERSION = 1
+
+_header = struct.Struct("<8sIII")
+_section = struct.Struct("<QQ")
+
+# Nucleotide to 2-bit code (255 for nucleotides outside the index alphabet)
+_nt_codes = np.full(256, 255, dtype=np.uint8)
+_nt_codes[list(b"ACGT")] = np.arange(4, dtype=np.uint8)
+
+
+def _encode_kmers(seq, kmer_length):
+    """Return the 2-bit code of every k-mer of sequence and the start positions of the k-mers made of ACGT only."""
+    codes = _nt_codes[np.frombuffer(seq.encode("ascii"), dtype=np.uint8)]
+    nkmer = len(codes) - kmer_length + 1
+    if nkmer <= 0:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32)
+    # Windows containing unknown nucleotide(s)
+    unknowns = np.concatenate(([0], np.cumsum(codes == 255)))
+    valid = (unknowns[kmer_length:] - unknowns[:nkmer]) == 0
+    # Rolling code
+    codes = np.where(codes == 255, 0, codes).astype(np.uint32)
+    kmers = np.zeros(nkmer, dtype=np.uint32)
+    for i in range(kmer_length):
+        kmers = (kmers << 2) | codes[i : i + nkmer]
+    positions = np.flatnonzero(valid).astype(np.uint32)
+    return kmers[positions], positions
+
+
+def _encode_kmer(kmer):
+    """Return the 2-bit code of a k-mer (None if it includes nucleotide(s) outside ACGT, which aren't indexed)."""
+    code = 0
+    for nt in kmer.encode("ascii"):
+        if _nt_codes[nt] == 255:
+            return None
+        code = (code << 2) | int(_nt_codes[nt])
+    return code
+
+
+def _write_section(f, array):
+    """Write array aligned on 8 bytes and return its section coordinates."""
+    f.write(b"\0" * (-f.tell() % 8))
+    offset = f.tell()
+    data = array.tobytes()
+    f.write(data)
+    return offset, len(data)
+
+
+def build_seed_index(index_fname, seqs, kmer_lengths=(6, 7)):
+    """Build the inverted index of all k-mer positions in host sequences.
+
+    Sequences are expected in the uppercase DNA alphabet. K-mers including nucleotide(s) outside ACGT aren't indexed.
+
+    Args:
+        index_fname: Index filename
+        seqs: Dictionary or iterable of (ID, sequence) of host sequences
+        kmer_lengths: List of k-mer length(s) to index (i.e. seed lengths)
+    """
+    if isinstance(seqs, dict):
+        seqs = seqs.items()
+    kmer_lengths = sorted(set(kmer_lengths))
+    names = []
+    seq_offsets = [0]
+    seq_chunks = []
+    kmers = {k: [] for k in kmer_lengths}
+    postings = {k: [] for k in kmer_lengths}
+    for tidx, (name, seq) in enumerate(seqs):
+        names.append(name)
+        seq_chunks.append(seq.encode("ascii"))
+        seq_offsets.append(seq_offsets[-1] + len(seq))
+        for k in kmer_lengths:
+            codes, positions = _encode_kmers(seq, k)
+            kmers[k].append(codes)
+            postings[k].append(np.column_stack((np.full(len(positions), tidx, dtype=np.uint32), positions)))
+
+    with open(index_fname, "wb") as f:
+        # Header with placeholder sections
+        f.write(_header.pack(INDEX_MAGIC, INDEX_VERSION, len(names), len(kmer_lengths)))
+        f.write(struct.pack(f"<{len(kmer_lengths)}I", *kmer_lengths))
+        sections_offset = f.tell()
+        f.write(b"\0" * _section.size * (3 + 2 * len(kmer_lengths)))
+        # Transcripts
+        sections = [
+            _write_section(f, np.frombuffer("\n".join(names).encode("utf-8"), dtype=np.uint8)),
+            _write_section(f, np.array(seq_offsets, dtype="<u8")),
+            _write_section(f, np.frombuffer(b"".join(seq_chunks), dtype=np.uint8)),
+        ]
+        # K-mers
+        for k in kmer_lengths:
+            if len(kmers[k]) > 0:
+                k_kmers = np.concatenate(kmers[k])
+                k_postings = np.concatenate(postings[k])
+            else:
+                k_kmers = np.empty(0, dtype=np.uint32)
+                k_postings = np.empty((0, 2), dtype=np.uint32)
+            order = np.argsort(k_kmers, kind="stable")
+            kmer_offsets = np.zeros(4**k + 1, dtype="<u8")
+            np.cumsum(np.bincount(k_kmers, minlength=4**k), out=kmer_offsets[1:])
+            sections.append(_write_section(f, kmer_offsets))
+            sections.append(_write_section(f, k_postings[order].astype("<u4")))
+        # Sections
+        f.seek(sections_offset)
+        for section in sections:
+            f.write(_section.pack(*section))
+
+
+class SeedIndex:
+    """Memory-mapped inverted index of seed positions in host sequences."""
+
+    def __init__(self, index_fname):
+        """Open index."""
+        self._file = open(index_fname, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, ntranscript, nkmer_length = _header.unpack_from(self._mmap, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{index_fname} isn't a seed index (version {INDEX_VERSION})")
+        self.kmer_lengths = list(struct.unpack_from(f"<{nkmer_length}I", self._mmap, _header.size))
+        sections_offset = _header.size + 4 * nkmer_length
+        sections = [
+            _section.unpack_from(self._mmap, sections_offset + i * _section.size) for i in range(3 + 2 * nkmer_length)
+        ]
+        # Transcripts
+        names = self._mmap[sections[0][0] : sections[0][0] + sections[0][1]].decode("utf-8")
+        self.transcript_ids = names.split("\n") if ntranscript > 0 else []
+        self._transcript_idxs = None
+        self._seq_offsets = self._view(sections[1], "<u8")
+        self._seqs_offset = sections[2][0]
+        # K-mers
+        self._kmer_offsets = {}
+        self._postings = {}
+        for i, k in enumerate(self.kmer_lengths):
+            self._kmer_offsets[k] = self._view(sections[3 + 2 * i], "<u8")
+            self._postings[k] = self._view(sections[4 + 2 * i], "<u4").reshape(-1, 2)
+
+    def _view(self, section, dtype):
+        offset, length = section
+        return np.frombuffer(self._mmap, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=offset)
+
+    def __len__(self):
+        """Number of indexed host sequences."""
+        return len(self.transcript_ids)
+
+    def __enter__(self):
+        """Enter context."""
+        return self
+
+    def __exit__(self, *args):
+        """Close index when exiting context."""
+        self.close()
+
+    def close(self):
+        """Close index."""
+        self._seq_offsets = self._kmer_offsets = self._postings = None
+        self._mmap.close()
+        self._file.close()
+
+    def get_seq(self, transcript_id):
+        """Return indexed host sequence.
+
+        Args:
+            transcript_id: Host sequence ID
+        """
+        if self._transcript_idxs is None:
+            self._transcript_idxs = {name: i for i, name in enumerate(self.transcript_ids)}
+        return self._get_seq(self._transcript_idxs[transcript_id])
+
+    def _get_seq(self, tidx):
+        start = self._seqs_offset + int(self._seq_offsets[tidx])
+        end = self._seqs_offset + int(self._seq_offsets[tidx + 1])
+        return self._mmap[start:end].decode("ascii")
+
+    def _scan(self, kmer):
+        """Return the (host sequence index, start) of all (overlapping) occurrences of k-mer."""
+        postings = []
+        for tidx in range(len(self.transcript_ids)):
+            host_seq = self._get_seq(tidx)
+            start = host_seq.find(kmer)
+            while start >= 0:
+                postings.append((tidx, start))
+                start = host_seq.find(kmer, start + 1)
+        return postings
+
+    def find_targets_with_seed(self, mirna_seq, seed_start_on_mirna=1, seed_lengths=None):
+        """Find target sites in all indexed host sequences searching for miRNA seeds.
+
+        Returned targets are identical to calling `target.find_targets_with_seed` on each host sequence. Seeds with
+        nucleotide(s) outside ACGT (e.g. N) aren't indexed and are searched by scanning all host sequences.
+
+        Args:
+            mirna_seq: miRNA sequence
+            seed_start_on_mirna: Start position of the seed in the miRNA (from the 5')
+            seed_lengths: List of seed length(s)
+
+        Returns:
+            Dictionary of targets by host sequence ID (only including host sequences with target(s))
+        """
+        # Parameter
+        if seed_lengths is None:
+            seed_lengths = [6, 7]
+        for seed_length in seed_lengths:
+            if seed_length not in self._postings:
+                raise ValueError(f"Seed length {seed_length} isn't indexed")
+
+        # Hits by host sequence with longest seed per seed end position
+        hits = {}
+        for seed_length in sorted(set(seed_lengths), reverse=True):
+            seed_seq = mirna_seq[seed_start_on_mirna : seed_start_on_mirna + seed_length]
+            if len(seed_seq) != seed_length:
+                continue
+            kmer = utils.reverse_complement(seed_seq)
+            code = _encode_kmer(kmer)
+            if code is None:
+                # K-mers outside ACGT aren't indexed: host sequences scanned for the literal k-mer
+                postings = self._scan(kmer)
+            else:
+                kmer_offsets = self._kmer_offsets[seed_length]
+                postings = self._postings[seed_length][kmer_offsets[code] : kmer_offsets[code + 1]].tolist()
+            for tidx, start in postings:
+                tidx_hits = hits.setdefault(tidx, {})
+                if start + seed_length not in tidx_hits:
+                    tidx_hits[start + seed_length] = (start, seed_seq)
+
+        # Targets
+        targets = {}
+        for tidx in sorted(hits):
+            host_seq = self._get_seq(tidx)
+            host_targets = []
+            for end in sorted(hits[tidx], reverse=True):
+                start, seed_seq = hits[tidx][end]
+                target = _new_target(host_seq, mirna_seq, Interval(start, end), seed_seq, seed_start_on_mirna)
+                if target is not None:
+                    host_targets.append(target)
+            if len(host_targets) > 0:
+                targets[self.transcript_ids[tidx]] = host_targets
+        return targets
@@ -42,6 +42,23 @@ class Target:
         return "\n".join(lines)
 
 
+def _new_target(host_seq, mirna_seq, seed_interval, seed_seq, seed_start_on_mirna):
+    """Create Target from seed interval or return None if the miRNA isn't fully within the host sequence."""
+    # Check miRNA is fully within the host sequence
+    if (
+        seed_interval.start < (len(mirna_seq) - len(seed_seq) - seed_start_on_mirna)
+        or seed_interval.end > len(host_seq) - seed_start_on_mirna
+    ):
+        return None
+    mirna_interval = Interval(
+        seed_interval.end - len(mirna_seq) + seed_start_on_mirna, seed_interval.end + seed_start_on_mirna
+    )
+    # Check interval, length and sequence fit together
+    assert len(seed_interval) == len(seed_seq), f"{len(seed_interval)} must be == {len(seed_seq)}"
+    assert len(mirna_interval) == len(mirna_seq), f"{len(mirna_interval)} must be == {len(mirna_seq)}"
+    return Target(host_seq, mirna_interval, mirna_seq, seed_interval, seed_seq, seed_start_on_mirna)
+
+
 def find_targets_with_seed(host_seq, mirna_seq, seed_start_on_mirna=1, seed_lengths=None):
     """Find target sites in host sequence searching for miRNA seeds.
 
@@ -62,25 +79,64 @@ def find_targets_with_seed(host_seq, mirna_seq, seed_start_on_mirna=1, seed_leng
         seed_seq = mirna_seq[seed_start_on_mirna : seed_start_on_mirna + seed_length]
         for m in re.finditer(rf"(?=({seed_seq}))", host_seq_rc):
             seed_interval = Interval(len(host_seq) - m.end(1), len(host_seq) - m.start(1))
-            # Check miRNA is fully within the host sequence
-            if (
-                seed_interval.start < (len(mirna_seq) - len(seed_seq) - seed_start_on_mirna)
-                or seed_interval.end > len(host_seq) - seed_start_on_mirna
-            ):
-                continue
             if seed_interval.end not in target_ends:
-                mirna_interval = Interval(
-                    seed_interval.end - len(mirna_seq) + seed_start_on_mirna, seed_interval.end + seed_start_on_mirna
-                )
-                # Check interval, length and sequence fit together
-                assert len(seed_interval) == seed_length, f"{len(seed_interval)} must be == {seed_length}"
-                assert len(mirna_interval) == len(mirna_seq), f"{len(mirna_interval)} must be == {len(mirna_seq)}"
-                targets.append(
-                    Target(host_seq, mirna_interval, mirna_seq, seed_interval, seed_seq, seed_start_on_mirna)
-                )
-                target_ends.add(seed_interval.end)
+                target = _new_target(host_seq, mirna_seq, seed_interval, seed_seq, seed_start_on_mirna)
+                if target is not None:
+                    targets.append(target)
+                    target_ends.add(seed_interval.end)
 
     # Sort targets by their seed end position
     targets.sort(key=lambda x: x.seed.end, reverse=True)
 
     return targets
+
+
+def find_targets_with_seeds(host_seq, mirna_seqs, seed_start_on_mirna=1, seed_lengths=None):
+    """Find target sites of multiple miRNAs in host sequence in a single pass.
+
+    The reverse complements of all miRNA seeds are hashed by sequence and every seed-length
+    window of the host sequence is looked up once. Returned targets are identical to calling
+    `find_targets_with_seed` for each miRNA.
+
+    Args:
+        host_seq: Host sequence
+        mirna_seqs: Dictionary of miRNA sequences by miRNA ID
+        seed_start_on_mirna: Start position of the seed in the miRNA (from the 5')
+        seed_lengths: List of seed length(s)
+    """
+    # Parameter
+    if seed_lengths is None:
+        seed_lengths = [6, 7]
+    seed_lengths = sorted(set(seed_lengths), reverse=True)
+
+    # Seed index: target seed sequence on the host (i.e. reverse complement of miRNA seed) to miRNA IDs
+    seed_index = {seed_length: {} for seed_length in seed_lengths}
+    for mirna_id, mirna_seq in mirna_seqs.items():
+        for seed_length in seed_lengths:
+            seed_seq = mirna_seq[seed_start_on_mirna : seed_start_on_mirna + seed_length]
+            # Skip seeds truncated by the miRNA end
+            if len(seed_seq) == seed_length:
+                seed_index[seed_length].setdefault(utils.reverse_complement(seed_seq), []).append((mirna_id, seed_seq))
+
+    # Scan
+    hits = {mirna_id: {} for mirna_id in mirna_seqs}
+    for start in range(len(host_seq)):
+        for seed_length in seed_lengths:
+            for mirna_id, seed_seq in seed_index[seed_length].get(host_seq[start : start + seed_length], ()):
+                # Longest seed wins for a given seed end position
+                end = start + seed_length
+                if end not in hits[mirna_id] or len(hits[mirna_id][end][1]) < seed_length:
+                    hits[mirna_id][end] = (start, seed_seq)
+
+    # Targets
+    targets = {}
+    for mirna_id, mirna_seq in mirna_seqs.items():
+        mirna_targets = []
+        for end in sorted(hits[mirna_id], reverse=True):
+            start, seed_seq = hits[mirna_id][end]
+            target = _new_target(host_seq, mirna_seq, Interval(start, end), seed_seq, seed_start_on_mirna)
+            if target is not None:
+                mirna_targets.append(target)
+        targets[mirna_id] = mirna_targets
+
+    return targets
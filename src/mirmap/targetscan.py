@@ -7,8 +7,11 @@
 
 """TargetScan features."""
 
+import functools
 import operator
 
+import numpy as np
+
 from .targetscan_model import ts_types
 
 
@@ -39,6 +42,18 @@ def _binarize(c):
         return 0.0
 
 
+@functools.lru_cache(maxsize=None)
+def _get_ca_normalizers(weights_up, weights_down):
+    """Return the normalizers of the *AU content* score for all lengths of the upstream and downstream windows."""
+    return (
+        [
+            sum(map(operator.truediv, [1.0] * length, weights_up[len(weights_up) - length :]))
+            for length in range(len(weights_up) + 1)
+        ],
+        [sum(map(operator.truediv, [1.0] * length, weights_down[:length])) for length in range(len(weights_down) + 1)],
+    )
+
+
 def calc_tgs_au(target, ts_type=None, ts_types=ts_types, ca_window_length=30, with_correction=False):
     """Calculate the *AU content* score.
 
@@ -66,9 +81,8 @@ def calc_tgs_au(target, ts_type=None, ts_types=ts_types, ca_window_length=30, wi
         content = sum(map(operator.truediv, map(_binarize, seq_up), wup)) + sum(
             map(operator.truediv, map(_binarize, seq_down), wdn)
         )
-        content = content / (
-            sum(map(operator.truediv, [1.0] * len(wup), wup)) + sum(map(operator.truediv, [1.0] * len(wdn), wdn))
-        )
+        norms_up, norms_down = _get_ca_normalizers(tuple(tts.ca_weights_up), tuple(tts.ca_weights_down))
+        content = content / (norms_up[len(wup)] + norms_down[len(wdn)])
         if with_correction:
             return content * tts.ca_fc_slope + tts.ca_fc_intercept - tts.fc_mean
         else:
@@ -77,6 +91,79 @@ def calc_tgs_au(target, ts_type=None, ts_types=ts_types, ca_window_length=30, wi
         return None
 
 
+def calc_tgs_au_batch(targets, ts_types=ts_types, ca_window_length=30, with_correction=False):
+    """Calculate the *AU content* scores of all targets on a host sequence.
+
+    The host sequence is encoded once and the windows of all targets are gathered together. Terms are summed in
+    the order of `calc_tgs_au` so that scores are identical.
+
+    Args:
+        targets: List of targets on the same host sequence
+        ts_types: TargetScan model parameters
+        ca_window_length: Sequence window length used to compute the TargetScan score
+        with_correction: Apply the linear regression correction or not
+
+    Returns:
+        List of scores in the order of targets
+    """
+    scores = [None] * len(targets)
+    if len(targets) == 0:
+        return scores
+    host_seq = targets[0].host_seq
+    assert all(target.host_seq is host_seq or target.host_seq == host_seq for target in targets), (
+        "Targets must be on the same host sequence"
+    )
+    # AU indicator of host sequence
+    au = np.isin(np.frombuffer(host_seq.encode("ascii"), dtype=np.uint8), np.frombuffer(b"AT", dtype=np.uint8))
+    au = au.astype(np.float64)
+    # Targets by site type
+    itargets_types = {}
+    for itarget, target in enumerate(targets):
+        ts_type = get_targetscan_ts_type(target.seed_length, host_seq[target.seed.end])
+        if ts_type:
+            itargets_types.setdefault(ts_type, []).append(itarget)
+    window = np.arange(ca_window_length)
+    for ts_type, itargets in itargets_types.items():
+        tts = ts_types[ts_type]
+        ends = np.array([targets[i].seed.end for i in itargets])
+        ups = ends + 1 + tts.up_shift
+        # Windows outside sequence (wrapping or clipped slices) and short weights computed per target
+        regular = (ups >= 0) & (ups <= len(host_seq)) & (ends + tts.down_shift >= 0)
+        if len(tts.ca_weights_up) < ca_window_length or len(tts.ca_weights_down) < ca_window_length:
+            regular[:] = False
+        for i in np.flatnonzero(~regular):
+            scores[itargets[i]] = calc_tgs_au(
+                targets[itargets[i]], ts_type, ts_types, ca_window_length, with_correction
+            )
+        itargets = [itargets[i] for i in np.flatnonzero(regular)]
+        if len(itargets) == 0:
+            continue
+        # Windows (upstream aligned on their end, downstream on their start)
+        pos_up = ups[regular, None] - ca_window_length + window
+        pos_down = ends[regular, None] + tts.down_shift + window
+        valid_up = pos_up >= 0
+        valid_down = pos_down < len(host_seq)
+        weights_up = np.array(tts.ca_weights_up[len(tts.ca_weights_up) - ca_window_length :])
+        weights_down = np.array(tts.ca_weights_down[:ca_window_length])
+        terms_up = np.where(valid_up, au[np.clip(pos_up, 0, len(host_seq) - 1)], 0.0) / weights_up
+        terms_down = np.where(valid_down, au[np.clip(pos_down, 0, len(host_seq) - 1)], 0.0) / weights_down
+        # Sums from left to right (missing positions add zeros before upstream and after downstream terms)
+        content_up = np.zeros(len(itargets))
+        content_down = np.zeros(len(itargets))
+        for i in range(ca_window_length):
+            content_up += terms_up[:, i]
+            content_down += terms_down[:, i]
+        norms_up, norms_down = _get_ca_normalizers(tuple(tts.ca_weights_up), tuple(tts.ca_weights_down))
+        content = (content_up + content_down) / (
+            np.array(norms_up)[valid_up.sum(axis=1)] + np.array(norms_down)[valid_down.sum(axis=1)]
+        )
+        if with_correction:
+            content = content * tts.ca_fc_slope + tts.ca_fc_intercept - tts.fc_mean
+        for itarget, score in zip(itargets, content.tolist(), strict=True):
+            scores[itarget] = score
+    return scores
+
+
 def calc_tgs_position(target, ts_type=None, ts_types=ts_types, with_correction=False):
     """Calculate the *UTR position* score.
 
@@ -143,6 +230,53 @@ def _align(utr_3p_seq, mir_3p_seq, mir_offset, utr_offset, overhang):
     return score
 
 
+@functools.lru_cache(maxsize=None)
+def _get_pairing():
+    """Return the Watson-Crick pairs between UTR (rows) and miRNA (columns) ASCII codes."""
+    pairing = np.zeros((256, 256), dtype=bool)
+    for utr_nt, mir_nt in ["AT", "TA", "GC", "CG"]:
+        pairing[ord(utr_nt), ord(mir_nt)] = True
+    return pairing
+
+
+@functools.lru_cache(maxsize=None)
+def _get_diagonals(utr_length, mir_length, overhang):
+    """Return the UTR and miRNA positions along all offsets, the pairing weights and the offset penalties."""
+    noffset = max(utr_length, mir_length)
+    offsets = np.arange(noffset)
+    zeros = np.zeros(noffset, dtype=np.intp)
+    positions = np.arange(noffset)
+    # Diagonals shifted on miRNA then on UTR (positions outside sequences set to sequence lengths)
+    utr_idxs = np.minimum(np.concatenate([zeros, offsets])[:, None] + positions, utr_length)
+    mir_idxs = np.minimum(np.concatenate([offsets, zeros])[:, None] + positions, mir_length)
+    weights = np.where((mir_idxs - overhang >= 4) & (mir_idxs - overhang <= 7), 1.0, 0.5)
+    penalties = np.maximum(0, (np.concatenate([offsets, offsets]) - 2) / 2.0)
+    return utr_idxs, mir_idxs, weights, penalties
+
+
+@functools.lru_cache(maxsize=65536)
+def _align_offsets(utr_3p_seq, mir_3p_seq, overhang):
+    """Return the best score of `_align` over all offsets of the miRNA and of the UTR sequences.
+
+    All offsets are the diagonals of the pairing matrix between the sequences. Each diagonal is scored at once
+    from the cumulative sums of pairing weights: the best run of at least 2 consecutive pairs minus the offset
+    penalty.
+    """
+    utr_idxs, mir_idxs, weights, penalties = _get_diagonals(len(utr_3p_seq), len(mir_3p_seq), overhang)
+    # Pairing matrix padded with an unpaired row and column
+    pairs = np.zeros((len(utr_3p_seq) + 1, len(mir_3p_seq) + 1), dtype=bool)
+    pairs[:-1, :-1] = _get_pairing()[
+        np.frombuffer(utr_3p_seq.encode("ascii"), dtype=np.uint8)[:, None],
+        np.frombuffer(mir_3p_seq.encode("ascii"), dtype=np.uint8)[None, :],
+    ]
+    paired = pairs[utr_idxs, mir_idxs]
+    # Runs of pairs: score since last unpaired position (kept from the second pair of runs)
+    cumsums = np.cumsum(weights * paired, axis=1)
+    run_scores = cumsums - np.maximum.accumulate(np.where(paired, 0.0, cumsums), axis=1)
+    scores = np.where(paired[:, 1:] & paired[:, :-1], run_scores[:, 1:], 0.0).max(axis=1, initial=0.0)
+    return float((scores - penalties).max())
+
+
 def calc_tgs_pairing3p(target, ts_type=None, ts_types=ts_types, with_correction=False):
     """Calculate the *3' pairing* score.
 
@@ -161,16 +295,11 @@ def calc_tgs_pairing3p(target, ts_type=None, ts_types=ts_types, with_correction=
             - tts.pa_mirna_seed_start
         ][::-1]
         mir_3p_seq = target.mirna_seq[tts.pa_mirna_seed_start :]
-        maxscore = max(len(utr_3p_seq), len(mir_3p_seq))
-        scores_mir = []
-        scores_utr = []
-        for offset in range(maxscore):
-            scores_mir.append(_align(utr_3p_seq, mir_3p_seq, offset, 0, tts.pa_mirna_seed_overhang))
-            scores_utr.append(_align(utr_3p_seq, mir_3p_seq, 0, offset, tts.pa_mirna_seed_overhang))
+        score = _align_offsets(utr_3p_seq, mir_3p_seq, tts.pa_mirna_seed_overhang)
         if with_correction:
-            return float(max(scores_mir + scores_utr)) * tts.pa_fc_slope + tts.pa_fc_intercept - tts.fc_mean
+            return score * tts.pa_fc_slope + tts.pa_fc_intercept - tts.fc_mean
         else:
-            return float(max(scores_mir + scores_utr))
+            return score
     else:
         return None
 
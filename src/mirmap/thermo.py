@@ -7,19 +7,177 @@
 
 """Thermodynamics features."""
 
-from .if_lib_viennarna import RNAfold, get_model_details
+import array
+import itertools
+import json
+import math
+import struct
+
+from ViennaRNA import RNA
+
+from . import utils
+from .if_lib_viennarna import (
+    RNAfold,
+    RNAplfold_unpaired,
+    get_model_details,
+    get_model_details_from_key,
+    get_model_details_key,
+)
+
+
+class DgOpenCache:
+    """Cache of *ΔG open* scores used by `calc_dg_open`.
+
+    Entries are keyed by the folded sequence window, the constraint and the folding model, independently of the
+    miRNA sequence, making them reusable by all miRNAs targeting the same site.
+
+    Args:
+        maxsize: Maximum number of cached *ΔG open* scores
+    """
+
+    def __init__(self, maxsize=100000):
+        """Create new empty cache."""
+        self.dg_open = utils.LRUCache(maxsize)
+
+    def clear(self):
+        """Remove all entries and reset counters."""
+        self.dg_open.clear()
+
+    def info(self):
+        """Return hits and misses."""
+        return {"dg_open": self.dg_open.info()}
+
+
+class Accessibility:
+    """Accessibility of all segments of a host sequence computed with local folding (RNAplfold-style).
+
+    Args:
+        host_seq: Host sequence
+        max_unpaired_length: Maximum length of unpaired segments
+        window_size: Size of the sliding folding window
+        max_bp_span: Maximum distance between two paired nucleotides
+        md: Folding model
+    """
+
+    def __init__(self, host_seq, max_unpaired_length=80, window_size=200, max_bp_span=150, md=None):
+        """Fold host sequence and compute unpaired probabilities."""
+        # Default model
+        if md is None:
+            md = _get_default_md()
+        self.max_unpaired_length = max_unpaired_length
+        self.kT = (md.temperature + RNA.K0) * RNA.GASCONST / 1000.0
+        self.unpaired = RNAplfold_unpaired(host_seq, max_unpaired_length, window_size, max_bp_span, md=md)
+
+    def get_dg_open(self, start, end):
+        """Return the energy needed to open segment [start, end) (0-based) of host sequence."""
+        assert end - start <= self.max_unpaired_length, f"{end - start} must be <= {self.max_unpaired_length}"
+        prob = self.unpaired[end, end - start]
+        if prob > 0.0:
+            return -self.kT * math.log(prob)
+        else:
+            return math.inf
+
+
+class SeedDuplexTable:
+    """Lookup table of *ΔG seed duplex* and *ΔG seed binding* scores of all seeds for one folding model.
+
+    Seeds are paired with their perfectly complementary target seed, as found by `target.find_targets_with_seed`,
+    so entries are indexed by the miRNA seed only. Missing entries are folded and added on request.
+
+    Args:
+        md: Folding model
+        seed_lengths: List of seed length(s)
+    """
+
+    magic = b"MIRMAPSD"
+    version = 1
+
+    def __init__(self, md=None, seed_lengths=(6, 7)):
+        """Create new empty table."""
+        # Default model
+        if md is None:
+            md = _get_default_md()
+        self.md = md
+        self.md_key = get_model_details_key(md)
+        self.modified = False
+        self._values = {k: array.array("d", [math.nan]) * (2 * 4**k) for k in seed_lengths}
+
+    @staticmethod
+    def _encode(seed_seq):
+        code = 0
+        for nt in seed_seq:
+            code = code * 4 + "ACGT".index(nt)
+        return code
+
+    def get(self, seed_seq):
+        """Return *ΔG seed duplex* and *ΔG seed binding* scores of a seed or None if seed can't be stored."""
+        if len(seed_seq) not in self._values or not set(seed_seq).issubset("ACGT"):
+            return None
+        values = self._values[len(seed_seq)]
+        i = 2 * self._encode(seed_seq)
+        if math.isnan(values[i]):
+            result = RNAfold([utils.reverse_complement(seed_seq), seed_seq], partfunc=True, md=self.md)
+            values[i] = result.mfe
+            values[i + 1] = result.efe_binding
+            self.modified = True
+        return {"dg_duplex_seed": values[i], "dg_binding_seed": values[i + 1]}
+
+    def build(self):
+        """Fold all seeds."""
+        for seed_length in self._values:
+            for seed in itertools.product("ACGT", repeat=seed_length):
+                self.get("".join(seed))
+
+    def save(self, fname):
+        """Save table to binary file."""
+        header = json.dumps({"md_key": self.md_key, "seed_lengths": list(self._values)}).encode("utf-8")
+        with open(fname, "wb") as f:
+            f.write(struct.pack("<8sII", self.magic, self.version, len(header)))
+            f.write(header)
+            for values in self._values.values():
+                values.tofile(f)
+        self.modified = False
+
+    @classmethod
+    def load(cls, fname, md=None):
+        """Load table from binary file.
+
+        Args:
+            fname: Table filename
+            md: Folding model used to complete the table (defaults to the model the table was built with)
+        """
+        with open(fname, "rb") as f:
+            magic, version, header_length = struct.unpack("<8sII", f.read(16))
+            if magic != cls.magic or version != cls.version:
+                raise ValueError(f"{fname} isn't a seed duplex table (version {cls.version})")
+            header = json.loads(f.read(header_length).decode("utf-8"))
+            md_key = tuple(header["md_key"])
+            if md is None:
+                md = get_model_details_from_key(md_key)
+            elif get_model_details_key(md) != md_key:
+                raise ValueError(f"Folding model of {fname} doesn't match")
+            table = cls(md=md, seed_lengths=[])
+            for seed_length in header["seed_lengths"]:
+                table._values[seed_length] = array.array("d")
+                table._values[seed_length].fromfile(f, 2 * 4**seed_length)
+        return table
+
+
+# Default cache used by `calc_dg_open_plfold`
+accessibility_cache = utils.LRUCache(16)
 
 
 def _get_default_md():
     return get_model_details(min_loop_size=2)
 
 
-def calc_dg_duplex(target, md=None):
+def calc_dg_duplex(target, md=None, cache=None):
     """Compute the *ΔG duplex*, *ΔG binding* scores.
 
     Args:
         target: Target
         md: Folding model
+        cache: FoldCache object (no caching if None)
     """
     # Default model
     if md is None:
@@ -41,6 +199,7 @@ def calc_dg_duplex(target, md=None):
         constraint="".join(constraint_up + constraint_dn[::-1]),
         partfunc=True,
         md=md,
+        cache=cache,
     )
     return {
         "dg_duplex": result.mfe,
@@ -48,18 +207,28 @@ def calc_dg_duplex(target, md=None):
     }
 
 
-def calc_dg_duplex_seed(target, md=None):
+def calc_dg_duplex_seed(target, md=None, table=None):
     """Compute the *ΔG seed duplex* and *ΔG seed binding* scores.
 
+    Scores are read from (and added to) the seed duplex table if the target seed is complementary to the miRNA seed.
+
     Args:
         target: Target
         md: Folding model
+        table: SeedDuplexTable of the folding model (no table if None)
     """
     # Default model
     if md is None:
         md = _get_default_md()
     # Target seed binding sequence
     target_seed_seq = target.host_seq[target.seed.start : target.seed.end]
+    # Table
+    if table is not None and target_seed_seq == utils.reverse_complement(target.seed_seq):
+        if get_model_details_key(md) != table.md_key:
+            raise ValueError("Folding model of seed duplex table doesn't match")
+        result = table.get(target.seed_seq)
+        if result is not None:
+            return result
     # Fold
     result = RNAfold(
         [target_seed_seq, target.seed_seq],
@@ -72,7 +241,7 @@ def calc_dg_duplex_seed(target, md=None):
     }
 
 
-def calc_dg_open(target, upstream_rest=20, downstream_rest=20, dg_binding_area=70, md=None):
+def calc_dg_open(target, upstream_rest=20, downstream_rest=20, dg_binding_area=70, md=None, cache=None):
     """Compute the *ΔG open* score.
 
     Args:
@@ -81,6 +250,7 @@ def calc_dg_open(target, upstream_rest=20, downstream_rest=20, dg_binding_area=7
         downstream_rest: Downstream unfolding length
         dg_binding_area: Supplementary sequence length to fold (applied upstream and downstream)
         md: Folding model
+        cache: DgOpenCache object (no caching if None)
     """
     # Default model
     if md is None:
@@ -104,6 +274,12 @@ def calc_dg_open(target, upstream_rest=20, downstream_rest=20, dg_binding_area=7
     constraint = (
         "." * dg_binding_area + "x" * (upstream_rest + target.mirna_length + downstream_rest) + "." * dg_binding_area
     )
+    # Cache
+    if cache is not None:
+        key = (seq_for_dg_open, constraint, get_model_details_key(md))
+        dg_open = cache.dg_open.get(key)
+        if dg_open is not None:
+            return {"dg_open": dg_open}
     # Folding
     # dg0
     result_dg0 = RNAfold(
@@ -119,7 +295,54 @@ def calc_dg_open(target, upstream_rest=20, downstream_rest=20, dg_binding_area=7
         md=md,
     )
     # dg_open
-    return {"dg_open": result_dg1.efe - result_dg0.efe}
+    dg_open = result_dg1.efe - result_dg0.efe
+    if cache is not None:
+        cache.dg_open.put(key, dg_open)
+    return {"dg_open": dg_open}
+
+
+def calc_dg_open_plfold(
+    target,
+    upstream_rest=20,
+    downstream_rest=20,
+    window_size=200,
+    max_bp_span=150,
+    md=None,
+    cache=accessibility_cache,
+):
+    """Compute the *ΔG open* score from the local folding of the whole host sequence.
+
+    Host sequence is folded once (and cached) for all its targets. Unlike `calc_dg_open`, the opened segment is
+    truncated at host sequence ends instead of being extended with poly-A.
+
+    Args:
+        target: Target
+        upstream_rest: Upstream unfolding length
+        downstream_rest: Downstream unfolding length
+        window_size: Size of the sliding folding window
+        max_bp_span: Maximum distance between two paired nucleotides
+        md: Folding model
+        cache: LRUCache object of Accessibility objects (no caching if None)
+    """
+    # Default model
+    if md is None:
+        md = _get_default_md()
+    start = max(0, target.mirna.start - upstream_rest)
+    end = min(len(target.host_seq), target.mirna.end + downstream_rest)
+    # Accessibility
+    key = (target.host_seq, window_size, max_bp_span, get_model_details_key(md))
+    accessibility = cache.get(key) if cache is not None else None
+    if accessibility is None or accessibility.max_unpaired_length < end - start:
+        accessibility = Accessibility(
+            target.host_seq,
+            max_unpaired_length=max(80, end - start),
+            window_size=window_size,
+            max_bp_span=max_bp_span,
+            md=md,
+        )
+        if cache is not None:
+            cache.put(key, accessibility)
+    return {"dg_open": accessibility.get_dg_open(start, end)}
 
 
 def calc_dg_total(target, dg_duplex, dg_open, md=None):
@@ -7,9 +7,11 @@
 
 """Utility functions."""
 
+import collections
 import contextlib
 import gzip
 import itertools
+import mmap
 import os
 import pathlib
 import tempfile
@@ -46,30 +48,192 @@ def clean_seq(seq, alphabet, replace_string):
     return seq
 
 
+def open_text(fname):
+    """Open plain or gzipped (with .gz extension) text file for reading."""
+    if pathlib.Path(fname).suffix == ".gz":
+        return gzip.open(fname, "rt")
+    else:
+        return open(fname, "rt")
+
+
+def iter_fasta(fasta, as_string=False, upper=False):
+    """Parse FASTA yielding one (name, sequence) record at a time."""
+    with contextlib.nullcontext(fasta.split("\n")) if as_string else open_text(fasta) as ff:
+        name_seq = None
+        chunks = []
+        for line in ff:
+            line = line.strip()
+            if line.startswith(">"):
+                if name_seq is not None:
+                    yield name_seq, "".join(chunks)
+                name_seq = line[1:].strip()
+                chunks = []
+            elif upper:
+                chunks.append(line.upper())
+            else:
+                chunks.append(line)
+        if name_seq is not None:
+            yield name_seq, "".join(chunks)
+
+
+def iter_tab(fname):
+    """Parse tabulated file yielding the fields of one line at a time."""
+    with open_text(fname) as f:
+        for line in f:
+            line = line.rstrip()
+            if len(line) > 0:
+                yield tuple(line.split("\t"))
+
+
 def load_fasta(fasta, as_string=False, upper=False):
     """Parse FASTA."""
-    if as_string:
-        ff = fasta.split("\n")
-    else:
-        if pathlib.Path(fasta).suffix == ".gz":
-            ff = gzip.open(fasta, "rb")
+    return dict(iter_fasta(fasta, as_string=as_string, upper=upper))
+
+
+def build_fasta_index(fasta):
+    """Build faidx-compatible index of FASTA.
+
+    Returns:
+        Dictionary of (length, offset, line bases, line width) by sequence name (first word of header as in faidx)
+    """
+    index = {}
+    with open(fasta, "rb") as f:
+        offset = 0
+        name = None
+        for line in f:
+            if line.startswith(b">"):
+                fields = line[1:].decode("utf-8").split(maxsplit=1)
+                name = fields[0] if len(fields) > 0 else ""
+                if name in index:
+                    raise ValueError(f"Duplicate sequence {name} in {fasta}")
+                index[name] = [0, offset + len(line), 0, 0]
+                last_line = False
+            elif name is not None:
+                bases = len(line.rstrip(b"\r\n"))
+                entry = index[name]
+                if bases > 0:
+                    if last_line:
+                        raise ValueError(f"Sequence {name} in {fasta} has lines of different lengths")
+                    if entry[2] == 0:
+                        entry[2] = bases
+                        entry[3] = len(line)
+                    elif bases != entry[2] or len(line) != entry[3]:
+                        last_line = True
+                    entry[0] += bases
+                else:
+                    last_line = True
+            offset += len(line)
+    return {name: tuple(entry) for name, entry in index.items()}
+
+
+class IndexedFasta:
+    """Random access FASTA reader using a faidx-compatible index (.fai) and mmap.
+
+    Sequences are named by the first word of their header as samtools faidx does (`load_fasta` names sequences by
+    their full header). The index is built in memory or, if an index filename is given, read from this file (e.g.
+    written by samtools faidx) or built and written to it.
+
+    Args:
+        fasta: FASTA filename (uncompressed)
+        fname_index: Index filename (e.g. `<fasta>.fai`)
+    """
+
+    def __init__(self, fasta, fname_index=None):
+        """Open FASTA and load or build its index."""
+        if (
+            fname_index is not None
+            and os.path.exists(fname_index)
+            and os.path.getmtime(fname_index) >= os.path.getmtime(fasta)
+        ):
+            self.index = {}
+            with open(fname_index, "rt") as f:
+                for line in f:
+                    fields = line.rstrip("\n").split("\t")
+                    self.index[fields[0]] = tuple(map(int, fields[1:5]))
         else:
-            ff = open(fasta)
-    seqs = {}
-    name_seq = ""
-    for line in ff:
-        line = line.strip()
-        if line.startswith(">"):
-            name_seq = line[1:].strip()
-            seqs[name_seq] = ""
+            self.index = build_fasta_index(fasta)
+            if fname_index is not None:
+                try:
+                    with open(fname_index, "wt") as f:
+                        for name, entry in self.index.items():
+                            f.write("\t".join([name] + [str(v) for v in entry]) + "\n")
+                except OSError:
+                    pass
+        self._file = open(fasta, "rb")
+        if os.fstat(self._file.fileno()).st_size > 0:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
         else:
-            if upper:
-                seqs[name_seq] += line.upper()
-            else:
-                seqs[name_seq] += line
-    if as_string is False:
-        ff.close()
-    return seqs
+            self._mmap = b""
+
+    def __enter__(self):
+        """Enter context."""
+        return self
+
+    def __exit__(self, *args):
+        """Close FASTA when exiting context."""
+        self.close()
+
+    def __contains__(self, name):
+        """Return True if sequence is in FASTA."""
+        return name in self.index
+
+    def __iter__(self):
+        """Iterate over sequence names."""
+        return iter(self.index)
+
+    def __len__(self):
+        """Number of sequences."""
+        return len(self.index)
+
+    def __getitem__(self, name):
+        """Return sequence."""
+        return self.fetch(name)
+
+    def keys(self):
+        """Return sequence names."""
+        return self.index.keys()
+
+    def items(self, upper=False):
+        """Yield (name, sequence) of all sequences."""
+        for name in self.index:
+            yield name, self.fetch(name, upper=upper)
+
+    def get_length(self, name):
+        """Return sequence length."""
+        return self.index[name][0]
+
+    def fetch(self, name, start=None, end=None, upper=False):
+        """Return sequence or sub-sequence.
+
+        Args:
+            name: Sequence name
+            start: Inclusive 0-based start coordinate
+            end: Exclusive 0-based end coordinate
+            upper: Convert sequence to uppercase
+        """
+        length, offset, line_bases, line_width = self.index[name]
+        start, end, _ = slice(start, end).indices(length)
+        if end <= start:
+            return ""
+        # Only the requested range is copied from the file
+        raw = self._mmap[
+            offset + (start // line_bases) * line_width + start % line_bases : offset
+            + ((end - 1) // line_bases) * line_width
+            + (end - 1) % line_bases
+            + 1
+        ]
+        if line_width != line_bases:
+            raw = raw.replace(b"\n", b"").replace(b"\r", b"")
+        seq = raw.decode("ascii")
+        if upper:
+            seq = seq.upper()
+        return seq
+
+    def close(self):
+        """Close FASTA."""
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
 
 
 @contextlib.contextmanager
@@ -80,3 +244,50 @@ def closeable_temp_file(*args, **kwds):
         yield ftmp
     finally:
         os.remove(ftmp.name)
+
+
+class LRUCache:
+    """Least recently used (LRU) cache with hit and miss counters.
+
+    Args:
+        maxsize: Maximum number of entries (unbounded if None)
+    """
+
+    def __init__(self, maxsize=None):
+        """Create new empty cache."""
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+
+    def __len__(self):
+        """Number of cached entries."""
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Return cached value (and mark it as recently used) or default if key is missing."""
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Add value to cache evicting the least recently used entry if cache is full."""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries and reset counters."""
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """Return cache statistics."""
+        return {"hits": self.hits, "misses": self.misses, "maxsize": self.maxsize, "size": len(self._data)}
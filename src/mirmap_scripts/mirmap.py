@@ -8,15 +8,24 @@
 #
 
 import argparse
-import itertools
+import array
+import collections
+import multiprocessing
 import os
+import pathlib
 import shutil
 import sys
+import tempfile
 
+import mirmap.aln_store
+import mirmap.evolution
 import mirmap.if_lib_spatt
 import mirmap.if_lib_viennarna
+import mirmap.model
 import mirmap.scores
 import mirmap.target
+import mirmap.thermo
+import mirmap.utils
 
 
 table_columns_annots = (
@@ -62,24 +71,71 @@ def check_exe(names):
             raise FileNotFoundError(f"{name} missing")
 
 
-def read_seq(seq=None, fname_fasta=None, fname_tab=None, id=None):
-    """Read sequence(s) from FASTA or TSV file."""
+def iter_seq(seq=None, fname_fasta=None, fname_tab=None, id=None):
+    """Read sequence(s) from FASTA or TSV file yielding one (ID, sequence) at a time."""
     assert seq is not None or fname_fasta is not None or fname_tab is not None, "FASTA or TSV input required"
     if seq is not None:
         if id is not None:
-            return {id: seq}
+            yield id, seq
         else:
-            return {"user": seq}
+            yield "user", seq
+    elif fname_fasta is not None and id is not None and pathlib.Path(fname_fasta).suffix != ".gz":
+        # Random access (index written next to FASTA for later runs)
+        with mirmap.utils.IndexedFasta(fname_fasta, f"{fname_fasta}.fai") as fasta:
+            if id in fasta:
+                yield id, fasta[id]
     else:
         if fname_fasta is not None:
-            seqs = mirmap.utils.load_fasta(fname_fasta)
+            seqs = mirmap.utils.iter_fasta(fname_fasta)
         elif fname_tab:
-            with open(fname_tab, "rt") as f:
-                seqs = dict(line.rstrip().split("\t") for line in f)
-        if id is not None:
-            return {k: v for k, v in seqs.items() if k == id}
-        else:
-            return seqs
+            seqs = mirmap.utils.iter_tab(fname_tab)
+        for k, v in seqs:
+            if id is None or k == id:
+                yield k, v
+
+
+def read_seq(seq=None, fname_fasta=None, fname_tab=None, id=None):
+    """Read sequence(s) from FASTA or TSV file."""
+    return dict(iter_seq(seq, fname_fasta, fname_tab, id))
+
+
+def imap_bounded(pool, func, iterable, max_pending):
+    """Ordered `Pool.imap` consuming iterable only as results are taken (keeping at most max_pending tasks)."""
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while len(pending) > 0:
+        yield pending.popleft().get()
+
+
+class MirnaOrderBuffer:
+    """Outputs of streamed transcripts buffered in a temporary file and written grouped by miRNA.
+
+    Args:
+        mirna_ids: miRNA IDs in the output order
+    """
+
+    def __init__(self, mirna_ids):
+        """Create new buffer."""
+        self.tmp = tempfile.TemporaryFile()
+        # Offset, length and output file index of each output
+        self.chunks = {mirna_id: array.array("q") for mirna_id in mirna_ids}
+
+    def write(self, mirna_id, ifout, out):
+        """Buffer output of miRNA for the ifout-th output file."""
+        data = out.encode("utf-8")
+        self.chunks[mirna_id].extend((self.tmp.tell(), len(data), ifout))
+        self.tmp.write(data)
+
+    def flush(self, fouts):
+        """Write buffered outputs to the output files miRNA by miRNA."""
+        for chunks in self.chunks.values():
+            for i in range(0, len(chunks), 3):
+                self.tmp.seek(chunks[i])
+                fouts[chunks[i + 2]].write(self.tmp.read(chunks[i + 1]).decode("utf-8"))
+        self.tmp.close()
 
 
 def format_number(v):
@@ -95,6 +151,234 @@ def format_number(v):
             return s2
 
 
+class ScoringContext:
+    """Scoring parameters and libraries shared by all (miRNA, transcript) pairs scored by one process."""
+
+    def __init__(self, args, mirnas, features, models, columns_scores, tree):
+        """Create new context (libraries are initialized by `init_libraries`)."""
+        self.args = args
+        self.mirnas = mirnas
+        self.features = features
+        self.models = models
+        self.columns_scores = columns_scores
+        self.tree = tree
+        self.rna_md = None
+        self.if_spatt = None
+        self.seed_duplex_table = None
+        self.fold_cache = None
+        self.dg_open_cache = None
+        self.phylofit_cache = None
+        self.aln_index = None
+        self.aln_store = None
+
+    def __getstate__(self):
+        """Pickle context without libraries."""
+        state = self.__dict__.copy()
+        state["rna_md"] = state["if_spatt"] = state["seed_duplex_table"] = state["fold_cache"] = None
+        state["dg_open_cache"] = None
+        state["phylofit_cache"] = state["aln_index"] = state["aln_store"] = None
+        return state
+
+    def init_libraries(self):
+        """Init. folding model and libraries."""
+        self.rna_md = mirmap.if_lib_viennarna.get_model_details(min_loop_size=2, temperature=self.args.temperature)
+        if "prob_exact" in self.features and self.args.prob_exact_backend == "spatt":
+            self.if_spatt = mirmap.if_lib_spatt.Spatt(self.args.path_libspatt2)
+        if self.args.seed_duplex_table is not None:
+            if os.path.exists(self.args.seed_duplex_table):
+                self.seed_duplex_table = mirmap.thermo.SeedDuplexTable.load(self.args.seed_duplex_table)
+                if self.seed_duplex_table.md_key != mirmap.if_lib_viennarna.get_model_details_key(self.rna_md):
+                    print(
+                        f"Warning: Folding model of {self.args.seed_duplex_table} doesn't match, table replaced",
+                        file=sys.stderr,
+                    )
+                    self.seed_duplex_table = None
+            if self.seed_duplex_table is None:
+                self.seed_duplex_table = mirmap.thermo.SeedDuplexTable(md=self.rna_md)
+        if self.args.fold_cache is not None:
+            self.fold_cache = mirmap.if_lib_viennarna.FoldCache(path_db=self.args.fold_cache)
+        self.dg_open_cache = mirmap.thermo.DgOpenCache()
+        self.phylofit_cache = mirmap.evolution.PhyloFitCache(path_mod=self.args.phylofit_cache)
+        if mirmap.aln_store.is_aln_store(self.args.path_aln):
+            self.aln_store = mirmap.aln_store.AlnStore(self.args.path_aln)
+
+    def get_aln_index(self, transcript_id, path_aln):
+        """Return the alignment index of a transcript (kept for all miRNAs of the last transcript, None if missing)."""
+        if self.aln_index is None or self.aln_index[0] != transcript_id:
+            if self.aln_store is not None:
+                if transcript_id in self.aln_store:
+                    aln_index = mirmap.evolution.AlignmentIndex.from_store(self.aln_store, transcript_id)
+                else:
+                    aln_index = None
+            elif path_aln is not None:
+                aln_index = mirmap.evolution.AlignmentIndex.from_fasta(path_aln)
+            else:
+                aln_index = None
+            self.aln_index = (transcript_id, aln_index)
+        return self.aln_index[1]
+
+    def get_transcript_paths(self, transcript_id):
+        """Return paths to the alignment and evolutionary model of a transcript (None if missing or in a store)."""
+        path_aln = os.path.join(self.args.path_aln, f"{transcript_id}.fa")
+        path_mod = os.path.join(self.args.path_mod, f"{transcript_id}.mod")
+        if self.aln_store is not None or not os.path.exists(path_aln):
+            path_aln = None
+        if not os.path.exists(path_mod):
+            path_mod = None
+        return path_aln, path_mod
+
+    def score(self, mirna_id, mirna_seq, transcript_id, transcript_seq, targets=None, selec_phylops=None):
+        """Score all targets of a miRNA on a transcript.
+
+        Args:
+            mirna_id: miRNA ID
+            mirna_seq: miRNA sequence
+            transcript_id: Transcript ID
+            transcript_seq: Transcript sequence
+            targets: Targets of the miRNA on the transcript (searched if None)
+            selec_phylops: Precomputed *PhyloP* scores of the targets
+
+        Returns:
+            Output of all targets and aggregate output (None if not requested or without target)
+        """
+        if targets is None:
+            targets = mirmap.target.find_targets_with_seed(
+                transcript_seq.upper().replace("U", "T"), mirna_seq.upper().replace("U", "T")
+            )
+        if selec_phylops is None:
+            selec_phylops = [None] * len(targets)
+
+        path_aln, path_mod = self.get_transcript_paths(transcript_id)
+        if len(targets) > 0:
+            aln_index = self.get_aln_index(transcript_id, path_aln)
+        else:
+            aln_index = None
+
+        outs = []
+        targets_scores = []
+        for itarget, (target, selec_phylop) in enumerate(zip(targets, selec_phylops, strict=True)):
+            scores = mirmap.scores.calc_scores(
+                target,
+                self.rna_md,
+                path_aln,
+                path_mod,
+                self.tree,
+                self.if_spatt,
+                self.args.path_phylofit,
+                self.args.path_phylop,
+                dg_open_cache=self.dg_open_cache,
+                dg_open_method=self.args.dg_open_method,
+                fold_cache=self.fold_cache,
+                seed_duplex_table=self.seed_duplex_table,
+                phylofit_cache=self.phylofit_cache,
+                features=self.features,
+                models=self.models,
+                aln_index=aln_index,
+                selec_phylop=selec_phylop,
+                phylo_backend=self.args.phylo_backend,
+            )
+
+            if self.args.pretty_output:
+                out = f"\nTarget #{itarget+1}\n\n" + target.report() + "\n\n" + mirmap.scores.report_scores(scores)
+            else:
+                out = "\t".join(
+                    [
+                        mirna_id,
+                        transcript_id,
+                        str(itarget + 1),
+                        str(target.seed_length),
+                        str(target.mirna.start),
+                        str(target.mirna.end),
+                        str(target.seed.start),
+                        str(target.seed.end),
+                    ]
+                    + [format_number(scores[c]) for c in self.columns_scores]
+                )
+            outs.append(out + "\n")
+
+            targets_scores.append(scores)
+
+        if self.args.aggregate and len(targets) > 0:
+            seed_lengths = [target.seed_length for target in targets]
+            target_agg_scores = mirmap.scores.agg_scores(targets_scores)
+
+            if self.args.pretty_output:
+                out_1to1 = "\nAggregate scores\n\n" + mirmap.scores.report_scores(target_agg_scores) + "\n"
+            else:
+                out_1to1 = "\t".join(
+                    [
+                        mirna_id,
+                        transcript_id,
+                        str(len(targets)),
+                        str(seed_lengths.count(6)),
+                        str(seed_lengths.count(7)),
+                    ]
+                    + [format_number(target_agg_scores[column]) for column in self.columns_scores]
+                )
+            out_1to1 += "\n"
+        else:
+            out_1to1 = None
+
+        return outs, out_1to1
+
+    def score_transcript(self, transcript_id, transcript_seq):
+        """Score all targets of all miRNAs on a transcript.
+
+        With --batch-phylop, *PhyloP* scores of all targets are computed together in-process.
+        """
+        host_seq = transcript_seq.upper().replace("U", "T")
+        mirnas_targets = {
+            mirna_id: mirmap.target.find_targets_with_seed(host_seq, mirna_seq.upper().replace("U", "T"))
+            for mirna_id, mirna_seq in self.mirnas.items()
+        }
+        mirnas_selec_phylops = {}
+        path_aln, path_mod = self.get_transcript_paths(transcript_id)
+        all_targets = [target for targets in mirnas_targets.values() for target in targets]
+        if (
+            self.args.batch_phylop
+            and "selec_phylop" in self.features
+            and path_mod is not None
+            and len(all_targets) > 0
+            and (aln_index := self.get_aln_index(transcript_id, path_aln)) is not None
+        ):
+            selec_phylops = mirmap.evolution.calc_selec_phylop_batch(
+                path_mod,
+                [aln_index.get_target_alns(target) for target in all_targets],
+                path_phylop=self.args.path_phylop,
+                backend=self.args.phylo_backend,
+            )
+            for mirna_id, targets in mirnas_targets.items():
+                mirnas_selec_phylops[mirna_id] = selec_phylops[: len(targets)]
+                selec_phylops = selec_phylops[len(targets) :]
+        return [
+            self.score(
+                mirna_id,
+                mirna_seq,
+                transcript_id,
+                transcript_seq,
+                targets=mirnas_targets[mirna_id],
+                selec_phylops=mirnas_selec_phylops.get(mirna_id),
+            )
+            for mirna_id, mirna_seq in self.mirnas.items()
+        ]
+
+
+# Scoring context of worker process
+_worker_context = None
+
+
+def init_worker(context):
+    """Init. worker process."""
+    global _worker_context
+    _worker_context = context
+    _worker_context.init_libraries()
+
+
+def score_in_worker(transcript):
+    """Score transcript in worker process."""
+    return _worker_context.score_transcript(*transcript)
+
+
 def main(argv=None):
     """Main."""
     # Parameters
@@ -123,7 +407,12 @@ def main(argv=None):
         help="Aggregate multiple targets (miRNA-mRNA 1 to 1 relationships)",
     )
     parser.add_argument(
-        "-s", "--aln", dest="path_aln", action="store", default=".", help="Path to multiple sequence alignment(s)"
+        "-s",
+        "--aln",
+        dest="path_aln",
+        action="store",
+        default=".",
+        help="Path to multiple sequence alignment(s) or to alignment store (built with mirmap_aln_store)",
     )
     parser.add_argument(
         "-d", "--mod", dest="path_mod", action="store", default=".", help="Path to evolutionary model(s)"
@@ -132,6 +421,14 @@ def main(argv=None):
     parser.add_argument("-o", "--output", dest="output", action="store", default="-", help="Output")
     parser.add_argument("-x", "--output-1to1", dest="output_1to1", action="store", default="-", help='Output "1 to 1"')
     parser.add_argument("-p", "--pretty-output", dest="pretty_output", action="store_true", help="Pretty output")
+    parser.add_argument(
+        "--output-order",
+        dest="output_order",
+        action="store",
+        choices=["mirna", "transcript"],
+        default="mirna",
+        help="Output grouped by miRNA (buffered in a temporary file) or by transcript (written as scored)",
+    )
     parser.add_argument(
         "--path-libspatt2",
         dest="path_libspatt2",
@@ -150,19 +447,100 @@ def main(argv=None):
         "--path-phylop", dest="path_phylop", action="store", default="phyloP", help="Path to the phyloP executable"
     )
     parser.add_argument(
-        "--temperature", dest="temperature", action="store", default=37.0, help="RNA folding temperature"
+        "--temperature", dest="temperature", action="store", type=float, default=37.0, help="RNA folding temperature"
+    )
+    parser.add_argument(
+        "--dg-open-method",
+        dest="dg_open_method",
+        action="store",
+        choices=["exact", "plfold"],
+        default="exact",
+        help="ΔG open computed with two foldings per target (exact) or a local folding per transcript (plfold)",
+    )
+    parser.add_argument(
+        "--seed-duplex-table",
+        dest="seed_duplex_table",
+        action="store",
+        help="Path to seed duplex table (created if missing)",
+    )
+    parser.add_argument(
+        "--fold-cache",
+        dest="fold_cache",
+        action="store",
+        help="Path to SQLite database caching duplex foldings across runs",
+    )
+    parser.add_argument(
+        "--phylo-backend",
+        dest="phylo_backend",
+        action="store",
+        choices=["phast", "numpy"],
+        default="phast",
+        help="Compute evolutionary features with the PHAST programs or in-process",
+    )
+    parser.add_argument(
+        "--prob-exact-backend",
+        dest="prob_exact_backend",
+        action="store",
+        choices=["spatt", "numpy"],
+        default="spatt",
+        help="Compute the P.over exact feature with the Spatt library or in-process",
+    )
+    parser.add_argument(
+        "--batch-phylop",
+        dest="batch_phylop",
+        action="store_true",
+        help="Compute the PhyloP scores of all targets of a transcript together in-process",
+    )
+    parser.add_argument(
+        "--phylofit-cache",
+        dest="phylofit_cache",
+        action="store",
+        help="Path to directory caching the species trees fitted by phyloFit across runs",
+    )
+    parser.add_argument(
+        "--features",
+        dest="features",
+        action="store",
+        help="Comma-separated features to compute (and the features they depend on)",
+    )
+    parser.add_argument(
+        "--model",
+        dest="model",
+        action="store",
+        choices=["full", "python-only"],
+        default="full",
+        help="miRmap model (python-only computes by default the features without folding and Spatt)",
+    )
+    parser.add_argument(
+        "-j", "--jobs", dest="jobs", action="store", type=int, default=1, help="Number of worker processes"
     )
     args = parser.parse_args(argv[1:])
 
+    # Features
+    if args.model == "python-only":
+        models = mirmap.model.python_only_mirmap_models
+        features = ["tgs_score", "mirmap_score"]
+    else:
+        models = mirmap.model.full_mirmap_models
+        features = table_columns_scores
+    if args.features is not None:
+        features = args.features.split(",")
+    features = mirmap.scores.get_features_closure(features, models)
+    columns_scores = [column for column in table_columns_scores if column in features]
+
     # Check
-    exes = [args.path_libspatt2, args.path_phylop]
-    if args.path_tree is not None:
+    exes = []
+    if "prob_exact" in features and args.prob_exact_backend == "spatt":
+        exes.append(args.path_libspatt2)
+    if "selec_phylop" in features and args.phylo_backend == "phast":
+        exes.append(args.path_phylop)
+    if "cons_bls" in features and args.path_tree is not None and args.phylo_backend == "phast":
         exes.append(args.path_phylofit)
     check_exe(exes)
 
-    # Sequences input
+    # Sequences input (transcripts are streamed)
     mirnas = read_seq(args.mirna_seq, args.mirna_fasta, args.mirna_tab, args.mirna_id)
-    transcripts = read_seq(args.transcript_seq, args.transcript_fasta, args.transcript_tab, args.transcript_id)
+    transcripts = iter_seq(args.transcript_seq, args.transcript_fasta, args.transcript_tab, args.transcript_id)
 
     # Read tree
     if args.path_tree is not None:
@@ -171,8 +549,16 @@ def main(argv=None):
         tree = None
 
     # Init. libraries
-    rna_md = mirmap.if_lib_viennarna.get_model_details(min_loop_size=2, temperature=args.temperature)
-    if_spatt = mirmap.if_lib_spatt.Spatt(args.path_libspatt2)
+    context = ScoringContext(args, mirnas, features, models, columns_scores, tree)
+    if args.jobs > 1:
+        # Complete seed duplex table once for all workers
+        if args.seed_duplex_table is not None:
+            context.init_libraries()
+            context.seed_duplex_table.build()
+            context.seed_duplex_table.save(args.seed_duplex_table)
+        pool = multiprocessing.Pool(args.jobs, initializer=init_worker, initargs=(context,))
+    else:
+        context.init_libraries()
 
     # Output
     if args.output == "-":
@@ -189,75 +575,42 @@ def main(argv=None):
 
     # Write headers
     if not args.pretty_output:
-        fout.write("\t".join(table_columns_annots + table_columns_scores) + "\n")
+        fout.write("\t".join(table_columns_annots + tuple(columns_scores)) + "\n")
         if fout_1to1 is not None:
-            fout_1to1.write("\t".join(table_columns_annots_1to1 + table_columns_scores) + "\n")
-
-    for (mirna_id, mirna_seq), (transcript_id, transcript_seq) in itertools.product(
-        mirnas.items(), transcripts.items()
-    ):
-        targets = mirmap.target.find_targets_with_seed(
-            transcript_seq.upper().replace("U", "T"), mirna_seq.upper().replace("U", "T")
-        )
-
-        path_aln = os.path.join(args.path_aln, f"{transcript_id}.fa")
-        path_mod = os.path.join(args.path_mod, f"{transcript_id}.mod")
-        if not os.path.exists(path_aln):
-            path_aln = None
-        if not os.path.exists(path_mod):
-            path_mod = None
-
-        targets_scores = []
-        for itarget, target in enumerate(targets):
-            scores = mirmap.scores.calc_scores(
-                target,
-                rna_md,
-                path_aln,
-                path_mod,
-                tree,
-                if_spatt,
-                args.path_phylofit,
-                args.path_phylop,
-            )
-
-            if args.pretty_output:
-                out = f"\nTarget #{itarget+1}\n\n" + target.report() + "\n\n" + mirmap.scores.report_scores(scores)
-            else:
-                out = "\t".join(
-                    [
-                        mirna_id,
-                        transcript_id,
-                        str(itarget + 1),
-                        str(target.seed_length),
-                        str(target.mirna.start),
-                        str(target.mirna.end),
-                        str(target.seed.start),
-                        str(target.seed.end),
-                    ]
-                    + [format_number(scores[c]) for c in table_columns_scores]
-                )
-            fout.write(out + "\n")
+            fout_1to1.write("\t".join(table_columns_annots_1to1 + tuple(columns_scores)) + "\n")
 
-            targets_scores.append(scores)
+    # Score
+    if args.jobs > 1:
+        results = imap_bounded(pool, score_in_worker, transcripts, 4 * args.jobs)
+    else:
+        results = (context.score_transcript(*transcript) for transcript in transcripts)
+    fouts = (fout, fout_1to1)
+    if args.output_order == "mirna" and len(mirnas) > 1:
+        buffer = MirnaOrderBuffer(mirnas.keys())
+    else:
+        buffer = None
+    for transcript_results in results:
+        for mirna_id, (outs, out_1to1) in zip(mirnas.keys(), transcript_results, strict=True):
+            for ifout, out in enumerate(("".join(outs), out_1to1)):
+                if fouts[ifout] is not None and out:
+                    if buffer is None:
+                        fouts[ifout].write(out)
+                    else:
+                        buffer.write(mirna_id, ifout, out)
+    if buffer is not None:
+        buffer.flush(fouts)
+    if args.jobs > 1:
+        pool.close()
+        pool.join()
 
-        if fout_1to1 is not None and len(targets) > 0:
-            seed_lengths = [target.seed_length for target in targets]
-            target_agg_scores = mirmap.scores.agg_scores(targets_scores)
+    # Save seed duplex table
+    if context.seed_duplex_table is not None and context.seed_duplex_table.modified:
+        context.seed_duplex_table.save(args.seed_duplex_table)
 
-            if args.pretty_output:
-                out = "\nAggregate scores\n\n" + mirmap.scores.report_scores(target_agg_scores) + "\n"
-            else:
-                out = "\t".join(
-                    [
-                        mirna_id,
-                        transcript_id,
-                        str(len(targets)),
-                        str(seed_lengths.count(6)),
-                        str(seed_lengths.count(7)),
-                    ]
-                    + [format_number(target_agg_scores[column]) for column in table_columns_scores]
-                )
-            fout_1to1.write(out + "\n")
+    # Close output
+    for f in (fout, fout_1to1):
+        if f is not None and f is not sys.stdout:
+            f.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+#
+# Copyright © 2024 Charles E. Vejnar
+#
+# This is free software, licensed under the GNU General Public License v3.
+# See /LICENSE for more information.
+#
+
+import argparse
+import os
+import sys
+
+import mirmap.aln_store
+
+
+def main(argv=None):
+    """Main."""
+    # Parameters
+    if argv is None:
+        argv = sys.argv
+    parser = argparse.ArgumentParser(description="Build alignment store for miRmap.")
+    parser.add_argument(
+        "-s",
+        "--aln",
+        dest="path_aln",
+        action="store",
+        required=True,
+        help="MAF file with transcripts as reference or directory of <transcript_id>.fa alignments",
+    )
+    parser.add_argument("-o", "--output", dest="output", action="store", required=True, help="Alignment store")
+    args = parser.parse_args(argv[1:])
+
+    # Build
+    if os.path.isdir(args.path_aln):
+        alns = mirmap.aln_store.iter_fasta_dir(args.path_aln)
+    else:
+        alns = mirmap.aln_store.iter_maf(args.path_aln)
+    mirmap.aln_store.build_aln_store(args.output, alns)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
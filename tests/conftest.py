@@ -1,7 +1,48 @@
+import random
+
 import pytest
 
+import mirmap.target
+import mirmap.utils
+
 
 @pytest.fixture(scope="module")
 def path_root_test(request):
     """Return the directory of the currently running test script."""
     return request.path.parent
+
+
+@pytest.fixture(scope="module")
+def transcript_seq(path_root_test):
+    return mirmap.utils.load_fasta(path_root_test.joinpath("data", "NM_024573.fa"))["NM_024573"]
+
+
+@pytest.fixture(scope="module")
+def targets(path_root_test, transcript_seq):
+    mirna_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "hsa-miR-30a-3p.fa"))["hsa-miR-30a-3p"]
+    return mirmap.target.find_targets_with_seed(
+        transcript_seq, mirna_seq.upper().replace("U", "T"), seed_lengths=[5, 6, 7]
+    )
+
+
+@pytest.fixture(scope="module")
+def aln(transcript_seq):
+    """Simulated alignment with gaps and substitutions of the transcript."""
+    rng = random.Random(0)
+    species = ["hg19", "panTro2", "ponAbe2", "rheMac2", "mm9", "rn4", "canFam2"]
+    columns = []
+    for nt in transcript_seq:
+        # Insertion in non-reference species
+        if rng.random() < 0.05:
+            columns.append("-" + "".join(rng.choice("ACGT-") for _ in species[1:]))
+        columns.append(nt + "".join(nt if rng.random() < 0.9 else rng.choice("ACGT-") for _ in species[1:]))
+    # Only-gap species
+    columns = [column[:-1] + "-" for column in columns]
+    return (
+        "\n".join(
+            f">{name}\n"
+            + "\n".join("".join(column[i] for column in columns[j : j + 60]) for j in range(0, len(columns), 60))
+            for i, name in enumerate(species)
+        )
+        + "\n"
+    )
@@ -0,0 +1,81 @@
+import pytest
+
+import mirmap.aln_store
+import mirmap.evolution
+import mirmap.utils
+
+
+@pytest.mark.unit()
+def test_aln_store(path_root_test, tmp_path, targets, aln):
+    path_aln = tmp_path.joinpath("alns")
+    path_aln.mkdir()
+    path_aln.joinpath("NM_024573.fa").write_text(aln)
+    path_aln.joinpath("NM_024573_ts1.fa").write_text(path_root_test.joinpath("data", "NM_024573_ts1.fa").read_text())
+    fname_store = tmp_path.joinpath("alns.bin")
+    mirmap.aln_store.build_aln_store(fname_store, mirmap.aln_store.iter_fasta_dir(path_aln))
+    assert mirmap.aln_store.is_aln_store(fname_store)
+    assert not mirmap.aln_store.is_aln_store(path_aln.joinpath("NM_024573.fa"))
+    with mirmap.aln_store.AlnStore(fname_store) as aln_store:
+        assert aln_store.transcript_ids == ["NM_024573", "NM_024573_ts1"]
+        assert "NM_024573" in aln_store and "NM_000000" not in aln_store
+        seqs = mirmap.utils.load_fasta(aln, as_string=True, upper=True)
+        assert aln_store.get_seqs("NM_024573") == seqs
+        assert aln_store.get_seqs("NM_024573", 10, 20) == {name: seq[10:20] for name, seq in seqs.items()}
+        assert aln_store.get_seq("NM_024573_ts1", 3, 2) == "AC---"
+        # Target alignments
+        aln_index = mirmap.evolution.AlignmentIndex.from_store(aln_store, "NM_024573")
+        for target in targets:
+            target_alns = mirmap.evolution.get_target_alns(target, aln=aln)
+            assert target_alns == mirmap.evolution.get_target_alns(target, aln_store=aln_store, aln_id="NM_024573")
+            assert target_alns == aln_index.get_target_alns(target)
+
+
+@pytest.mark.unit()
+def test_iter_maf(tmp_path):
+    fname_maf = tmp_path.joinpath("alns.maf")
+    fname_maf.write_text(
+        "##maf version=1\n"
+        "a score=0\n"
+        "s hg19.NM_1 6 4 + 12 AC-GT\n"
+        "s mm9.chr1 100 5 - 1000 ACAGT\n"
+        "\n"
+        "a score=0\n"
+        "s hg19.NM_1 0 3 + 12 TTA\n"
+        "s rn4.chr2 10 3 + 1000 TTC\n"
+        "\n"
+        "a score=0\n"
+        "s hg19.NM_2 0 2 + 2 GG\n"
+        "s mm9.chr3 50 2 + 1000 GA\n"
+    )
+    alns = dict(mirmap.aln_store.iter_maf(fname_maf))
+    assert alns == {
+        "NM_1": {"hg19": "TTANNNAC-GTNN", "mm9": "------ACAGT--", "rn4": "TTC----------"},
+        "NM_2": {"hg19": "GG", "mm9": "GA"},
+    }
+    fname_store = tmp_path.joinpath("alns.bin")
+    mirmap.aln_store.build_aln_store(fname_store, alns)
+    with mirmap.aln_store.AlnStore(fname_store) as aln_store:
+        assert len(aln_store) == 2
+        assert aln_store.get_species("NM_1") == ["hg19", "mm9", "rn4"]
+        assert aln_store.get_seqs("NM_2") == alns["NM_2"]
+
+
+@pytest.mark.unit()
+def test_iter_maf_unsorted(tmp_path):
+    blocks = ["s hg19.NM_1 0 3 + 8 TTA\ns mm9.chr1 10 3 + 1000 TTC\n", "s hg19.NM_1 3 5 + 8 ACGGT\n"]
+    alns = []
+    for name, order in (("sorted", blocks), ("unsorted", blocks[::-1])):
+        fname_maf = tmp_path.joinpath(f"{name}.maf")
+        fname_maf.write_text("##maf version=1\n" + "".join(f"a score=0\n{block}\n" for block in order))
+        alns.append(dict(mirmap.aln_store.iter_maf(fname_maf)))
+    assert alns[0] == alns[1] == {"NM_1": {"hg19": "TTAACGGT", "mm9": "TTC-----"}}
+
+
+@pytest.mark.unit()
+def test_iter_maf_overlap(tmp_path):
+    fname_maf = tmp_path.joinpath("alns.maf")
+    fname_maf.write_text(
+        "##maf version=1\na score=0\ns hg19.NM_1 0 4 + 8 TTAA\n\na score=0\ns hg19.NM_1 2 4 + 8 AACG\n"
+    )
+    with pytest.raises(ValueError, match="Overlapping blocks"):
+        dict(mirmap.aln_store.iter_maf(fname_maf))
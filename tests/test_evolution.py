@@ -0,0 +1,82 @@
+import asyncio
+import platform
+import random
+
+import dendropy
+import pytest
+
+import mirmap.evolution
+import mirmap.if_exe_phast
+import mirmap.target
+import mirmap.utils
+
+
+@pytest.mark.unit()
+def test_target_alns_indexed_fasta(tmp_path, targets, aln):
+    fname_aln = tmp_path.joinpath("aln.fa")
+    fname_aln.write_text(aln.lower())
+    with mirmap.utils.IndexedFasta(fname_aln) as aln_fasta:
+        for target in targets:
+            assert mirmap.evolution.get_target_alns(target, aln_fname=fname_aln) == (
+                mirmap.evolution.get_target_alns(target, aln_fasta=aln_fasta)
+            )
+
+
+@pytest.mark.unit()
+def test_alignment_index(targets, aln):
+    aln_index = mirmap.evolution.AlignmentIndex.from_fasta(aln=aln)
+    for target in targets:
+        assert mirmap.evolution.get_target_alns(target, aln=aln) == aln_index.get_target_alns(target)
+
+
+@pytest.mark.unit()
+def test_phylofit_cache(path_root_test, tmp_path, aln):
+    mod = mirmap.if_exe_phast.parse_mod(path_root_test.joinpath("data", "NM_024573.mod").read_text())
+    fname_aln = tmp_path.joinpath("aln.fa")
+    fname_aln.write_text(aln)
+    cache = mirmap.evolution.PhyloFitCache(path_mod=tmp_path.joinpath("mods"))
+    key = cache.get_key("(hg19,mm9);", "REV", True, aln_fname=fname_aln)
+    assert key == cache.get_key("(hg19,mm9);", "REV", True, aln=aln)
+    assert key != cache.get_key("(hg19,mm9);", "REV", False, aln=aln)
+    # Alignment hash memoized by index
+    aln_index = mirmap.evolution.AlignmentIndex.from_fasta(aln=aln)
+    assert cache.get_key("(hg19,mm9);", "REV", True, aln=aln_index.to_fasta()) == cache.get_key(
+        "(hg19,mm9);", "REV", True, aln_hash=aln_index.get_hash()
+    )
+    cache.put(key, mod)
+    # Cached models are read from disk by a new cache without running phyloFit
+    cache = mirmap.evolution.PhyloFitCache(path_mod=tmp_path.joinpath("mods"))
+    fitted = cache.fit("(hg19,mm9);", aln_fname=fname_aln, path_phyfit=tmp_path.joinpath("missing"))
+    assert fitted == mod
+    assert len(cache.memory) == 1
+    cache = mirmap.evolution.PhyloFitCache(path_mod=tmp_path.joinpath("mods"))
+    fitted = asyncio.run(cache.fit_async("(hg19,mm9);", aln_fname=fname_aln, path_phyfit=tmp_path.joinpath("missing")))
+    assert fitted == mod
+    assert len(cache.memory) == 1
+
+
+@pytest.mark.unit()
+def test_selec_phylop_batch(path_root_test, targets, aln):
+    path_phylop = path_root_test.joinpath("..", "bin", f"{platform.system().lower()}_{platform.machine()}", "phyloP")
+    mod_fname = path_root_test.joinpath("data", "NM_024573.mod")
+    aln_index = mirmap.evolution.AlignmentIndex.from_fasta(aln=aln)
+    targets_alns = [aln_index.get_target_alns(target) for target in targets]
+    pvals = mirmap.evolution.calc_selec_phylop_batch(mod_fname, targets_alns, path_phylop=path_phylop)
+    for target_alns, pval in zip(targets_alns, pvals, strict=True):
+        assert pval == pytest.approx(
+            mirmap.evolution.calc_selec_phylop(mod_fname, target_alns=target_alns, path_phylop=path_phylop), rel=1e-6
+        )
+
+
+@pytest.mark.unit()
+def test_compiled_tree(path_root_test):
+    tree = mirmap.evolution.extract_tree_from_mod(mod_fname=path_root_test.joinpath("data", "NM_024573.mod"))
+    compiled_tree = mirmap.evolution.CompiledTree(tree)
+    rng = random.Random(0)
+    for _ in range(50):
+        species = set(rng.sample(compiled_tree.species, rng.randint(1, len(compiled_tree.species))))
+        dtree = dendropy.Tree.get_from_string(tree, schema="newick", preserve_underscores=True)
+        dtree.retain_taxa_with_labels(species)
+        bls = sum([edge.length for edge in dtree.postorder_edge_iter()][:-1])
+        assert bls == pytest.approx(compiled_tree.calc_bls(species), rel=1e-12, abs=1e-12)
+        assert bls == pytest.approx(compiled_tree.calc_bls(species | {"unknown"}), rel=1e-12, abs=1e-12)
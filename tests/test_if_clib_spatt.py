@@ -1,15 +1,22 @@
+import concurrent.futures
 import platform
 
+import numpy as np
 import pytest
 
 import mirmap.if_lib_spatt
+import mirmap.prob_exact
+import mirmap.target
+import mirmap.utils
+
+
+@pytest.fixture(scope="module")
+def path_libspatt(path_root_test):
+    return path_root_test.joinpath("..", "bin", f"{platform.system().lower()}_{platform.machine()}", "libspatt2.so")
 
 
 @pytest.mark.unit()
-def test_get_exact_prob(path_root_test):
-    path_libspatt = path_root_test.joinpath(
-        "..", "bin", f"{platform.system().lower()}_{platform.machine()}", "libspatt2.so"
-    )
+def test_get_exact_prob(path_libspatt):
     if_spatt = mirmap.if_lib_spatt.Spatt(path_libspatt)
     result = if_spatt.get_exact_prob(
         "AUUAAAA",
@@ -21,3 +28,44 @@ def test_get_exact_prob(path_root_test):
         "o",
     )
     assert 0.3704134091486 == pytest.approx(result)
+
+
+@pytest.mark.unit()
+def test_get_exact_probs(path_libspatt):
+    if_spatt = mirmap.if_lib_spatt.Spatt(path_libspatt)
+    assert if_spatt._library is mirmap.if_lib_spatt.Spatt(path_libspatt)._library
+    transitions = np.array([[0.1780821917808219, 0.821917808219178], [0.6593406593406593, 0.34065934065934067]])
+    motifs = ["AUUAAAA", "AUUAAAA", "UUAUA", "AUUAAAA"]
+    nobs_list = [1, 2, 3, 1]
+    expected = [
+        if_spatt.get_exact_prob(m, n, 1000, ["A", "U"], transitions, 1, "o")
+        for m, n in zip(motifs, nobs_list, strict=True)
+    ]
+    assert 0.3704134091486 == pytest.approx(expected[0])
+    probs = if_spatt.get_exact_probs(motifs, nobs_list, 1000, ["A", "U"], transitions, 1)
+    assert probs == pytest.approx(expected)
+    assert len(if_spatt.cache) == 3
+    # Cached
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        assert if_spatt.get_exact_probs(
+            motifs, nobs_list, 1000, ["A", "U"], transitions.tolist(), 1, executor=executor
+        ) == pytest.approx(expected)
+    assert if_spatt.cache.hits == 4
+    # Computed with executor
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        assert mirmap.if_lib_spatt.Spatt(path_libspatt, cache_size=0).get_exact_probs(
+            motifs, nobs_list, 1000, ["A", "U"], transitions, 1, executor=executor
+        ) == pytest.approx(expected)
+
+
+@pytest.mark.unit()
+def test_get_exact_probs_numpy(path_root_test, path_libspatt):
+    transcript_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "NM_024573.fa"))["NM_024573"]
+    mirna_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "hsa-miR-30a-3p.fa"))["hsa-miR-30a-3p"]
+    targets = mirmap.target.find_targets_with_seed(
+        transcript_seq, mirna_seq.upper().replace("U", "T"), seed_lengths=[5, 6, 7]
+    )
+    if_spatt = mirmap.if_lib_spatt.Spatt(path_libspatt)
+    assert mirmap.prob_exact.calc_prob_exact_batch(targets, backend="numpy") == pytest.approx(
+        mirmap.prob_exact.calc_prob_exact_batch(targets, if_spatt), rel=1e-9
+    )
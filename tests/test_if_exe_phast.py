@@ -1,8 +1,10 @@
 import platform
+import subprocess
 
 import pytest
 
 import mirmap.if_exe_phast
+import mirmap.utils
 
 
 @pytest.mark.unit()
@@ -18,3 +20,46 @@ def test_get_exact_prob(path_root_test):
         path_exe=path_phylop,
     )
     assert 0.5303034 == pytest.approx(result)
+
+
+@pytest.mark.unit()
+def test_transport(path_root_test):
+    path_bin = path_root_test.joinpath("..", "bin", f"{platform.system().lower()}_{platform.machine()}")
+    mod_fname = path_root_test.joinpath("data", "NM_024573.mod")
+    aln = path_root_test.joinpath("data", "NM_024573_ts1.fa").read_text()
+    tree = "(((hg19,panTro2),ponAbe2),(((rn4,dipOrd1),speTri1),oryCun2),(vicPac1,canFam2));"
+    results = {}
+    for transport in ("pipe", "file"):
+        results[transport] = (
+            mirmap.if_exe_phast.phylop(
+                "SPH", "CONACC", mod_fname, aln=aln, path_exe=path_bin.joinpath("phyloP"), transport=transport
+            ),
+            mirmap.if_exe_phast.phylop_features(
+                "SPH",
+                "CON",
+                mod_fname,
+                [("hg19", 1, 7), ("hg19", 2, 5)],
+                aln=aln,
+                path_exe=path_bin.joinpath("phyloP"),
+                transport=transport,
+            ),
+            mirmap.if_exe_phast.phylofit(
+                "REV",
+                aln="".join(
+                    f">{name}\n{seq * 20}\n" for name, seq in mirmap.utils.load_fasta(aln, as_string=True).items()
+                ),
+                tree=tree,
+                use_em=True,
+                path_exe=path_bin.joinpath("phyloFit"),
+                transport=transport,
+            )["training_lnl"],
+        )
+    assert results["pipe"][:2] == results["file"][:2]
+    assert results["pipe"][2] == pytest.approx(results["file"][2], rel=1e-3)
+    assert 0.5303034 == pytest.approx(results["pipe"][0])
+    # Failed runs are reported with both transports
+    with pytest.raises(subprocess.CalledProcessError):
+        mirmap.if_exe_phast.phylop(
+            "SPH", "CONACC", path_root_test.joinpath("missing.mod"), aln=aln, path_exe=path_bin.joinpath("phyloP")
+        )
+    assert str(path_bin.joinpath("phyloP")) not in mirmap.if_exe_phast._pipe_unsupported
@@ -10,3 +10,25 @@ def test_fold():
         partfunc=True,
     )
     assert -20.20 == pytest.approx(result.mfe)
+
+
+@pytest.mark.unit()
+def test_fold_cache(tmp_path):
+    seqs = ["GCUUCAAUGGACAUUCACUGAAAC", "UCUUUCAGUCGGAUGUUUGCAGC"]
+    constraint = "." * 16 + "(((((((" + "." + "." * 15 + ")))))))" + "."
+    md = mirmap.if_lib_viennarna.get_model_details(min_loop_size=2)
+    expected = mirmap.if_lib_viennarna.RNAfold(seqs, constraint=constraint, partfunc=True, md=md)
+    # Memory
+    cache = mirmap.if_lib_viennarna.FoldCache(path_db=tmp_path.joinpath("folds.sqlite"))
+    for _ in range(2):
+        assert expected == mirmap.if_lib_viennarna.RNAfold(
+            seqs, constraint=constraint, partfunc=True, md=md, cache=cache
+        )
+    assert 1 == cache.memory.hits
+    cache.close()
+    # Disk
+    cache = mirmap.if_lib_viennarna.FoldCache(path_db=tmp_path.joinpath("folds.sqlite"))
+    assert expected == mirmap.if_lib_viennarna.RNAfold(seqs, constraint=constraint, partfunc=True, md=md, cache=cache)
+    assert 0 == cache.memory.hits
+    assert 1 == len(cache.memory)
+    cache.close()
@@ -0,0 +1,105 @@
+import pytest
+
+import mirmap_scripts.mirmap
+
+
+@pytest.mark.functional()
+def test_jobs(path_root_test, tmp_path):
+    path_data = path_root_test.joinpath("data")
+    fname_transcripts = tmp_path.joinpath("transcripts.fa")
+    with open(fname_transcripts, "wt") as f:
+        for fname in ("NM_024573.fa", "ENST00000597389.fa", "ENST00000355526.fa"):
+            f.write(path_data.joinpath(fname).read_text().rstrip() + "\n")
+    outputs = []
+    for jobs in (1, 2):
+        fname_output = tmp_path.joinpath(f"output_{jobs}.tsv")
+        fname_output_1to1 = tmp_path.joinpath(f"output_1to1_{jobs}.tsv")
+        mirmap_scripts.mirmap.main(
+            [
+                "mirmap",
+                "--mirna-fasta",
+                str(path_data.joinpath("hsa-miR-3124-5p.fa")),
+                "--transcript-fasta",
+                str(fname_transcripts),
+                "--model",
+                "python-only",
+                "--aggregate",
+                "--output",
+                str(fname_output),
+                "--output-1to1",
+                str(fname_output_1to1),
+                "--jobs",
+                str(jobs),
+            ]
+        )
+        outputs.append((fname_output.read_text(), fname_output_1to1.read_text()))
+    assert outputs[0] == outputs[1]
+    assert 6 == len(outputs[0][0].splitlines())
+
+
+@pytest.mark.functional()
+def test_output_order(path_root_test, tmp_path):
+    path_data = path_root_test.joinpath("data")
+    fname_mirnas = tmp_path.joinpath("mirnas.fa")
+    fname_transcripts = tmp_path.joinpath("transcripts.fa")
+    for fname_out, fnames_in in (
+        (fname_mirnas, ("hsa-miR-3124-5p.fa", "hsa-miR-30a-3p.fa")),
+        (fname_transcripts, ("NM_024573.fa", "ENST00000597389.fa", "ENST00000355526.fa")),
+    ):
+        with open(fname_out, "wt") as f:
+            for fname in fnames_in:
+                f.write(path_data.joinpath(fname).read_text().rstrip() + "\n")
+    outputs = {}
+    for output_order in ("mirna", "transcript"):
+        fname_output = tmp_path.joinpath(f"output_{output_order}.tsv")
+        mirmap_scripts.mirmap.main(
+            [
+                "mirmap",
+                "--mirna-fasta",
+                str(fname_mirnas),
+                "--transcript-fasta",
+                str(fname_transcripts),
+                "--model",
+                "python-only",
+                "--output",
+                str(fname_output),
+                "--output-order",
+                output_order,
+            ]
+        )
+        outputs[output_order] = [line.split("\t") for line in fname_output.read_text().splitlines()[1:]]
+    assert sorted(outputs["mirna"]) == sorted(outputs["transcript"])
+    # Rows grouped by miRNA in the input order
+    mirna_ids = [row[0] for row in outputs["mirna"]]
+    assert mirna_ids == sorted(mirna_ids, key=["hsa-miR-3124-5p", "hsa-miR-30a-3p"].index)
+    assert len(set(mirna_ids)) == 2
+
+
+@pytest.mark.functional()
+def test_seed_duplex_table_model(path_root_test, tmp_path, capsys):
+    path_data = path_root_test.joinpath("data")
+    fname_table = tmp_path.joinpath("seed_duplex.bin")
+    outputs = []
+    for temperature, seed_duplex_table in (("37", True), ("25", True), ("25", False)):
+        fname_output = tmp_path.joinpath("output.tsv")
+        mirmap_scripts.mirmap.main(
+            [
+                "mirmap",
+                "--mirna-fasta",
+                str(path_data.joinpath("hsa-miR-3124-5p.fa")),
+                "--transcript-fasta",
+                str(path_data.joinpath("ENST00000597389.fa")),
+                "--features",
+                "dg_duplex_seed",
+                "--temperature",
+                temperature,
+                "--output",
+                str(fname_output),
+            ]
+            + (["--seed-duplex-table", str(fname_table)] if seed_duplex_table else [])
+        )
+        outputs.append(fname_output.read_text())
+    # Table of another folding model replaced
+    assert "doesn't match" in capsys.readouterr().err
+    assert outputs[1] == outputs[2]
+    assert outputs[0] != outputs[1]
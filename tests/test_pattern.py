@@ -0,0 +1,85 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import mirmap.pattern
+import mirmap.prob
+import mirmap.prob_exact
+import mirmap.target
+import mirmap.utils
+
+
+def brute_force_probs(motif, nobs, length_seq, alphabet, transitions, markov_order, start):
+    """Probabilities of at least and at most nobs occurrences by enumerating all sequences."""
+    nletter = len(alphabet)
+    if start == "first":
+        contexts = np.zeros(nletter**markov_order)
+        contexts[0] = 1.0
+    else:
+        contexts = mirmap.pattern._get_stationary(transitions, nletter, markov_order)
+    over, under = 0.0, 0.0
+    for codes in itertools.product(range(nletter), repeat=length_seq):
+        context = 0
+        for code in codes[:markov_order]:
+            context = context * nletter + code
+        prob = contexts[context]
+        for code in codes[markov_order:]:
+            prob *= transitions[context, code]
+            context = (context * nletter) % nletter**markov_order + code
+        seq = "".join(alphabet[code] for code in codes)
+        count = sum(seq.startswith(motif, i) for i in range(length_seq))
+        over += prob if count >= nobs else 0.0
+        under += prob if count <= nobs else 0.0
+    return over, under
+
+
+@pytest.mark.unit()
+def test_get_exact_prob():
+    # Reference computed with Spatt
+    result = mirmap.pattern.get_exact_prob(
+        "AUUAAAA",
+        1,
+        1000,
+        ["A", "U"],
+        [[0.1780821917808219, 0.821917808219178], [0.6593406593406593, 0.34065934065934067]],
+        1,
+        "o",
+    )
+    assert 0.3704134091486 == pytest.approx(result)
+
+
+@pytest.mark.unit()
+@pytest.mark.parametrize("markov_order", [1, 2])
+@pytest.mark.parametrize("start", ["first", "stationary"])
+def test_get_exact_probs(markov_order, start):
+    rng = np.random.default_rng(markov_order)
+    transitions = rng.random((3**markov_order, 3))
+    transitions /= transitions.sum(axis=1, keepdims=True)
+    motifs = ["ACA", "AAA", "ACAC", "GCG", "ACA"]
+    nobs_list = [1, 2, 1, 0, 2]
+    overs = mirmap.pattern.get_exact_probs(motifs, nobs_list, 8, "ACG", transitions, markov_order, "o", start)
+    unders = mirmap.pattern.get_exact_probs(motifs, nobs_list, 8, "ACG", transitions, markov_order, "u", start)
+    assert overs[3] == 1.0
+    # Motifs computed with different numbers of counts
+    assert overs[1:2] == pytest.approx(
+        mirmap.pattern.get_exact_probs(motifs[1:2], nobs_list[1:2], 8, "ACG", transitions, markov_order, "o", start),
+        rel=1e-12,
+    )
+    for motif, nobs, over, under in zip(motifs, nobs_list, overs, unders, strict=True):
+        assert (over, under) == pytest.approx(
+            brute_force_probs(motif, nobs, 8, "ACG", transitions, markov_order, start), rel=1e-12
+        )
+
+
+@pytest.mark.unit()
+def test_prob_exact_batch(path_root_test):
+    transcript_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "NM_024573.fa"))["NM_024573"]
+    mirna_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "hsa-miR-30a-3p.fa"))["hsa-miR-30a-3p"]
+    targets = mirmap.target.find_targets_with_seed(
+        transcript_seq, mirna_seq.upper().replace("U", "T"), seed_lengths=[5, 6, 7]
+    )
+    assert len(targets) > 1
+    probs = mirmap.prob_exact.calc_prob_exact_batch(targets)
+    assert probs == pytest.approx([mirmap.prob_exact.calc_prob_exact(target) for target in targets], rel=1e-12)
+    assert all(0 < p <= 1 for p in probs)
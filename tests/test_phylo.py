@@ -0,0 +1,91 @@
+import math
+import platform
+
+import numpy as np
+import pytest
+
+import mirmap.if_exe_phast
+import mirmap.phylo
+import mirmap.utils
+
+
+@pytest.fixture(scope="module")
+def path_bin(path_root_test):
+    return path_root_test.joinpath("..", "bin", f"{platform.system().lower()}_{platform.machine()}")
+
+
+@pytest.fixture(scope="module")
+def mod(path_root_test):
+    return mirmap.phylo.TreeModel.from_mod(mod_fname=path_root_test.joinpath("data", "NM_024573.mod"))
+
+
+@pytest.fixture(scope="module")
+def sim_aln(mod):
+    """Alignment simulated along the tree of the model."""
+    model = mod.prune(["hg19", "panTro2", "ponAbe2", "rn4", "dipOrd1", "speTri1", "oryCun2", "vicPac1", "canFam2"])
+    rng = np.random.default_rng(0)
+    ncol = 500
+    states = {len(model.nodes) - 1: rng.choice(4, size=ncol, p=model.background / model.background.sum())}
+    for inode in range(len(model.nodes) - 1, -1, -1):
+        for child in model.nodes[inode][0]:
+            cum = np.cumsum(np.clip(model.get_transition_matrix(model.nodes[child][1]), 0, None), axis=1)
+            cum = cum / cum[:, -1:]
+            states[child] = (rng.random(ncol)[:, None] > cum[states[inode]]).sum(axis=1)
+    return {
+        label: "".join("ACGT"[s] for s in states[inode])
+        for inode, (_, _, label) in enumerate(model.nodes)
+        if label is not None
+    }
+
+
+@pytest.mark.unit()
+def test_sph(path_root_test, path_bin, mod):
+    seqs = mirmap.utils.load_fasta(path_root_test.joinpath("data", "NM_024573_ts1.fa"))
+    result = mod.calc_sph(seqs)
+    assert 11.405541 == pytest.approx(result.prior_mean)
+    assert 12.268883 == pytest.approx(result.prior_var)
+    assert 10.393967 == pytest.approx(result.post_mean)
+    assert 0.6942743 == pytest.approx(result.pval_acc)
+    assert result.pval_con == pytest.approx(
+        mirmap.if_exe_phast.phylop(
+            method="SPH",
+            mode="CONACC",
+            mod_fname=path_root_test.joinpath("data", "NM_024573.mod"),
+            aln_fname=path_root_test.joinpath("data", "NM_024573_ts1.fa"),
+            path_exe=path_bin.joinpath("phyloP"),
+        ),
+        rel=1e-6,
+    )
+
+
+@pytest.mark.unit()
+def test_sph_acc_tail(mod):
+    # Random (accelerated) alignment with a p-value of acceleration far below the precision of 1 - CDF
+    rng = np.random.default_rng(0)
+    species = ["hg19", "panTro2", "ponAbe2", "rn4", "mm9", "canFam2", "bosTau4", "equCab2"]
+    seqs = {name: "".join(rng.choice(list("ACGT"), 20)) for name in species}
+    result = mod.calc_sph(seqs)
+    prior = mod.prune(species).get_prior_subst_distrib(20)
+    assert 0.0 < result.pval_acc < 1e-20
+    assert result.pval_acc == pytest.approx(math.fsum(prior[int(result.post_mean) :]), rel=1e-9)
+
+
+@pytest.mark.unit()
+def test_fit_tree_model(tmp_path, path_bin, mod, sim_aln):
+    fname_aln = tmp_path.joinpath("aln.fa")
+    fname_aln.write_text("".join(f">{name}\n{seq}\n" for name, seq in sim_aln.items()))
+    tree = "(((hg19,panTro2),ponAbe2),(((rn4,dipOrd1),speTri1),oryCun2),(vicPac1,canFam2));"
+    phast_model = mirmap.phylo.TreeModel.from_mod(
+        mirmap.if_exe_phast.phylofit(
+            subst_model="REV", aln_fname=fname_aln, tree=tree, use_em=True, path_exe=path_bin.joinpath("phyloFit")
+        )["mod_raw"]
+    )
+    # Likelihood of phyloFit model
+    assert phast_model.training_lnl == pytest.approx(phast_model.get_log_likelihood(sim_aln), abs=1e-3)
+    # Fit
+    model = mirmap.phylo.fit_tree_model(tree, sim_aln)
+    assert model.training_lnl >= phast_model.training_lnl - 1e-3
+    assert model.get_tree_length() == pytest.approx(phast_model.get_tree_length(), abs=1e-3)
+    assert model.rate_matrix == pytest.approx(phast_model.rate_matrix, abs=1e-3)
+    # Model format
+    assert mirmap.phylo.TreeModel.from_mod(model.to_mod()).tree == model.tree
@@ -0,0 +1,85 @@
+import math
+
+import numpy as np
+import pytest
+
+import mirmap.prob
+import mirmap.prob_binomial
+import mirmap.target
+import mirmap.utils
+
+
+@pytest.mark.unit()
+def test_markov_background():
+    background = mirmap.prob.MarkovBackground("AACGTNAAC", ["A", "C", "G", "T"], 1)
+    # AA, AC, CG, GT counted twice, once and once (k-mers with N skipped)
+    assert background.counts.tolist() == [2, 2, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0]
+    assert background.transitions.tolist() == [[0.5, 0.5, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1], [0, 0, 0, 0]]
+    assert background.transitions_flat.flags["C_CONTIGUOUS"]
+    assert background.prob_motif("AACG") == 0.25
+    assert mirmap.prob.get_transitions("AACGTNAAC", ["A", "C", "G", "T"], 1) == background.transitions.tolist()
+    # Overlapping occurrences
+    assert background.count_motif("AA") == 2 and background.count_motif("AAC") == 2
+    assert background.count_motifs(["AC", "GT", "TN", "TA"]).tolist() == [2, 1, 0, 0]
+    assert mirmap.prob.MarkovBackground("AAAA", ["A"], 1).count_motif("AA") == 3
+    assert background.prob_motifs(["AACG", "ACGT", "CGTA"]).tolist() == [0.25, 0.5, 0.0]
+    # Higher order
+    background = mirmap.prob.MarkovBackground("ACGTACGTT", ["A", "C", "G", "T"], 2)
+    assert background.transitions.shape == (16, 4)
+    assert np.allclose(
+        background.transitions.sum(axis=1), [int(row.sum() > 0) for row in background.counts.reshape(16, 4)]
+    )
+
+
+@pytest.mark.unit()
+def test_prob_binomial(path_root_test):
+    mirna_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "hsa-miR-3124-5p.fa"))["hsa-miR-3124-5p"]
+    transcript_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "ENST00000597389.fa"))["ENST00000597389"]
+    targets = mirmap.target.find_targets_with_seed(transcript_seq, mirna_seq.upper().replace("U", "T"))
+    cache = mirmap.utils.LRUCache(4)
+    background = mirmap.prob.get_background(transcript_seq, cache=cache)
+    assert background is mirmap.prob.get_background(transcript_seq, cache=cache)
+    assert [mirmap.prob_binomial.calc_prob_binomial(target, background=background) for target in targets] == (
+        pytest.approx([0.6587461079999377, 0.4497736575307425, 0.6587461079999377, 0.6587461079999377], rel=1e-12)
+    )
+    assert mirmap.prob_binomial.calc_prob_binomial(
+        targets[1], alphabet=background.alphabet, transitions=background.transitions.tolist()
+    ) == pytest.approx(0.4497736575307425, rel=1e-12)
+
+
+@pytest.mark.unit()
+def test_binomial_sf():
+    def log_pmf(k, n, p):
+        return (
+            math.lgamma(n + 1)
+            - math.lgamma(k + 1)
+            - math.lgamma(n - k + 1)
+            + k * math.log(p)
+            + (n - k) * math.log1p(-p)
+        )
+
+    grid = [(x, n, p) for x in (0, 1, 3, 8, 40) for n in (50, 1000) for p in (1e-6, 1e-3, 0.1, 0.6)]
+    expected = [math.fsum(math.exp(log_pmf(k, n, p)) for k in range(x + 1, n + 1)) for x, n, p in grid]
+    assert [mirmap.prob_binomial.binomial_sf(*args) for args in grid] == pytest.approx(expected, rel=1e-10)
+    assert mirmap.prob_binomial.binomial_sf_array(*zip(*grid, strict=True)).tolist() == pytest.approx(
+        expected, rel=1e-10
+    )
+    # Agreement with CDF where 1 - CDF is accurate
+    assert mirmap.prob_binomial.binomial_sf(2, 3000, 1e-3) == pytest.approx(
+        1.0 - mirmap.prob_binomial.binomial_cdf(2, 3000, 1e-3), rel=1e-12
+    )
+    # Bounds
+    assert mirmap.prob_binomial.binomial_sf_array([-1, 5, 2, 2], 5, [0.3, 0.3, 0.0, 1.0]).tolist() == [1, 0, 0, 1]
+
+
+@pytest.mark.unit()
+def test_prob_binomial_batch(path_root_test):
+    transcript_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "NM_024573.fa"))["NM_024573"]
+    mirna_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "hsa-miR-30a-3p.fa"))["hsa-miR-30a-3p"]
+    targets = mirmap.target.find_targets_with_seed(
+        transcript_seq, mirna_seq.upper().replace("U", "T"), seed_lengths=[5, 6, 7]
+    )
+    assert len({len(target.seed) for target in targets}) > 1
+    assert mirmap.prob_binomial.calc_prob_binomial_batch(targets).tolist() == pytest.approx(
+        [mirmap.prob_binomial.calc_prob_binomial(target) for target in targets], rel=1e-12
+    )
@@ -0,0 +1,111 @@
+import asyncio
+import concurrent.futures
+import gc
+import platform
+import random
+
+import pytest
+
+import mirmap.evolution
+import mirmap.model
+import mirmap.scores
+import mirmap.target
+import mirmap.utils
+
+
+@pytest.mark.unit()
+def test_features_closure():
+    assert {"dg_total", "dg_duplex", "dg_open"} == mirmap.scores.get_features_closure(["dg_total"])
+    assert {"mirmap_score", "tgs_au", "tgs_position", "tgs_pairing3p", "prob_binomial", "cons_bls"} == (
+        mirmap.scores.get_features_closure(["mirmap_score"], mirmap.model.python_only_mirmap_models)
+    )
+    assert set(mirmap.scores.score_agg_funcs) == mirmap.scores.get_features_closure(
+        ["mirmap_score", "tgs_score", "dg_total"]
+    )
+    with pytest.raises(ValueError):
+        mirmap.scores.get_features_closure(["unknown"])
+
+
+@pytest.mark.unit()
+def test_calc_scores_python_only(path_root_test):
+    mirna_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "hsa-miR-3124-5p.fa"))["hsa-miR-3124-5p"]
+    transcript_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "ENST00000597389.fa"))["ENST00000597389"]
+    targets = mirmap.target.find_targets_with_seed(transcript_seq, mirna_seq.upper().replace("U", "T"))
+    for target in targets:
+        scores = mirmap.scores.calc_scores(
+            target, features=["mirmap_score"], models=mirmap.model.python_only_mirmap_models
+        )
+        assert {"mirmap_score", "tgs_au", "tgs_position", "tgs_pairing3p", "prob_binomial", "cons_bls"} == set(scores)
+        assert (
+            mirmap.model.python_only_mirmap_models[target.seed_length].apply_on_target(scores) == scores["mirmap_score"]
+        )
+
+
+@pytest.mark.unit()
+def test_calc_scores_async(path_root_test, tmp_path):
+    path_bin = path_root_test.joinpath("..", "bin", f"{platform.system().lower()}_{platform.machine()}")
+    mirna_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "hsa-miR-3124-5p.fa"))["hsa-miR-3124-5p"]
+    transcript_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "ENST00000597389.fa"))["ENST00000597389"]
+    targets = mirmap.target.find_targets_with_seed(transcript_seq, mirna_seq.upper().replace("U", "T"))
+    # Alignment with substitutions
+    rng = random.Random(0)
+    species = ["hg19", "panTro2", "ponAbe2", "rheMac2", "mm9", "rn4", "canFam2"]
+    fname_aln = tmp_path.joinpath("aln.fa")
+    fname_aln.write_text(
+        "".join(
+            f">{name}\n"
+            + "".join(nt if i == 0 or rng.random() < 0.85 else rng.choice("ACGT") for nt in transcript_seq)
+            + "\n"
+            for i, name in enumerate(species)
+        )
+    )
+    kwargs = {
+        "path_aln": fname_aln,
+        "path_mod": path_root_test.joinpath("data", "NM_024573.mod"),
+        "tree": "((((hg19,panTro2),ponAbe2),rheMac2),(mm9,rn4),canFam2);",
+        "path_phylofit": path_bin.joinpath("phyloFit"),
+        "path_phylop": path_bin.joinpath("phyloP"),
+        "features": ["tgs_score", "dg_duplex", "prob_binomial", "cons_bls", "selec_phylop"],
+    }
+
+    async def score_all():
+        semaphore = asyncio.Semaphore(2)
+        return await asyncio.gather(
+            *[
+                mirmap.scores.calc_scores_async(
+                    target, phylofit_cache=phylofit_cache, semaphore=semaphore, executor=executor, **kwargs
+                )
+                for target in targets
+            ]
+        )
+
+    phylofit_cache = mirmap.evolution.PhyloFitCache()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        targets_scores = asyncio.run(score_all())
+    # One fitting shared by all targets
+    assert len(phylofit_cache.memory) == 1 and len(phylofit_cache._pending) == 0
+    for target, scores in zip(targets, targets_scores, strict=True):
+        assert scores == pytest.approx(
+            mirmap.scores.calc_scores(target, phylofit_cache=phylofit_cache, **kwargs), rel=1e-3
+        )
+
+
+@pytest.mark.unit()
+def test_calc_scores_async_errors(path_root_test, tmp_path, targets):
+    async def score():
+        loop = asyncio.get_running_loop()
+        loop.set_exception_handler(lambda loop, context: unhandled.append(context))
+        # Errors of both the in-process and the PHAST features
+        await mirmap.scores.calc_scores_async(
+            targets[0],
+            path_aln=tmp_path.joinpath("missing.fa"),
+            path_mod=path_root_test.joinpath("data", "NM_024573.mod"),
+            dg_open_method="unknown",
+            features=["dg_open", "selec_phylop"],
+        )
+
+    unhandled = []
+    with pytest.raises((ValueError, FileNotFoundError)):
+        asyncio.run(score())
+    gc.collect()
+    assert unhandled == []
@@ -0,0 +1,49 @@
+import pytest
+
+import mirmap.seed_index
+import mirmap.target
+import mirmap.utils
+
+
+@pytest.mark.unit()
+def test_seed_index(path_root_test, tmp_path):
+    transcripts = {}
+    for fname_transcript in ("NM_024573.fa", "ENST00000597389.fa", "ENST00000355526.fa"):
+        transcripts |= mirmap.utils.load_fasta(path_root_test.joinpath("data", fname_transcript))
+    mirnas = {}
+    for fname_mirna in ("hsa-miR-30a-3p.fa", "hsa-miR-3124-5p.fa"):
+        mirnas |= mirmap.utils.load_fasta(path_root_test.joinpath("data", fname_mirna))
+
+    index_fname = tmp_path.joinpath("transcripts.idx")
+    mirmap.seed_index.build_seed_index(index_fname, transcripts)
+    with mirmap.seed_index.SeedIndex(index_fname) as index:
+        assert list(transcripts.keys()) == index.transcript_ids
+        for transcript_id, transcript_seq in transcripts.items():
+            assert transcript_seq == index.get_seq(transcript_id)
+        for mirna_seq in mirnas.values():
+            mirna_seq = mirna_seq.upper().replace("U", "T")
+            targets = index.find_targets_with_seed(mirna_seq)
+            for transcript_id, transcript_seq in transcripts.items():
+                expected_targets = mirmap.target.find_targets_with_seed(transcript_seq, mirna_seq)
+                assert len(expected_targets) == len(targets.get(transcript_id, []))
+                for expected_target, target in zip(expected_targets, targets.get(transcript_id, []), strict=True):
+                    for att in ("mirna", "mirna_seq", "seed", "seed_length", "seed_seq", "seed_start_on_mirna"):
+                        assert getattr(expected_target, att) == getattr(target, att)
+                    assert expected_target.host_seq == target.host_seq
+
+
+@pytest.mark.unit()
+def test_seed_index_unknown_nucleotide(tmp_path):
+    transcripts = {"t1": "ACGTNACGTTTTACGT" * 3, "t2": "GGGGTTNCAGGGGGGGGGGGGGGG", "t3": "ACGTACGTACGT"}
+    index_fname = tmp_path.joinpath("transcripts.idx")
+    mirmap.seed_index.build_seed_index(index_fname, transcripts)
+    with mirmap.seed_index.SeedIndex(index_fname) as index:
+        for mirna_seq in ("TAAAACGTNACAAAAA", "TCTGNAACCAAAAAAA", "TANGTAAAATCAA"):
+            targets = index.find_targets_with_seed(mirna_seq)
+            for transcript_id, transcript_seq in transcripts.items():
+                expected_targets = mirmap.target.find_targets_with_seed(transcript_seq, mirna_seq)
+                assert [(t.seed, t.seed_seq) for t in expected_targets] == [
+                    (t.seed, t.seed_seq) for t in targets.get(transcript_id, [])
+                ]
+        # Seeds with N matching host sequences
+        assert len(index.find_targets_with_seed("TAAAACGTNACAAAAA")) > 0
@@ -95,3 +95,24 @@ def test_target(path_root_test, fname_mirna, fname_transcript, expected_targets)
     for itarget, target in enumerate(targets):
         for att in ("mirna", "mirna_length", "mirna_seq", "seed", "seed_length", "seed_seq", "seed_start_on_mirna"):
             assert getattr(expected_targets[itarget], att) == getattr(target, att)
+
+
+@pytest.mark.unit()
+def test_targets_with_seeds(path_root_test):
+    mirnas = {}
+    for fname_mirna in ("hsa-miR-30a-3p.fa", "hsa-miR-3124-5p.fa"):
+        mirnas |= {
+            k: v.upper().replace("U", "T")
+            for k, v in mirmap.utils.load_fasta(path_root_test.joinpath("data", fname_mirna)).items()
+        }
+    # Add miRNAs sharing seeds
+    mirnas["shared-seed"] = mirnas["hsa-miR-3124-5p"][:10] + "A" * 12
+    for fname_transcript in ("NM_024573.fa", "ENST00000597389.fa", "ENST00000355526.fa"):
+        for host_seq in mirmap.utils.load_fasta(path_root_test.joinpath("data", fname_transcript)).values():
+            targets = mirmap.target.find_targets_with_seeds(host_seq, mirnas)
+            for mirna_id, mirna_seq in mirnas.items():
+                expected_targets = mirmap.target.find_targets_with_seed(host_seq, mirna_seq)
+                assert len(expected_targets) == len(targets[mirna_id])
+                for expected_target, target in zip(expected_targets, targets[mirna_id], strict=True):
+                    for att in ("mirna", "mirna_seq", "seed", "seed_length", "seed_seq", "seed_start_on_mirna"):
+                        assert getattr(expected_target, att) == getattr(target, att)
@@ -0,0 +1,45 @@
+import random
+
+import pytest
+
+import mirmap.target
+import mirmap.targetscan
+import mirmap.utils
+
+
+@pytest.mark.unit()
+@pytest.mark.parametrize("with_correction", [False, True])
+def test_calc_tgs_au_batch(path_root_test, with_correction):
+    transcript_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "ENST00000355526.fa"))["ENST00000355526"]
+    complement = str.maketrans("ACGT", "TGCA")
+    # Full transcript and windows truncated at transcript ends
+    for host_seq in [transcript_seq, transcript_seq[:40], transcript_seq[-45:]]:
+        targets = []
+        for start in range(0, len(host_seq) - 22, 9):
+            # miRNA complementary to host sequence
+            mirna_seq = host_seq[start : start + 22].translate(complement)[::-1]
+            targets.extend(mirmap.target.find_targets_with_seed(host_seq, mirna_seq, seed_lengths=[6, 7]))
+        assert len(targets) > 0
+        scores = mirmap.targetscan.calc_tgs_au_batch(targets, with_correction=with_correction)
+        assert scores == [mirmap.targetscan.calc_tgs_au(target, with_correction=with_correction) for target in targets]
+
+
+@pytest.mark.unit()
+def test_align_offsets():
+    rng = random.Random(0)
+    for _ in range(300):
+        utr_3p_seq = "".join(rng.choice("ACGTN") for _ in range(rng.randint(0, 15)))
+        mir_3p_seq = "".join(rng.choice("ACGT") for _ in range(rng.randint(1, 16)))
+        overhang = rng.randint(0, 2)
+        expected = max(
+            mirmap.targetscan._align(utr_3p_seq, mir_3p_seq, offset, 0, overhang)
+            for offset in range(max(len(utr_3p_seq), len(mir_3p_seq)))
+        )
+        expected = max(
+            expected,
+            max(
+                mirmap.targetscan._align(utr_3p_seq, mir_3p_seq, 0, offset, overhang)
+                for offset in range(max(len(utr_3p_seq), len(mir_3p_seq)))
+            ),
+        )
+        assert float(expected) == mirmap.targetscan._align_offsets(utr_3p_seq, mir_3p_seq, overhang)
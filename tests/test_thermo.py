@@ -0,0 +1,55 @@
+import pytest
+
+import mirmap.if_lib_viennarna
+import mirmap.target
+import mirmap.thermo
+import mirmap.utils
+
+
+@pytest.fixture()
+def targets(path_root_test):
+    mirna_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "hsa-miR-3124-5p.fa"))["hsa-miR-3124-5p"]
+    transcript_seq = mirmap.utils.load_fasta(path_root_test.joinpath("data", "ENST00000597389.fa"))["ENST00000597389"]
+    return mirmap.target.find_targets_with_seed(transcript_seq, mirna_seq.upper().replace("U", "T"))
+
+
+@pytest.mark.unit()
+def test_dg_open_cache(targets):
+    cache = mirmap.thermo.DgOpenCache(maxsize=2)
+    for target in targets:
+        expected = mirmap.thermo.calc_dg_open(target)
+        assert expected == mirmap.thermo.calc_dg_open(target, cache=cache)
+        assert expected == mirmap.thermo.calc_dg_open(target, cache=cache)
+    info = cache.info()
+    assert info["dg_open"]["hits"] == len(targets)
+    assert info["dg_open"]["misses"] == len(targets)
+    assert info["dg_open"]["size"] == 2
+
+
+@pytest.mark.unit()
+def test_accessibility():
+    seq = "AUCGAUGCGAUCGAGGGGCGCCCUUAAAGCUCUGAGGCGGCCCCCCAUAGCAUCGAUCGGCUAGCUAGCGCGAUAUAGC"
+    md = mirmap.thermo._get_default_md()
+    accessibility = mirmap.thermo.Accessibility(seq, max_unpaired_length=30, window_size=len(seq), md=md)
+    # Whole sequence fits in the folding window: identical to global folding with constraint
+    dg0 = mirmap.if_lib_viennarna.RNAfold([seq], partfunc=True, md=md).efe
+    for start, end in ((0, 10), (20, 50), (60, len(seq))):
+        constraint = "." * start + "x" * (end - start) + "." * (len(seq) - end)
+        dg1 = mirmap.if_lib_viennarna.RNAfold([seq], constraint=constraint, partfunc=True, md=md).efe
+        assert dg1 - dg0 == pytest.approx(accessibility.get_dg_open(start, end), abs=1e-3)
+
+
+@pytest.mark.unit()
+def test_seed_duplex_table(targets, tmp_path):
+    md = mirmap.thermo._get_default_md()
+    table = mirmap.thermo.SeedDuplexTable(md=md)
+    for target in targets:
+        expected = mirmap.thermo.calc_dg_duplex_seed(target, md=md)
+        assert expected == table.get(target.seed_seq)
+        assert expected == mirmap.thermo.calc_dg_duplex_seed(target, md=md, table=table)
+    table.save(tmp_path.joinpath("seed_duplex.bin"))
+    table = mirmap.thermo.SeedDuplexTable.load(tmp_path.joinpath("seed_duplex.bin"))
+    assert mirmap.if_lib_viennarna.get_model_details_key(md) == table.md_key
+    for target in targets:
+        assert mirmap.thermo.calc_dg_duplex_seed(target, md=md) == table.get(target.seed_seq)
+    assert table.modified is False
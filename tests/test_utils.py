@@ -0,0 +1,52 @@
+import gzip
+
+import pytest
+
+import mirmap.utils
+
+
+@pytest.mark.unit()
+@pytest.mark.parametrize("compressed", [False, True])
+def test_iter_fasta(tmp_path, compressed):
+    content = ">seq1 desc\nACGT\nacgt\n\n>seq2\n>seq3\nAC\nGT\n"
+    if compressed:
+        fname = tmp_path.joinpath("seqs.fa.gz")
+        with gzip.open(fname, "wt") as f:
+            f.write(content)
+    else:
+        fname = tmp_path.joinpath("seqs.fa")
+        fname.write_text(content)
+    expected = [("seq1 desc", "ACGTacgt"), ("seq2", ""), ("seq3", "ACGT")]
+    assert expected == list(mirmap.utils.iter_fasta(fname))
+    assert expected == list(mirmap.utils.iter_fasta(content, as_string=True))
+    assert {"seq1 desc": "ACGTACGT", "seq2": "", "seq3": "ACGT"} == mirmap.utils.load_fasta(fname, upper=True)
+
+
+@pytest.mark.unit()
+def test_iter_tab(tmp_path):
+    fname = tmp_path.joinpath("seqs.tsv.gz")
+    with gzip.open(fname, "wt") as f:
+        f.write("seq1\tACGT\nseq2\tGGCC \n")
+    assert [("seq1", "ACGT"), ("seq2", "GGCC")] == list(mirmap.utils.iter_tab(fname))
+
+
+@pytest.mark.unit()
+def test_indexed_fasta(tmp_path):
+    seqs = {"seq1 desc": "ACGTACGTAC" * 7 + "A", "seq2": "", "seq3": "TTGCA" * 3}
+    fname = tmp_path.joinpath("seqs.fa")
+    with open(fname, "wt") as f:
+        for name, seq in seqs.items():
+            f.write(f">{name}\n" + "".join(seq[i : i + 20] + "\n" for i in range(0, len(seq), 20)))
+    assert mirmap.utils.load_fasta(fname) == seqs
+    for fname_index in (None, tmp_path.joinpath("seqs.fa.fai"), tmp_path.joinpath("seqs.fa.fai")):
+        with mirmap.utils.IndexedFasta(fname, fname_index) as fasta:
+            assert ["seq1", "seq2", "seq3"] == list(fasta.keys())
+            for name, seq in seqs.items():
+                name = name.split()[0]
+                assert seq == fasta[name]
+                for start, end in ((0, 1), (5, 25), (19, 21), (39, 71), (60, 100)):
+                    assert seq[start:end] == fasta.fetch(name, start, end)
+        # Index only written if requested
+        assert tmp_path.joinpath("seqs.fa.fai").exists() == (fname_index is not None)
+    # Index identical to samtools faidx
+    assert tmp_path.joinpath("seqs.fa.fai").read_text().startswith("seq1\t71\t11\t20\t21\n")